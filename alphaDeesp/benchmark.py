@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+"""Stage level benchmarks of the expert system, on the bundled grids and on synthetic grids of any size.
+
+Each stage of the analysis is timed separately: observation loading, simulation setup, create_df, overflow and
+powerflow graphs, the stages of AlphaDeesp (constrained path, hubs, loops, min cut, loop buses ranking, routing buses,
+combination enumeration, topology scoring), candidate simulation and result scoring. Results are written as JSON, so
+that a run can be compared with the one of a previous commit:
+
+    python -m alphaDeesp.benchmark --grids l2rpn_2019 --synthetic 100 1000 --repeat 3 -o benchmark.json
+    python -m alphaDeesp.benchmark --synthetic 1000 --compare benchmark.json
+
+Bundled grids are simulated with the DC simulation by default (no Grid2op needed), or with Grid2op.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import platform
+import contextlib
+import subprocess
+import configparser
+from datetime import datetime
+
+DEFAULT_CONFIG_FILE = "./alphaDeesp/config.ini"
+
+BUNDLED_GRIDS = {
+    "l2rpn_2019": "./alphaDeesp/ressources/parameters/l2rpn_2019",
+    "rte_case14_realistic": "./alphaDeesp/ressources/parameters/rte_case14_realistic",
+    "l2rpn_wcci_2020": "./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_wcci_2020",
+}
+
+STAGES = ["observation loading", "simulation setup", "create_df", "overflow graph", "powerflow graphs",
+          "alphadeesp", "constrained path", "hubs", "loops", "min cut", "loop buses ranking", "routing buses",
+          "combination enumeration", "topology scoring", "candidate simulation", "result scoring"]
+
+
+def load_bundled_case(grid_path, simulator="DC", chronic_scenario=None, timestep=0):
+    """Returns (obs, make_simulation), make_simulation(ltc, param_options) building the Simulation of obs"""
+    if simulator == "DC":
+        from alphaDeesp.core.dc.DCObservationLoader import DCObservationLoader
+        from alphaDeesp.core.dc.DCSimulation import DCSimulation
+
+        obs = DCObservationLoader(grid_path).get_observation(chronic_scenario=chronic_scenario, timestep=timestep)
+        return obs, lambda ltc, param_options: DCSimulation(obs, param_options=param_options, ltc=ltc)
+    elif simulator == "Grid2OP":
+        from alphaDeesp.core.grid2op.Grid2opObservationLoader import Grid2opObservationLoader
+        from alphaDeesp.core.grid2op.Grid2opSimulation import Grid2opSimulation
+
+        env, obs, action_space = Grid2opObservationLoader(grid_path).get_observation(
+            chronic_scenario=chronic_scenario, timestep=timestep)
+        return obs, lambda ltc, param_options: Grid2opSimulation(obs, action_space, env.observation_space,
+                                                                 param_options=param_options, ltc=ltc)
+    raise ValueError("Benchmarks are available for DC and Grid2OP simulators")
+
+
+def load_synthetic_case(n_sub, seed=0):
+    """Returns (obs, make_simulation, ltc) for a synthetic grid of n_sub substations"""
+    from alphaDeesp.core.dc.SyntheticGrid import generate_synthetic_observation
+    from alphaDeesp.core.dc.DCSimulation import DCSimulation
+
+    obs, ltc = generate_synthetic_observation(n_sub, seed=seed)
+    return obs, lambda ltc, param_options: DCSimulation(obs, param_options=param_options, ltc=ltc), ltc
+
+
+def get_lines_to_cut(obs):
+    """Overloaded lines of obs, or its most loaded line if there is no overload"""
+    import numpy as np
+
+    overloads = [int(l) for l in np.flatnonzero(obs.rho > 1)]
+    return overloads or [int(np.argmax(obs.rho))]
+
+
+def run_case(load_case, param_options, ltc=None, trace_memory=False):
+    """Runs the analysis of one grid state stage by stage. load_case returns (obs, make_simulation) or
+    (obs, make_simulation, ltc). Returns (Profiler report of the stages, description of the case). With trace_memory,
+    stages also get their peak and retained memory, and the report the largest structures of the analysis"""
+    from alphaDeesp.core.alphadeesp import AlphaDeesp
+    from alphaDeesp.core.profiler import Profiler
+
+    profiler = Profiler(trace_memory=trace_memory)
+    with profiler.stage("observation loading"):
+        case = load_case()
+    obs, make_simulation = case[:2]
+    if ltc is None:
+        ltc = list(case[2]) if len(case) > 2 else get_lines_to_cut(obs)
+
+    with profiler.stage("simulation setup"):
+        sim = make_simulation(ltc, param_options)
+
+    # already run by the simulation setup, run again to time it alone
+    with profiler.stage("create_df"):
+        df = sim.create_df(sim.topo, ltc)
+
+    with profiler.stage("overflow graph"):
+        g_over = sim.build_graph_from_data_frame(ltc)
+
+    with profiler.stage("powerflow graphs"):
+        sim.build_powerflow_graph_beforecut()
+        sim.build_powerflow_graph_aftercut()
+
+    with profiler.stage("alphadeesp"):
+        simulator_data = {"substations_elements": sim.get_substation_elements(),
+                          "substation_to_node_mapping": sim.get_substation_to_node_mapping(),
+                          "internal_to_external_mapping": sim.get_internal_to_external_mapping()}
+        alphadeesp = AlphaDeesp(g_over, df, simulator_data=simulator_data,
+                                substation_in_cooldown=sim.substation_in_cooldown)
+        ranked_combinations = alphadeesp.get_ranked_combinations()
+    for stage, duration in alphadeesp.timings.items():
+        profiler.record(stage, duration)
+
+    changes = []
+    for score_topo, node, topology in sim.get_candidates_to_simulate(ranked_combinations):
+        action, applied_topology = sim.get_candidate_action(node, topology)
+        changes.append((action, (node, topology, applied_topology, score_topo)))
+
+    with profiler.stage("candidate simulation"):
+        results = sim.simulate_batch([action for action, change in changes])
+
+    with profiler.stage("result scoring"):
+        sim.score_simulations(results, [change for action, change in changes])
+
+    profiler.record_structures({"sim": sim, "alphadeesp": alphadeesp})
+    profiler.stop()
+    alphadeesp.close()
+    sim.close()
+
+    description = {"n_sub": int(obs.n_sub), "n_line": int(obs.n_line), "n_gen": int(obs.n_gen),
+                   "n_load": int(obs.n_load), "ltc": [int(l) for l in ltc], "n_candidates": len(changes)}
+    return profiler.report(), description
+
+
+def benchmark_case(name, load_case, param_options, ltc=None, repeat=1, verbose=False, trace_memory=False):
+    """Runs a case repeat times and returns its JSON result: the case description and, for each stage, the
+    durations of all runs with their minimum and median. With trace_memory, stages also get their largest peak and
+    retained memory over the runs, in bytes, and the case the largest structures of its last run. Durations are then
+    longer, as every allocation is traced. Prints of the analysis are silenced unless verbose"""
+    import numpy as np
+
+    reports = []
+    description = None
+    for i in range(repeat):
+        with open(os.devnull, "w") as devnull, contextlib.ExitStack() as stack:
+            if not verbose:
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+            report, description = run_case(load_case, param_options, ltc=ltc, trace_memory=trace_memory)
+        reports.append(report)
+
+    stages = {}
+    for stage in STAGES + [stage for stage in reports[0]["stages"] if stage not in STAGES]:
+        runs = [report["stages"][stage] for report in reports if stage in report["stages"]]
+        if not runs:
+            continue
+        durations = [run["wall_time"] for run in runs]
+        stages[stage] = {"min": float(np.min(durations)), "median": float(np.median(durations)),
+                         "runs": [float(d) for d in durations]}
+        for memory in ["peak_memory", "retained_memory"]:
+            if runs[0][memory] is not None:
+                stages[stage][memory] = int(max(run[memory] for run in runs))
+    print("{}: {} substations, {} lines".format(name, description["n_sub"], description["n_line"]))
+    for stage, result in stages.items():
+        if "peak_memory" in result:
+            print("    {}: {:.4f}s, peak {:.1f} MB, retained {:.1f} MB".format(
+                stage, result["median"], result["peak_memory"] / 1e6, result["retained_memory"] / 1e6))
+        else:
+            print("    {}: {:.4f}s".format(stage, result["median"]))
+    case = dict(name=name, **description, stages=stages)
+    if trace_memory:
+        case["structures"] = reports[-1]["structures"]
+        print("    largest structures: " + ", ".join("{} {:.1f} MB".format(structure["name"], structure["size"] / 1e6)
+                                                   for structure in case["structures"][:5]))
+    return case
+
+
+def run_benchmarks(param_options, grids=(), synthetic_sizes=(), simulator="DC", chronic_scenario=None, timestep=0,
+                   ltc=None, repeat=1, seed=0, verbose=False, trace_memory=False):
+    """Benchmarks the bundled grids (names of BUNDLED_GRIDS or grid folders) and synthetic grids of the given numbers
+    of substations. Returns the JSON results of the run"""
+    cases = []
+    for grid in grids:
+        grid_path = BUNDLED_GRIDS.get(grid, grid)
+        cases.append(benchmark_case(
+            grid, lambda: load_bundled_case(grid_path, simulator, chronic_scenario, timestep), param_options,
+            ltc=ltc, repeat=repeat, verbose=verbose, trace_memory=trace_memory))
+    for n_sub in synthetic_sizes:
+        cases.append(benchmark_case(
+            "synthetic_{}".format(n_sub), lambda: load_synthetic_case(n_sub, seed=seed), param_options,
+            repeat=repeat, verbose=verbose, trace_memory=trace_memory))
+    return {"date": datetime.now().isoformat(timespec="seconds"),
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "simulator": simulator,
+            "repeat": repeat,
+            "trace_memory": trace_memory,
+            "cases": cases}
+
+
+def get_commit():
+    """Current git commit, None outside of a git repository"""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(previous, current, threshold=1.2, min_duration=1e-3):
+    """Stages slower by more than threshold (ratio of medians) in current than in previous, for the cases of both
+    runs. Stages faster than min_duration seconds in both are ignored, as too noisy.
+    Returns a list of (case name, stage, previous median, current median)"""
+    previous_cases = {case["name"]: case for case in previous["cases"]}
+    regressions = []
+    for case in current["cases"]:
+        previous_case = previous_cases.get(case["name"])
+        if previous_case is None:
+            continue
+        for stage, result in case["stages"].items():
+            if stage not in previous_case["stages"]:
+                continue
+            before, after = previous_case["stages"][stage]["median"], result["median"]
+            if max(before, after) >= min_duration and after > threshold * before:
+                regressions.append((case["name"], stage, before, after))
+    return regressions
+
+
+def compare_memory(previous, current, threshold=1.2, min_memory=1e6):
+    """Stages whose peak memory grew by more than threshold in current compared to previous, for the cases of both
+    runs measured with trace_memory. Peaks below min_memory bytes in both are ignored.
+    Returns a list of (case name, stage, previous peak, current peak)"""
+    previous_cases = {case["name"]: case for case in previous["cases"]}
+    regressions = []
+    for case in current["cases"]:
+        previous_case = previous_cases.get(case["name"])
+        if previous_case is None:
+            continue
+        for stage, result in case["stages"].items():
+            before = previous_case["stages"].get(stage, {}).get("peak_memory")
+            after = result.get("peak_memory")
+            if before is None or after is None:
+                continue
+            if max(before, after) >= min_memory and after > threshold * before:
+                regressions.append((case["name"], stage, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expert System stage level benchmarks")
+    parser.add_argument("-g", "--grids", nargs="*", default=list(BUNDLED_GRIDS),
+                        help="Bundled grids ({}) or grid folders to benchmark. Default is all bundled grids"
+                        .format(", ".join(BUNDLED_GRIDS)))
+    parser.add_argument("-n", "--synthetic", nargs="*", type=int, default=[],
+                        help="Numbers of substations of synthetic grids to benchmark, e.g. 100 1000 10000")
+    parser.add_argument("--simulator", choices=["DC", "Grid2OP"], default="DC",
+                        help="Simulator of the bundled grids. Default is DC, which does not need Grid2op")
+    parser.add_argument("-l", "--ltc", nargs="+", type=int, default=None,
+                        help="Lines to cut on bundled grids. Default is the overloaded lines, or the most loaded one")
+    parser.add_argument("-c", "--chronicscenario", default=None, help="Chronic scenario of the bundled grids")
+    parser.add_argument("-t", "--timestep", type=int, default=0, help="Timestep of the bundled grids")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs per case. Default is 3")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic grids")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE, help="Path to config.ini")
+    parser.add_argument("-o", "--output", default=None, help="JSON file to write the results to")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown ratio reported as a regression by --compare. Default is 1.2")
+    parser.add_argument("-m", "--memory", action="store_true",
+                        help="Also measures the peak and retained memory of each stage and the largest structures, "
+                             "with tracemalloc. Durations are then longer")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Keeps the prints and logs of the analysis")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    results = run_benchmarks(config["DEFAULT"], grids=args.grids, synthetic_sizes=args.synthetic,
+                             simulator=args.simulator, chronic_scenario=args.chronicscenario,
+                             timestep=args.timestep, ltc=args.ltc, repeat=args.repeat, seed=args.seed,
+                             verbose=args.verbose, trace_memory=args.memory)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Benchmark results written to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare_results(previous, results, threshold=args.threshold)
+        for name, stage, before, after in regressions:
+            print("REGRESSION {} - {}: {:.4f}s -> {:.4f}s (x{:.2f})".format(name, stage, before, after,
+                                                                          after / before if before else float("inf")))
+        memory_regressions = compare_memory(previous, results, threshold=args.threshold)
+        for name, stage, before, after in memory_regressions:
+            print("MEMORY REGRESSION {} - {}: peak {:.1f} MB -> {:.1f} MB (x{:.2f})".format(
+                name, stage, before / 1e6, after / 1e6, after / before if before else float("inf")))
+        regressions += memory_regressions
+        if regressions:
+            sys.exit(1)
+        print("No regression against {} (commit {})".format(args.compare, previous.get("commit")))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,19 +7,25 @@ import numpy as np
 
 from alphaDeesp.core.constrainedPath import ConstrainedPath
 from alphaDeesp.core.elements import *
+from alphaDeesp.core.records import RetentionBag
 from math import fabs, ceil
 import subprocess
+import logging
+import time
 
 import os
 
+logger = logging.getLogger(__name__)
 
 # os.environ['PATH'] += os.pathsep + r'C:\Users\nmegel\graphviz-2.38\release\bin'
 
 
 class AlphaDeesp:  # AKA SOLVER
-    def __init__(self, _g, df_of_g, printer=None, custom_layout=None, simulator_data=None, substation_in_cooldown=[], debug=False):
-        # used for postprocessing
-        self.bag_of_graphs = {}
+    def __init__(self, _g, df_of_g, printer=None, custom_layout=None, simulator_data=None, substation_in_cooldown=[], debug=False,
+                 graph_retention="all"):
+        # used for postprocessing, graphs with new topologies kept following graph_retention: all, none or a number of
+        # best scored graphs
+        self.bag_of_graphs = RetentionBag(graph_retention)
         self.debug = debug
         self.boolean_dump_data_to_file = False
 
@@ -33,6 +39,9 @@ class AlphaDeesp:  # AKA SOLVER
         self.printer = printer
         self.custom_layout = custom_layout
         self.substation_in_cooldown = substation_in_cooldown  # we cannot play with those substations so no need to compute simulations
+        # duration in seconds of each stage of the analysis, for benchmarks, and numbers of combinations
+        self.timings = {}
+        self.counters = {"combinations enumerated": 0, "combinations scored": 0}
 
         # check that line extemity does not have only load or productions: otherwise there is either node merging to do or nothing else
 
@@ -49,25 +58,39 @@ class AlphaDeesp:  # AKA SOLVER
         self.g_without_gray_and_c_edge = self.delete_color_edges(self.g_without_constrained_edge, "gray")
         self.g_only_red_components = self.delete_color_edges(self.g_without_gray_and_c_edge, "blue")
 
-        e_amont, constrained_edge, e_aval = self.get_constrained_path()
-        self.constrained_path = ConstrainedPath(e_amont, constrained_edge, e_aval)
+        # one constrained path per constrained edge, ie per overloaded line cut in the overflow graph
+        start = time.time()
+        self.constrained_paths = [ConstrainedPath(e_amont, constrained_edge, e_aval)
+                                  for e_amont, constrained_edge, e_aval in self.get_constrained_paths()]
+        self.constrained_path = self.constrained_paths[-1]
+        self.timings["constrained path"] = time.time() - start
         # print("n_amont = ", self.constrained_path.n_amont())
         # print("n_aval = ", self.constrained_path.n_aval())
 
+        start = time.time()
         self.hubs = self.get_hubs()
+        self.timings["hubs"] = time.time() - start
 
         # red_loops is a dataFrame
+        start = time.time()
         self.red_loops = self.get_loops()
+        self.timings["loops"] = time.time() - start
         # print("self.red_loops = ")
         # print(self.red_loops)
 
         # this function takes the dataFrame self.red_loops and adds the min cut_values to it.
+        start = time.time()
         self.rank_red_loops()
+        self.timings["min cut"] = time.time() - start
 
+        start = time.time()
         self.rankedLoopBuses = self.rank_loop_buses(self.g, self.df)
+        self.timings["loop buses ranking"] = time.time() - start
 
         # here we classify nodes into 4 categories
+        start = time.time()
         self.structured_topological_actions = self.identify_routing_buses()  # it is a dict
+        self.timings["routing buses"] = time.time() - start
         # print("#########################################################################")
         # print("structured_top_actions =", self.structured_topological_actions)
         # print("#########################################################################")
@@ -99,6 +122,31 @@ class AlphaDeesp:  # AKA SOLVER
     def get_ranked_combinations(self):
         return self.ranked_combinations
 
+    def close(self):
+        """Releases the graphs and dataframes of the analysis. Ranked combinations already got remain valid"""
+        self.bag_of_graphs.clear()
+        self.g = None
+        self.initial_graph = None
+        self.df = None
+        self.g_without_pos_edges = None
+        self.g_only_blue_components = None
+        self.g_without_constrained_edge = None
+        self.g_without_gray_and_c_edge = None
+        self.g_only_red_components = None
+        self.constrained_paths = []
+        self.constrained_path = None
+        self.red_loops = None
+        self.rankedLoopBuses = None
+        self.simulator_data = None
+        self.data = {}
+        self.ranked_combinations = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def compute_best_topologies(self):
         """
         inputs: selected_ranked_nodes (after having identified routing buses, ie 4 categories)
@@ -112,14 +160,21 @@ class AlphaDeesp:  # AKA SOLVER
                     selected_ranked_nodes.append(elem)
 
         res_container = []
+        self.timings["combination enumeration"] = 0.
+        self.timings["topology scoring"] = 0.
         for node in selected_ranked_nodes:
             if node in self.substation_in_cooldown:
-                print("substation " + str(node) + " is in cooldown and no action can be performed on it for now")
+                logger.info("substation %s is in cooldown and no action can be performed on it for now", node)
                 continue
 
+            start = time.time()
             all_combinations = self.compute_all_combinations(node)
+            self.timings["combination enumeration"] += time.time() - start
+            self.counters["combinations enumerated"] += len(all_combinations)
             if (len(all_combinations) != 0):
+                start = time.time()
                 ranked_combinations = self.rank_topologies(all_combinations, self.g, node)
+                self.timings["topology scoring"] += time.time() - start
                 # print(ranked_combinations)
 
                 # best_topologies = best_topologies.append(ranked_combinations)
@@ -131,6 +186,7 @@ class AlphaDeesp:  # AKA SOLVER
 
                 # best_topologies = self.clean_and_sort_best_topologies(best_topologies)
                 best_topologies = self.clean_and_sort_best_topologies(ranked_combinations)
+                self.counters["combinations scored"] += len(best_topologies)
                 res_container.append(best_topologies)
             # # print(best_topologies)
 
@@ -223,7 +279,7 @@ class AlphaDeesp:  # AKA SOLVER
             isSingleNodeTopo = ((np.all(np.array(topo) == 0)) or (np.all(np.array(topo) == 1)))
             score = self.rank_current_topo_at_node_x(self.g, node_to_change, isSingleNodeTopo, topo)
             if self.debug:
-                print("\n** RESULTS ** new topo [{}] on node [{}] has a score: [{}]\n".format(topo, node_to_change, score))
+                logger.debug("** RESULTS ** new topo [%s] on node [%s] has a score: [%s]", topo, node_to_change, score)
             scores_data.append([score, topo, node_to_change])
 
             # =======================================================
@@ -237,18 +293,21 @@ class AlphaDeesp:  # AKA SOLVER
         return ranked_combinations
 
     # WARNING: does not work yet when you go back from two nodes to one node at a given substation? Basically one node will be not connected?
-    def apply_new_topo_to_graph(self, graph: nx.MultiDiGraph, new_topology, node_to_change: int):
-        """given  a graph, a node_topoly and a node_id, this function applies the change to the graph
+    def apply_new_topo_to_graph(self, graph: nx.MultiDiGraph, new_topology, node_to_change: int, score=None):
+        """given  a graph, a node_topoly and a node_id, this function applies the change to the graph.
+        The new graph is kept in bag_of_graphs, ranked by score: the topology score of rank_topologies unless given
         :return new_graph, internal_repr_dict"""
         if self.debug:
-            print("\n====================================== apply new topo to graph ======================================")
-            print(" new topology applied = [{}] to node: [{}]".format(new_topology, node_to_change))
-            print("======================================================================================================\n")
+            logger.debug("apply new topo to graph: new topology applied = [%s] to node: [%s]", new_topology,
+                         node_to_change)
 
         # check if there are two nodes, there are 2 different values in new topo 0 and 1
         bus_ids = set(new_topology)
         # assert(len(bus_ids) == 2)#not necesarrily, it should be at least 1 and not more than 2
         assert ((len(bus_ids) != 0) & (len(bus_ids) <= 2))
+        if score is None and self.bag_of_graphs.max_items:
+            # scored on the overflow graph before the change, as in rank_topologies
+            score = self.rank_current_topo_at_node_x(self.g, node_to_change, len(bus_ids) == 1, new_topology)
 
         internal_repr_dict = dict(self.simulator_data["substations_elements"])
         new_node_id = int("666" + str(node_to_change))
@@ -385,11 +444,27 @@ class AlphaDeesp:  # AKA SOLVER
 
         name = "".join(str(e) for e in new_topology)
         name = str(node_to_change) + "_" + name
-        self.bag_of_graphs[name] = graph
+        self.bag_of_graphs.add(name, graph, score)
         return graph, internal_repr_dict
 
     def rank_current_topo_at_node_x(self, graph, node: int, isSingleNode=False, topo_vect=[0, 0, 1, 1, 1]):
-        """This function ranks current topology at node X"""
+        """This function ranks current topology at node X, with respect to the constrained path it belongs to.
+        If node belongs to the constrained paths of several overloads, its scores on each of them are summed up"""
+        node_constrained_paths = [c_path for c_path in self.constrained_paths
+                                  if node in c_path.n_amont() or node in c_path.n_aval()]
+        if not node_constrained_paths:  # scored on the loops, whatever the constrained path
+            return self.rank_current_topo_at_node_x_on_path(graph, node, self.constrained_path, isSingleNode, topo_vect)
+        if len(node_constrained_paths) == 1:
+            return self.rank_current_topo_at_node_x_on_path(graph, node, node_constrained_paths[0], isSingleNode,
+                                                            topo_vect)
+
+        scores = [self.rank_current_topo_at_node_x_on_path(graph, node, c_path, isSingleNode, topo_vect)
+                  for c_path in node_constrained_paths]
+        return np.around(sum(scores), decimals=2)
+
+    def rank_current_topo_at_node_x_on_path(self, graph, node: int, constrained_path, isSingleNode=False,
+                                            topo_vect=[0, 0, 1, 1, 1]):
+        """This function ranks current topology at node X, with respect to one constrained path"""
         final_score = 0.0
         all_nodes_value_attributes = nx.get_node_attributes(graph, "value")  # dict[node]
         all_edges_color_attributes = nx.get_edge_attributes(graph, "color")  # dict[edge]
@@ -399,11 +474,11 @@ class AlphaDeesp:  # AKA SOLVER
         # print('\nnoeud '+str(node)+' topo '+str(topo_vect))
 
         #  ########## IS IN AMONT ##########
-        if node in self.constrained_path.n_amont():
+        if node in constrained_path.n_amont():
             # ======================================
             #print("AMONT")
             if self.debug:
-                print("||||||||||||||||||||||||||| node [{}] is in_Amont of constrained_edge".format(node))
+                logger.debug("node [%s] is in_Amont of constrained_edge", node)
             in_negative_flows = []
             in_positive_flows = []
             out_positive_flows = []
@@ -437,20 +512,15 @@ class AlphaDeesp:  # AKA SOLVER
             max_pos_in_or_out_flows = max(sum(out_positive_flows), sum(in_positive_flows))
             final_score = np.around(sum(in_negative_flows) + max_pos_in_or_out_flows + diff_sums, decimals=2)
             if self.debug:
-                print("AMONT")
-                print("diff_sums = ", diff_sums)
-                print(type(diff_sums))
-                print("max_pos_in_or_out_flows = ", max_pos_in_or_out_flows)
-                print("in negative flows = ", in_negative_flows)
-                print("max_pos_in_or_out_flows = ", max_pos_in_or_out_flows)
-                print("Final score = ", final_score)
+                logger.debug("AMONT: diff_sums = %s, max_pos_in_or_out_flows = %s, in negative flows = %s, "
+                             "final score = %s", diff_sums, max_pos_in_or_out_flows, in_negative_flows, final_score)
 
         #  ########## IS IN AVAL ##########
-        elif node in self.constrained_path.n_aval():
+        elif node in constrained_path.n_aval():
             # =============================================================
             #print("AVAL")
             if self.debug:
-                print("||||||||||||||||||||||||||| node [{}] is in_Aval of constrained_edge".format(node))
+                logger.debug("node [%s] is in_Aval of constrained_edge", node)
 
             out_negative_flows = []
             out_positive_flows = []
@@ -484,23 +554,16 @@ class AlphaDeesp:  # AKA SOLVER
             max_pos_in_or_out_flows = max(sum(out_positive_flows), sum(in_positive_flows))
 
             if self.debug:
-                print("out_negative_flows = ", out_negative_flows)
-                print("out_positive_flows = ", out_positive_flows)
-                print("in_positive_flows = ", in_positive_flows)
-                print("sum out neg = ", sum(out_negative_flows))
-                print("sum out pos = ", sum(out_positive_flows))
-                print("sum in  pos = ", sum(in_positive_flows))
-                print("max_pos_in_or_out_flows = ", max_pos_in_or_out_flows)
+                logger.debug("out_negative_flows = %s, out_positive_flows = %s, in_positive_flows = %s, "
+                             "max_pos_in_or_out_flows = %s", out_negative_flows, out_positive_flows,
+                             in_positive_flows, max_pos_in_or_out_flows)
             # sur le noeud choisi (non connecté au cpath) on souhaite y connecter des consommations et pas des
             # productions pour l'aval.
             diff_sums = -self.get_prod_conso_sum(node, interesting_bus_id, topo_vect)
             final_score = np.around(sum(out_negative_flows) + max_pos_in_or_out_flows + diff_sums, decimals=2)
 
             if self.debug:
-                print("AVAL")
-                print("diff_sums = ", diff_sums)
-                print("Final score = ", final_score)
-                print(type(final_score))
+                logger.debug("AVAL: diff_sums = %s, final score = %s", diff_sums, final_score)
 
         #  ########## IS IN Loop ##########
         # you want a node with the maximum output lines connected to the ingoing red loop edges, not connected to other ingoing edges
@@ -545,23 +608,23 @@ class AlphaDeesp:  # AKA SOLVER
                 injection = -self.get_prod_conso_sum(node, Bus_BiggestInputDeltaFlow, topo_vect)
                 final_score = np.around(min_pos_in_or_out_flows + injection, decimals=2)
         else:
-            print("||||||||||||||||||||||||||| node [{}] is not connected to a path to the constrained_edge.".format(node))
+            logger.debug("node [%s] is not connected to a path to the constrained_edge.", node)
 
         #=====================================================================
         # print("SCORE   ---  "+str(final_score))
         # print('\n')
         return final_score
 
-    def is_in_aval(self, graph, node):  # in Aval of constrained_edge
-        """ This functions check if node is in Aval of constrained_edge"""
+    def is_in_aval(self, graph, node, constrained_path=None):  # in Aval of constrained_edge
+        """ This functions check if node is in Aval of the constrained_edge of constrained_path, or of any of the
+        constrained edges if not given"""
         g = self.g
-        aval_constrained_node = self.constrained_path.constrained_edge[1]
-        if node == aval_constrained_node:
-            return True
-        if node in list(g.successors(aval_constrained_node)):
-            return True
-        else:
-            return False
+        c_paths = self.constrained_paths if constrained_path is None else [constrained_path]
+        for c_path in c_paths:
+            aval_constrained_node = c_path.constrained_edge[1]
+            if node == aval_constrained_node or node in list(g.successors(aval_constrained_node)):
+                return True
+        return False
 
     def get_prod_conso_sum(self, node, interesting_bus_id, topo_vect):
         total = 0
@@ -606,22 +669,20 @@ class AlphaDeesp:  # AKA SOLVER
         # therefore change to bus ID 1
         bool = (float(edge_value) < 0 and (edge_color == "blue" or edge_color == "black") and not isSingleNode)
         if bool and self.debug:
-            print("\n######################################################")
-            print("Node [{}] is not connected to cpath. Twin node selected...".format(node))
-            print("######################################################")
+            logger.debug("Node [%s] is not connected to cpath. Twin node selected...", node)
         return bool
 
-    def is_in_amont(self, graph, node):  # in Amont of constrained_edge
+    def is_in_amont(self, graph, node, constrained_path=None):  # in Amont of constrained_edge
+        """ This functions check if node is in Amont of the constrained_edge of constrained_path, or of any of the
+        constrained edges if not given"""
         # g = self.g
         g = graph
-        amont_constrained_node = self.constrained_path.constrained_edge[0]
-        # print("constrained path = ", self.constrained_path)
-        if node == amont_constrained_node:
-            return True
-        if node in list(g.predecessors(amont_constrained_node)):
-            return True
-        else:
-            return False
+        c_paths = self.constrained_paths if constrained_path is None else [constrained_path]
+        for c_path in c_paths:
+            amont_constrained_node = c_path.constrained_edge[0]
+            if node == amont_constrained_node or node in list(g.predecessors(amont_constrained_node)):
+                return True
+        return False
 
     @staticmethod
     def is_in_aval_of_node_x(g, node, node_x):
@@ -709,11 +770,13 @@ class AlphaDeesp:  # AKA SOLVER
             return {}
         else:
             category1 = list(df_sorted_hubs["hubs"])
-            set_category2 = set(self.constrained_path.full_n_constrained_path()) - set(category1)
+            set_category2 = set([n for c_path in self.constrained_paths
+                                 for n in c_path.full_n_constrained_path()]) - set(category1)
 
             sort_redLoopBuses = sorted(self.rankedLoopBuses.items(), key=lambda x: x[1], reverse=True)
             category3 = [sort_redLoopBuses[i][0] for i in range(len(sort_redLoopBuses))]  # set()  # @TODO
-            set_category4 = set(self.constrained_path.n_aval()) - (set(category1) | set_category2 | set(category3))
+            set_category4 = set([n for c_path in self.constrained_paths for n in c_path.n_aval()]) - \
+                            (set(category1) | set_category2 | set(category3))
 
             d = {1: category1, 2: set_category2, 3: category3, 4: set_category4}
         return d
@@ -929,19 +992,19 @@ class AlphaDeesp:  # AKA SOLVER
         return fres
 
     def get_constrained_path(self):
-        """Return the constrained path"""
-        constrained_edge = None
-        tmp_constrained_path = []
+        """Return the constrained path (of the last constrained edge if there are several)"""
+        return self.get_constrained_paths()[-1]
+
+    def get_constrained_paths(self):
+        """Return a constrained path [amont_edges, constrained_edge, aval_edges] for each constrained (black) edge"""
+        constrained_paths = []
         edge_list = nx.get_edge_attributes(self.g_only_blue_components, "color")
-        for edge, color in edge_list.items():
+        for constrained_edge, color in edge_list.items():
             if color == "black":
-                constrained_edge = edge
-        amont_edges = self.get_amont_blue_edges(self.g_only_blue_components, constrained_edge[0])
-        aval_edges = self.get_aval_blue_edges(self.g_only_blue_components, constrained_edge[1])
-        tmp_constrained_path.append(amont_edges)
-        tmp_constrained_path.append(constrained_edge)
-        tmp_constrained_path.append(aval_edges)
-        return tmp_constrained_path
+                amont_edges = self.get_amont_blue_edges(self.g_only_blue_components, constrained_edge[0])
+                aval_edges = self.get_aval_blue_edges(self.g_only_blue_components, constrained_edge[1])
+                constrained_paths.append([amont_edges, constrained_edge, aval_edges])
+        return constrained_paths
 
     def get_hubs(self):
         """A hub (carrefour_electrique) has a constrained_path and positiv reports"""
@@ -949,27 +1012,27 @@ class AlphaDeesp:  # AKA SOLVER
         hubs = []
 
         if self.constrained_path is not None:
-            print("In get_hubs(): c = ")
-            print(self.constrained_path)
+            logger.debug("In get_hubs(): c = %s", self.constrained_path)
         else:
             e_amont, constrained_edge, e_aval = self.get_constrained_path()
             self.constrained_path = ConstrainedPath(e_amont, constrained_edge, e_aval)
 
-        # for nodes in aval, if node has RED inputs (ie incoming flows) then it is a hub
-        for node in self.constrained_path.n_aval():
-            in_edges = list(g.in_edges(node,keys=True))
-            for e in in_edges:
-                if g.edges[e]["color"] == "red":
-                    hubs.append(node)
-                    break
-
-        # for nodes in amont, if node has RED outputs (ie outgoing flows) then it is a hub
-        for node in self.constrained_path.n_amont():
-            out_edges = list(g.out_edges(node,keys=True))
-            for e in out_edges:
-                if g.edges[e]["color"] == "red":
-                    hubs.append(node)
-                    break
+        for constrained_path in self.constrained_paths:
+            # for nodes in aval, if node has RED inputs (ie incoming flows) then it is a hub
+            for node in constrained_path.n_aval():
+                in_edges = list(g.in_edges(node,keys=True))
+                for e in in_edges:
+                    if g.edges[e]["color"] == "red" and node not in hubs:
+                        hubs.append(node)
+                        break
+
+            # for nodes in amont, if node has RED outputs (ie outgoing flows) then it is a hub
+            for node in constrained_path.n_amont():
+                out_edges = list(g.out_edges(node,keys=True))
+                for e in out_edges:
+                    if g.edges[e]["color"] == "red" and node not in hubs:
+                        hubs.append(node)
+                        break
 
         # print("get_hubs = ", hubs)
         return hubs
@@ -980,23 +1043,25 @@ class AlphaDeesp:  # AKA SOLVER
 
         # print("==================== In function get_loops ====================")
         g = self.g_only_red_components
-        c_path_n = self.constrained_path.full_n_constrained_path()
         all_loop_paths = {}
         ii = 0
 
-        for i in range(len(c_path_n)):
-            for j in reversed(range(len(c_path_n))):
-                if i < j:
-                    # # print(i, j)
-                    # # print("we compare paths from source: {} to target: {}".format(c_path_n[i], c_path_n[j]))
-                    try:
-                        res = nx.all_shortest_paths(g, c_path_n[i], c_path_n[j])
-                        for p in res:
-                            # print("path = ", p)
-                            all_loop_paths[ii] = p
-                            ii += 1
-                    except nx.NetworkXNoPath:
-                        print("shortest path between {0} and {1} failed".format(c_path_n[i], c_path_n[j]))
+        for constrained_path in self.constrained_paths:
+            c_path_n = constrained_path.full_n_constrained_path()
+            for i in range(len(c_path_n)):
+                for j in reversed(range(len(c_path_n))):
+                    if i < j:
+                        # # print(i, j)
+                        # # print("we compare paths from source: {} to target: {}".format(c_path_n[i], c_path_n[j]))
+                        try:
+                            res = nx.all_shortest_paths(g, c_path_n[i], c_path_n[j])
+                            for p in res:
+                                # print("path = ", p)
+                                if p not in all_loop_paths.values():
+                                    all_loop_paths[ii] = p
+                                    ii += 1
+                        except nx.NetworkXNoPath:
+                            logger.debug("shortest path between %s and %s failed", c_path_n[i], c_path_n[j])
 
         # print("### Print in get_loops ###, all_loop_paths")
         # pprint.pprint(all_loop_paths)
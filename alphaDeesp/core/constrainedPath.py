@@ -1,9 +1,12 @@
 """Class representing a constrained path"""
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class ConstrainedPath:
     def __init__(self, amont_edges, constrained_edge, aval_edges):
-        print("Constrained path created")
+        logger.debug("Constrained path created")
         self.amont_edges = amont_edges
         self.constrained_edge = constrained_edge
         self.aval_edges = aval_edges
@@ -0,0 +1,133 @@
+"""Static description of a grid for the DC simulation: substations, elements, line susceptances and thermal limits.
+
+It is either built from arrays (e.g. for synthetic grids) or from the pandapower grid.json of a grid folder, with the
+same element order and names as the Grid2op PandaPowerBackend, so that line, generator and load ids are the same as in
+Grid2op.
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+
+class DCGrid:
+    """Grid on which DC observations are computed. Each substation has two buses. Susceptances are in MW per radian
+    and thermal limits in MW. The slack generator balances the injections of the grid"""
+
+    def __init__(self, line_or_to_subid, line_ex_to_subid, susceptances, thermal_limits, gen_to_subid, load_to_subid,
+                 slack_gen=None, n_sub=None, name_sub=None, name_line=None, name_gen=None, name_load=None,
+                 grid_layout=None, line_vn_kv=None):
+        self.line_or_to_subid = np.asarray(line_or_to_subid, dtype=int)
+        self.line_ex_to_subid = np.asarray(line_ex_to_subid, dtype=int)
+        self.susceptances = np.asarray(susceptances, dtype=float)
+        self.thermal_limits = np.asarray(thermal_limits, dtype=float)
+        self.gen_to_subid = np.asarray(gen_to_subid, dtype=int)
+        self.load_to_subid = np.asarray(load_to_subid, dtype=int)
+
+        self.n_line = len(self.line_or_to_subid)
+        self.n_gen = len(self.gen_to_subid)
+        self.n_load = len(self.load_to_subid)
+        if n_sub is None:
+            n_sub = 1 + int(max(np.max(self.line_or_to_subid, initial=-1), np.max(self.line_ex_to_subid, initial=-1),
+                                np.max(self.gen_to_subid, initial=-1), np.max(self.load_to_subid, initial=-1)))
+        self.n_sub = n_sub
+        # last generator by default, as the external grid in Grid2op PandaPowerBackend
+        self.slack_gen = self.n_gen - 1 if slack_gen is None else int(slack_gen)
+
+        self.name_sub = np.array(["sub_{}".format(i) for i in range(n_sub)] if name_sub is None else name_sub)
+        self.name_line = np.array(["{}_{}_{}".format(o, e, i) for i, (o, e) in
+                                   enumerate(zip(self.line_or_to_subid, self.line_ex_to_subid))]
+                                  if name_line is None else name_line)
+        self.name_gen = np.array(["gen_{}_{}".format(s, i) for i, s in enumerate(self.gen_to_subid)]
+                                 if name_gen is None else name_gen)
+        self.name_load = np.array(["load_{}_{}".format(s, i) for i, s in enumerate(self.load_to_subid)]
+                                  if name_load is None else name_load)
+        self.grid_layout = grid_layout
+        self.line_vn_kv = None if line_vn_kv is None else np.asarray(line_vn_kv, dtype=float)
+        # Injections of the grid file, if any
+        self.base_prod_p = None
+        self.base_load_p = None
+
+        # Elements of each substation, ordered as in Grid2op: generators, loads, line origins, line extremities
+        self.sub_info = np.bincount(self.gen_to_subid, minlength=n_sub) + \
+            np.bincount(self.load_to_subid, minlength=n_sub) + \
+            np.bincount(self.line_or_to_subid, minlength=n_sub) + \
+            np.bincount(self.line_ex_to_subid, minlength=n_sub)
+        self.dim_topo = int(np.sum(self.sub_info))
+        self.substation_objects = [{"generators_id": np.flatnonzero(self.gen_to_subid == sub),
+                                    "loads_id": np.flatnonzero(self.load_to_subid == sub),
+                                    "lines_or_id": np.flatnonzero(self.line_or_to_subid == sub),
+                                    "lines_ex_id": np.flatnonzero(self.line_ex_to_subid == sub)}
+                                   for sub in range(n_sub)]
+
+    def get_obj_connect_to(self, substation_id):
+        """Ids of the generators, loads, line origins and line extremities at a substation, as Grid2op"""
+        return self.substation_objects[substation_id]
+
+    def set_thermal_limits(self, thermal_limits_a):
+        """Sets the thermal limits from currents in A, converted to MW at the nominal voltage of the lines"""
+        if self.line_vn_kv is None:
+            raise ValueError("Nominal voltages of the lines are needed to convert thermal limits from A to MW")
+        self.thermal_limits = np.sqrt(3) * self.line_vn_kv * np.asarray(thermal_limits_a, dtype=float) / 1000.
+
+    @classmethod
+    def from_pandapower_json(cls, grid_path, thermal_limits=None, grid_layout=None):
+        """Reads a grid.json saved by pandapower. Lines come first, then transformers, and the external grid is the
+        last generator, as with the Grid2op PandaPowerBackend. thermal_limits are currents in A, pandapower max_i_ka
+        of the lines by default (transformers: their rated power)"""
+        with open(grid_path) as f:
+            net = json.load(f)["_object"]
+
+        def read_table(name):
+            table = net.get(name)
+            if table is None:
+                return pd.DataFrame()
+            if isinstance(table, dict):
+                table = table["_object"]
+            return pd.read_json(io.StringIO(table), orient="split")
+
+        bus = read_table("bus")
+        line = read_table("line")
+        trafo = read_table("trafo")
+        gen = read_table("gen")
+        ext_grid = read_table("ext_grid")
+        load = read_table("load")
+        bus_position = pd.Series(np.arange(len(bus)), index=bus.index)
+
+        line_or = list(bus_position[line["from_bus"]]) if len(line) else []
+        line_ex = list(bus_position[line["to_bus"]]) if len(line) else []
+        vn_kv = list(bus["vn_kv"].iloc[line_or]) if len(line) else []
+        susceptances = []
+        limits_mw = []
+        if len(line):
+            reactances = line["x_ohm_per_km"] * line["length_km"] / line["parallel"]
+            susceptances += list(np.array(vn_kv) ** 2 / reactances.to_numpy())
+            limits_mw += list(np.sqrt(3) * np.array(vn_kv) * line["max_i_ka"].to_numpy() * line["parallel"])
+        if len(trafo):
+            line_or += list(bus_position[trafo["hv_bus"]])
+            line_ex += list(bus_position[trafo["lv_bus"]])
+            vn_kv += list(trafo["vn_hv_kv"])
+            # per unit reactance on the transformer rating
+            susceptances += list(trafo["sn_mva"].to_numpy() * trafo["parallel"].to_numpy()
+                                 / (trafo["vk_percent"].to_numpy() / 100.))
+            limits_mw += list(trafo["sn_mva"].to_numpy() * trafo["parallel"].to_numpy())
+
+        gen_to_subid = list(bus_position[gen["bus"]]) if len(gen) else []
+        gen_to_subid += list(bus_position[ext_grid["bus"]]) if len(ext_grid) else []
+        load_to_subid = list(bus_position[load["bus"]]) if len(load) else []
+
+        name_line = ["{}_{}_{}".format(o, e, i) for i, (o, e) in enumerate(zip(line_or, line_ex))]
+        name_gen = ["gen_{}_{}".format(s, i) for i, s in enumerate(gen_to_subid)]
+        name_load = ["load_{}_{}".format(s, i) for i, s in enumerate(load_to_subid)]
+        grid = cls(line_or, line_ex, susceptances, limits_mw, gen_to_subid, load_to_subid,
+                   slack_gen=len(gen_to_subid) - 1, n_sub=len(bus), name_line=name_line, name_gen=name_gen,
+                   name_load=name_load, grid_layout=grid_layout, line_vn_kv=vn_kv)
+        grid.base_prod_p = np.concatenate([gen["p_mw"].to_numpy(dtype=float) if len(gen) else [],
+                                           np.zeros(len(ext_grid))])
+        grid.base_load_p = load["p_mw"].to_numpy(dtype=float) if len(load) else np.zeros(0)
+        if thermal_limits is not None:
+            grid.set_thermal_limits(thermal_limits)
+        return grid
+
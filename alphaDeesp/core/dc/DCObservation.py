@@ -0,0 +1,155 @@
+"""Grid state computed with a DC powerflow: flows, loadings, productions and loads of a DCGrid for given injections and
+topology. It has the attributes of a Grid2op Observation used by alphaDeesp, and simulates actions deterministically.
+
+Actions are lists of changes, which can be concatenated to combine them:
+    ("set_bus", substation_id, conf): buses of the elements of the substation (ordered as in get_obj_connect_to:
+    generators, loads, line origins, line extremities), 1 or 2, -1 to disconnect, 0 to leave unchanged
+    ("set_line_status", line_id, status): -1 disconnects the line, 1 reconnects it on bus 1 at both ends
+Bus b of substation s is numbered s + (b - 1) * n_sub in the DC system.
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import spsolve
+
+# Injection below which an island without the slack generator is considered empty, in MW
+ISLAND_TOLERANCE = 1e-6
+
+
+class DCObservation:
+    """DC powerflow of a grid state. prod_p and load_p are the injections set for each generator and load, the slack
+    generator production being adjusted to balance them. Buses are 1 or 2 per element, -1 if disconnected (all on bus
+    1 by default). done is True if the powerflow has no solution: slack generator disconnected, or island with
+    injections but without the slack generator"""
+
+    def __init__(self, grid, prod_p, load_p, line_or_bus=None, line_ex_bus=None, gen_bus=None, load_bus=None):
+        self.grid = grid
+        for name in ["n_sub", "n_line", "n_gen", "n_load", "sub_info", "dim_topo", "name_sub", "name_line",
+                     "name_gen", "name_load", "line_or_to_subid", "line_ex_to_subid", "gen_to_subid",
+                     "load_to_subid"]:
+            setattr(self, name, getattr(grid, name))
+        self.prod_p_setpoint = np.asarray(prod_p, dtype=float)
+        self.load_p_setpoint = np.asarray(load_p, dtype=float)
+
+        def get_buses(buses, n):
+            return np.ones(n, dtype=int) if buses is None else np.array(buses, dtype=int)
+
+        self.line_or_bus = get_buses(line_or_bus, grid.n_line)
+        self.line_ex_bus = get_buses(line_ex_bus, grid.n_line)
+        self.gen_bus = get_buses(gen_bus, grid.n_gen)
+        self.load_bus = get_buses(load_bus, grid.n_load)
+        # a line with one disconnected extremity is disconnected
+        self.line_status = (self.line_or_bus > 0) & (self.line_ex_bus > 0)
+        self.line_or_bus[~self.line_status] = -1
+        self.line_ex_bus[~self.line_status] = -1
+
+        # No protections nor legality rules in the DC simulation
+        self.time_before_cooldown_line = np.zeros(grid.n_line, dtype=int)
+        self.time_before_cooldown_sub = np.zeros(grid.n_sub, dtype=int)
+
+        self.done = False
+        self.theta = np.zeros(2 * grid.n_sub)
+        self.p_or = np.zeros(grid.n_line)
+        self.prod_p = np.where(self.gen_bus > 0, self.prod_p_setpoint, 0.)
+        self.load_p = np.where(self.load_bus > 0, self.load_p_setpoint, 0.)
+        self.compute_flows()
+        self.p_ex = -self.p_or
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.rho = np.where(grid.thermal_limits > 0, np.abs(self.p_or) / grid.thermal_limits, 0.)
+
+    def get_nodes(self, buses, to_subid):
+        """Nodes of the DC system of elements on buses, -1 if disconnected"""
+        return np.where(buses > 0, to_subid + (buses - 1) * self.n_sub, -1)
+
+    def compute_flows(self):
+        """Solves the DC powerflow with a sparse factorization of the susceptance matrix. The voltage angle of one
+        bus per island is fixed to 0: the slack bus in its island, the first bus in the others"""
+        n_node = 2 * self.n_sub
+        or_node = self.get_nodes(self.line_or_bus, self.line_or_to_subid)
+        ex_node = self.get_nodes(self.line_ex_bus, self.line_ex_to_subid)
+        gen_node = self.get_nodes(self.gen_bus, self.gen_to_subid)
+        load_node = self.get_nodes(self.load_bus, self.load_to_subid)
+        slack_gen = self.grid.slack_gen
+        if slack_gen < 0 or gen_node[slack_gen] < 0:
+            return self.set_game_over()
+
+        lines = np.flatnonzero(self.line_status)
+        or_node, ex_node = or_node[lines], ex_node[lines]
+        susceptances = self.grid.susceptances[lines]
+        susceptance_matrix = csr_matrix((np.concatenate([susceptances, susceptances, -susceptances, -susceptances]),
+                                         (np.concatenate([or_node, ex_node, or_node, ex_node]),
+                                          np.concatenate([or_node, ex_node, ex_node, or_node]))),
+                                        shape=(n_node, n_node))
+        injections = np.zeros(n_node)
+        np.add.at(injections, gen_node[gen_node >= 0], self.prod_p[gen_node >= 0])
+        np.subtract.at(injections, load_node[load_node >= 0], self.load_p[load_node >= 0])
+
+        n_islands, islands = connected_components(susceptance_matrix, directed=False)
+        slack_node = gen_node[slack_gen]
+        slack_island = islands[slack_node]
+        other_islands = islands != slack_island
+        if np.any(np.abs(injections[other_islands]) > ISLAND_TOLERANCE):
+            return self.set_game_over()
+
+        # the slack generator balances its island
+        mismatch = np.sum(injections[~other_islands])
+        self.prod_p[slack_gen] -= mismatch
+        injections[slack_node] -= mismatch
+
+        reference = np.zeros(n_node, dtype=bool)
+        reference[np.unique(islands, return_index=True)[1]] = True
+        reference[~other_islands] = False
+        reference[slack_node] = True
+        unknown = np.flatnonzero(~reference)
+        if len(unknown):
+            reduced_matrix = susceptance_matrix[unknown][:, unknown].tocsc()
+            self.theta[unknown] = spsolve(reduced_matrix, injections[unknown])
+        self.p_or[lines] = susceptances * (self.theta[or_node] - self.theta[ex_node])
+
+    def set_game_over(self):
+        """As Grid2op on a game over, flows, productions and loads are all null"""
+        self.done = True
+        self.prod_p = np.zeros(self.n_gen)
+        self.load_p = np.zeros(self.n_load)
+
+    def get_obj_connect_to(self, substation_id):
+        return self.grid.get_obj_connect_to(substation_id)
+
+    def get_sub_conf(self, substation_id):
+        """Buses of the elements of a substation, in get_obj_connect_to order"""
+        objects = self.get_obj_connect_to(substation_id)
+        return np.concatenate([self.gen_bus[objects["generators_id"]], self.load_bus[objects["loads_id"]],
+                               self.line_or_bus[objects["lines_or_id"]], self.line_ex_bus[objects["lines_ex_id"]]])
+
+    def apply(self, action):
+        """New grid state with action applied to this one, possibly a game over (done)"""
+        line_or_bus, line_ex_bus = self.line_or_bus.copy(), self.line_ex_bus.copy()
+        gen_bus, load_bus = self.gen_bus.copy(), self.load_bus.copy()
+        for change, element_id, value in action:
+            if change == "set_bus":
+                objects = self.get_obj_connect_to(element_id)
+                value = np.asarray(value, dtype=int)
+                start = 0
+                for buses, ids in [(gen_bus, objects["generators_id"]), (load_bus, objects["loads_id"]),
+                                   (line_or_bus, objects["lines_or_id"]), (line_ex_bus, objects["lines_ex_id"])]:
+                    conf = value[start:start + len(ids)]
+                    buses[ids] = np.where(conf != 0, conf, buses[ids])
+                    start += len(ids)
+            elif change == "set_line_status":
+                line_or_bus[element_id] = 1 if value > 0 else -1
+                line_ex_bus[element_id] = 1 if value > 0 else -1
+            else:
+                raise ValueError("Unknown change {} in DC action".format(change))
+        return DCObservation(self.grid, self.prod_p_setpoint, self.load_p_setpoint, line_or_bus, line_ex_bus,
+                             gen_bus, load_bus)
+
+    def simulate(self, action):
+        """Applies action to this grid state, returns (observation, reward, done, info) as Grid2op obs.simulate.
+        The observation is None on a game over, and the reward is not computed (None). Lines are never disconnected
+        by protections"""
+        new_obs = self.apply(action)
+        info = {"disc_lines": np.zeros(self.n_line, dtype=bool), "rewards": {}, "exception": []}
+        if new_obs.done:
+            return None, None, True, info
+        return new_obs, None, False, info
@@ -0,0 +1,104 @@
+import ast
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from alphaDeesp.core.dc.DCGrid import DCGrid
+from alphaDeesp.core.dc.DCObservation import DCObservation
+
+logger = logging.getLogger(__name__)
+
+
+class DCObservationLoader:
+    """Loads DC observations from a Grid2op grid folder (grid.json, config.py, chronics, grid_layout.json), without
+    Grid2op: the grid is read from the pandapower file, thermal limits and chronic names from config.py, and
+    injections from the chronics"""
+
+    def __init__(self, parameter_folder):
+        if not parameter_folder or not os.path.isdir(parameter_folder):
+            raise AttributeError("\nThe parameters folder for the DC simulation is empty or does not exist.")
+        self.parameter_folder = parameter_folder
+        self.config = read_grid_config(os.path.join(parameter_folder, "config.py"))
+
+        grid_layout = None
+        layout_path = os.path.join(parameter_folder, "grid_layout.json")
+        if os.path.exists(layout_path):
+            with open(layout_path) as f:
+                grid_layout = json.load(f)
+        self.grid = DCGrid.from_pandapower_json(os.path.join(parameter_folder, "grid.json"),
+                                                thermal_limits=self.config.get("thermal_limits"),
+                                                grid_layout=grid_layout)
+
+        chronics_folder = os.path.join(parameter_folder, "chronics")
+        self.chronics = sorted(name for name in os.listdir(chronics_folder)
+                               if os.path.isdir(os.path.join(chronics_folder, name))) \
+            if os.path.isdir(chronics_folder) else []
+
+    def get_observation(self, chronic_scenario=None, timestep=0):
+        """DC observation of the grid at timestep of chronic_scenario (name or position in the chronics folder, the
+        first one by default). Without chronics, the injections of grid.json are used"""
+        if not self.chronics:
+            return DCObservation(self.grid, self.grid.base_prod_p, self.grid.base_load_p)
+
+        if chronic_scenario is None:
+            chronic_scenario = 0
+        try:
+            chronic_scenario = self.search_chronic_name_from_num(int(chronic_scenario))
+        except ValueError:
+            if chronic_scenario not in self.chronics:
+                raise ValueError("Chronic scenario name: " + str(chronic_scenario) + " not found in folder")
+        logger.info("the name of the loaded DC scenario is : %s", chronic_scenario)
+
+        chronic_folder = os.path.join(self.parameter_folder, "chronics", chronic_scenario)
+        prod_p = self.read_injections(chronic_folder, "prods", timestep)
+        load_p = self.read_injections(chronic_folder, "loads", timestep)
+        return DCObservation(self.grid, prod_p, load_p)
+
+    def read_injections(self, chronic_folder, element_type, timestep):
+        """Injections of the generators ("prods") or loads ("loads") at timestep, ordered as in the grid. Reads either
+        pypownet chronics (_N_prods_p.csv, named as in the chronics) or Grid2op ones (prod_p.csv, named as in the
+        grid), possibly compressed"""
+        grid_names = list(self.grid.name_gen if element_type == "prods" else self.grid.name_load)
+        names_to_grid = (self.config.get("names_chronics_to_grid") or {}).get(element_type, {})
+        candidates = ["_N_{}_p.csv".format(element_type), "{}_p.csv".format(element_type[:-1]),
+                      "{}_p.csv.bz2".format(element_type[:-1])]
+        path = next((os.path.join(chronic_folder, name) for name in candidates
+                     if os.path.exists(os.path.join(chronic_folder, name))), None)
+        if path is None:
+            raise FileNotFoundError("No {} chronics found in {}".format(element_type, chronic_folder))
+
+        # only the header and the row of timestep are read
+        row = pd.read_csv(path, sep=";", skiprows=range(1, timestep + 1), nrows=1)
+        if row.empty:
+            raise ValueError("Timestep {} is beyond the chronics of {}".format(timestep, chronic_folder))
+        row = row.iloc[0]
+        row.index = [names_to_grid.get(name, name) for name in row.index]
+        return np.array([row[name] for name in grid_names], dtype=float)
+
+    def search_chronic_name_from_num(self, num):
+        return self.chronics[num]
+
+    def search_chronic_num_from_name(self, scenario_name):
+        return self.chronics.index(scenario_name) if scenario_name in self.chronics else None
+
+
+def read_grid_config(config_path):
+    """Reads the literal entries (thermal_limits, names_chronics_to_grid...) of the config dictionary of a Grid2op
+    grid folder, without importing it, as it imports Grid2op classes"""
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path) as f:
+        tree = ast.parse(f.read())
+    config = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Dict) and \
+                any(isinstance(target, ast.Name) and target.id == "config" for target in node.targets):
+            for key, value in zip(node.value.keys, node.value.values):
+                try:
+                    config[ast.literal_eval(key)] = ast.literal_eval(value)
+                except ValueError:  # Grid2op classes
+                    continue
+    return config
@@ -0,0 +1,421 @@
+import ast
+import logging
+from math import fabs
+
+import numpy as np
+import networkx as nx
+
+from alphaDeesp.core.simulation import Simulation
+from alphaDeesp.core.records import SimulationRecord
+from alphaDeesp.core.scoring import score_changes, get_worsened_lines
+from alphaDeesp.core.elements import Consumption, Production
+from alphaDeesp.core.printer import Printer, get_layout_file
+
+logger = logging.getLogger(__name__)
+
+
+class DCSimulation(Simulation):
+    """Simulation of a DCObservation: the line cut and candidate topologies are simulated with a deterministic DC
+    powerflow, without any simulator runtime. Meant for fast pre-screening, benchmarks and large grids, flows
+    being active powers only"""
+
+    def __init__(self, obs, param_options=None, debug=False, ltc=[9], other_ltc=[], plot=False, plot_folder=None):
+        super().__init__()
+
+        if ltc is None:
+            ltc = [9]
+        self.plot = plot
+        # Full observations are only needed for plots
+        self.keep_observations = plot
+        if plot:  # Manual mode
+            self.plot_folder = plot_folder
+            self.printer = Printer(plot_folder, workers=int(param_options.get("plotworkers", 0)),
+                                   layout_file=get_layout_file(param_options.get("gridpath")))
+        self.obs = obs
+        self.obs_linecut = None
+        self.debug = debug
+
+        # Get Alphadeesp configuration
+        self.ltc = ltc
+        self.other_ltc = other_ltc
+        self.substation_in_cooldown = self.get_substation_in_cooldown()
+        self.param_options = param_options
+        self.args_number_of_simulated_topos = param_options["totalnumberofsimulatedtopos"]
+        self.args_inner_number_of_simulated_topos_per_node = param_options["numberofsimulatedtopospernode"]
+
+        logger.info("Number of generators of the powergrid: %s", self.obs.n_gen)
+        logger.info("Number of loads of the powergrid: %s", self.obs.n_load)
+        logger.info("Number of powerline of the powergrid: %s", self.obs.n_line)
+        logger.info("Total number of elements: %s", self.obs.dim_topo)
+        self.internal_to_external_mapping = {}
+        self.external_to_internal_mapping = {}
+        self.substations_elements = {}
+
+        # Layout of the grid
+        self.layout = self.compute_layout()
+
+        # Compute data structure representing grid and topology
+        self.topo = None
+        self.topo_linecut = None
+        self.df = None
+        self.load()
+        self.save_bag = self.create_save_bag()
+
+    def compute_layout(self):
+        try:
+            layout = ast.literal_eval(self.param_options['CustomLayout'])
+            logger.warning("A CustomLayout has been given in config.ini. This layout will be set for the simulator")
+        except (KeyError, TypeError, ValueError, SyntaxError):
+            layout = None
+            if self.obs.grid.grid_layout is not None:
+                layout = [tuple(self.obs.grid.grid_layout[name]) for name in self.obs.name_sub]
+            else:
+                logger.warning("No CustomLayout has been given in config.ini and no grid_layout.json has been found "
+                               "in the grid folder. Plots will not be geographic")
+        return layout
+
+    def get_layout(self):
+        return self.layout
+
+    def load(self):
+        self.load_from_observation(self.obs, self.ltc + self.other_ltc)
+
+    def load_from_observation(self, obs, linesToDisconnect):
+        self.topo = self.extract_topo_from_obs(obs)
+        self.topo_linecut = None
+        self.df = self.create_df(self.topo, linesToDisconnect)
+        self.internal_to_external_mapping = {}
+        self.external_to_internal_mapping = {}
+        self.substations_elements = {}
+        self.create_and_fill_internal_structures(obs, self.df)
+
+    def get_substation_elements(self):
+        return self.substations_elements
+
+    def get_substation_in_cooldown(self):
+        return list(np.flatnonzero(self.obs.time_before_cooldown_sub >= 1))
+
+    def get_reference_topovec_sub(self, sub):
+        return [0] * int(self.obs.sub_info[sub])
+
+    def get_overload_disconnection_topovec_subor(self, l):
+        sub_or = int(self.obs.line_or_to_subid[l])
+        objects = self.obs.get_obj_connect_to(sub_or)
+        position_at_sub = len(objects["generators_id"]) + len(objects["loads_id"]) \
+            + int(np.flatnonzero(objects["lines_or_id"] == l)[0])
+        new_topo_vec = self.obs.get_sub_conf(sub_or)
+        new_topo_vec[position_at_sub] = -1  # to get line disconnection
+        return sub_or, new_topo_vec
+
+    def get_substation_to_node_mapping(self):
+        pass
+
+    def get_internal_to_external_mapping(self):
+        return self.internal_to_external_mapping
+
+    def get_dataframe(self):
+        """
+        :return: pandas dataframe with topology information before and after line cutting
+        """
+        return self.df
+
+    def create_and_fill_internal_structures(self, obs, df):
+        """This function fills multiple structures:
+        self.substation_elements, self.substation_to_node_mapping, self.internal_to_external_mapping
+        @:arg observation, df"""
+        # ################ PART I : fill self.internal_to_external_mapping
+        for i, substation_id in enumerate(obs.name_sub):
+            self.internal_to_external_mapping[i] = substation_id
+        if self.internal_to_external_mapping:
+            self.external_to_internal_mapping = self.invert_dict_keys_values(self.internal_to_external_mapping)
+
+        # ################ PART II : fill self.substation_elements, elements ordered as in DC actions
+        for substation_id in self.internal_to_external_mapping.keys():
+            elements_array = []
+            objects = obs.get_obj_connect_to(substation_id)
+            for gen_id in objects['generators_id']:
+                elements_array.append(Production(obs.gen_bus[gen_id] - 1, obs.prod_p[gen_id]))
+            for load_id in objects['loads_id']:
+                elements_array.append(Consumption(obs.load_bus[load_id] - 1, obs.load_p[load_id]))
+            for line_id in objects['lines_or_id']:
+                dest = obs.line_ex_to_subid[line_id]
+                elements_array.append(self.get_model_obj_from_or(df, substation_id, dest,
+                                                                 obs.line_or_bus[line_id] - 1))
+            for line_id in objects['lines_ex_id']:
+                dest = obs.line_or_to_subid[line_id]
+                elements_array.append(self.get_model_obj_from_ext(df, substation_id, dest,
+                                                                  obs.line_ex_bus[line_id] - 1))
+            self.substations_elements[substation_id] = elements_array
+
+    @staticmethod
+    def extract_topo_from_obs(obs):
+        """This function, takes an obs an returns a dict with all topology information.
+        Productions and loads are summed up per substation"""
+        nodes_ids = np.arange(obs.n_sub)
+        are_prods = np.isin(nodes_ids, obs.gen_to_subid)
+        are_loads = np.isin(nodes_ids, obs.load_to_subid)
+        prods_values = np.bincount(obs.gen_to_subid, weights=obs.prod_p, minlength=obs.n_sub)[are_prods]
+        loads_values = np.bincount(obs.load_to_subid, weights=obs.load_p, minlength=obs.n_sub)[are_loads]
+        return {"edges": {"idx_or": list(obs.line_or_to_subid),
+                          "idx_ex": list(obs.line_ex_to_subid),
+                          "init_flows": obs.p_or},
+                "nodes": {"are_prods": list(are_prods),
+                          "are_loads": list(are_loads),
+                          "prods_values": prods_values,
+                          "loads_values": loads_values}}
+
+    def cut_lines_and_recomputes_flows(self, ids: list):
+        """This functions cuts lines: [ids], simulates and returns new line flows"""
+        self.obs_linecut = self.obs.apply([("set_line_status", id_, -1) for id_ in ids])
+        self.line_cut_powerflows += 1
+        if self.obs_linecut.done:
+            logger.warning("cutting lines %s islands part of the grid in the DC simulation", ids)
+        self.topo_linecut = self.extract_topo_from_obs(self.obs_linecut)
+        return self.obs_linecut.p_or
+
+    def get_candidate_action(self, node, topology):
+        if len(topology) == 1:  # this is a line to disconnect, not a topology to change
+            l = topology[0]
+            return [("set_line_status", l, -1)], [l]
+        new_conf = [n + 1 for n in topology]
+        return [("set_bus", node, new_conf)], new_conf
+
+    def get_do_nothing_action(self):
+        return []
+
+    def simulate(self, action):
+        return self.obs.simulate(action)
+
+    def score_simulations(self, results, changes):
+        """Scores all simulations of the batch at once. Game overs get a null score and NaN redistributions and
+        efficacity, as with Grid2op"""
+        obs = self.obs
+        done = results["done"]
+        simulated_scores = score_changes(self.ltc, obs.rho, results["rho"], obs.time_before_cooldown_line,
+                                         results["time_before_cooldown_line"], obs.load_p, results["load_p"])
+        worsened_lines = get_worsened_lines(obs.rho, results["rho"], obs.time_before_cooldown_line,
+                                            results["time_before_cooldown_line"])
+        redistributions_prod = np.sum(np.abs(results["prod_p"] - obs.prod_p), axis=-1)
+        expected_new_loads = np.nansum(results["prod_p"], axis=-1) \
+            - np.nansum(np.abs(results["p_or"] + results["p_ex"]), axis=-1)
+        redistributions_load = np.sum(results["load_p"], axis=-1) - expected_new_loads
+
+        flows_before = obs.p_or[self.ltc]
+        flows_after = results["p_or"][:, self.ltc]
+        delta_flows = flows_before - flows_after
+        with np.errstate(divide="ignore", invalid="ignore"):
+            reliefs = np.sum(np.abs(delta_flows / results["rho"][:, self.ltc]), axis=-1)
+        success = np.isin(simulated_scores, [4, 3, 2, 1])
+        efficacities = np.where(success, reliefs, -reliefs)
+
+        all_score_data = []
+        for i, (node, internal_topology, applied_topology, score_topo) in enumerate(changes):
+            if len(self.ltc) == 1:
+                only_line = self.ltc[0]
+                flow_before, flow_after, delta_flow = flows_before[0], flows_after[i][0], delta_flows[i][0]
+            else:
+                only_line = list(self.ltc)
+                flow_before = [float(p) for p in flows_before]
+                flow_after = [float(p) for p in flows_after[i]]
+                delta_flow = [float(d) for d in delta_flows[i]]
+
+            if done[i]:  # Game over
+                worsened_line_ids = []
+                simulated_score = 0
+                redistribution_prod = float('nan')
+                redistribution_load = float('nan')
+                efficacity = float('nan')
+            else:
+                worsened_line_ids = list(np.flatnonzero(worsened_lines[i]))
+                simulated_score = simulated_scores[i]
+                redistribution_prod = redistributions_prod[i]
+                redistribution_load = redistributions_load[i]
+                efficacity = efficacities[i]
+                self.save_simulated_state(self.get_simulation_name(node, internal_topology), results[i],
+                                          simulated_score, efficacity)
+
+            all_score_data.append([only_line,
+                                   flow_before,
+                                   flow_after,
+                                   delta_flow,
+                                   worsened_line_ids,
+                                   redistribution_prod,
+                                   redistribution_load,
+                                   internal_topology,  # alphaDeesp internal topology format
+                                   applied_topology,
+                                   node,
+                                   1,  # category hubs?
+                                   score_topo,
+                                   simulated_score,
+                                   efficacity])
+        return all_score_data
+
+    @staticmethod
+    def get_simulation_name(node, internal_topology):
+        if isinstance(node, tuple):  # combined action on several substations
+            return "+".join(str(n) + "_" + "".join(str(e) for e in topo) for n, topo in zip(node, internal_topology))
+        return str(node) + "_" + "".join(str(e) for e in internal_topology)
+
+    def save_simulated_state(self, name, result, simulated_score, efficacity):
+        """Fills save bag with the simulated state for further analysis: the full observation when plotting, else a
+        compact SimulationRecord. With a bounded simulationRetention, the best ones are kept by simulated score, then
+        efficacity"""
+        if self.save_bag.max_items == 0:
+            return
+        if efficacity != efficacity:  # NaN
+            efficacity = -np.inf
+        if self.plot:
+            state = result["observation"]
+        else:
+            # copied, not to keep the whole batch alive
+            state = SimulationRecord(*[np.array(result[field]) for field in SimulationRecord.__slots__])
+        self.save_bag.add(name, state, (simulated_score, efficacity))
+
+    def estimate_candidate_relief(self, node, topology):
+        """The DC simulation being cheap, candidates are simply simulated"""
+        action, applied_topology = self.get_candidate_action(node, topology)
+        new_obs = self.obs.apply(action)
+        if new_obs.done:
+            return None
+        obs = self.obs
+        relief = self.get_estimated_relief(obs.p_or[self.ltc], obs.p_or[self.ltc] - new_obs.p_or[self.ltc])
+        n_new_overloads = int(np.sum((new_obs.rho > 1) & (obs.rho <= 1)))
+        return relief, n_new_overloads
+
+    def isAntenna(self):
+        for ltc in self.ltc:
+            linesAtBusbar_dic = self.getLinesAtSubAndBusbar(ltc)
+            for sub in linesAtBusbar_dic.keys():
+                if len(linesAtBusbar_dic[sub]) <= 1:
+                    return sub  # this is an Antenna
+        return None
+
+    def isDoubleLine(self):
+        double_lines = []
+        for ltc in self.ltc:
+            double_lines += [l for l in self.get_parallel_lines(ltc) if l not in double_lines]
+        if len(double_lines) == 0:
+            return None
+        return double_lines
+
+    def get_parallel_lines(self, ltc):
+        """Returns the lines connecting the same substations as line ltc"""
+        obs = self.obs
+        subs = {int(obs.line_or_to_subid[ltc]), int(obs.line_ex_to_subid[ltc])}
+        return [int(l) for l in range(obs.n_line) if l != ltc and
+                {int(obs.line_or_to_subid[l]), int(obs.line_ex_to_subid[l])} == subs]
+
+    def getLinesAtSubAndBusbar(self, ltc=None):
+        if ltc is None:
+            ltc = self.ltc[0]
+        obs = self.obs
+        linesAtBusbar_dic = {}
+        # we should check if another line is connected with our line of interest. Otherwise it is an antenna
+        for sub, busbar in [(int(obs.line_or_to_subid[ltc]), obs.line_or_bus[ltc]),
+                            (int(obs.line_ex_to_subid[ltc]), obs.line_ex_bus[ltc])]:
+            objects = obs.get_obj_connect_to(sub)
+            linesAtBusbar = [int(l) for l in objects['lines_or_id'] if obs.line_or_bus[l] == busbar]
+            linesAtBusbar += [int(l) for l in objects['lines_ex_id'] if obs.line_ex_bus[l] == busbar]
+            linesAtBusbar_dic[sub] = linesAtBusbar
+        return linesAtBusbar_dic
+
+    def build_graph_from_data_frame(self, lines_to_cut):
+        """This function creates a graph G from a DataFrame"""
+        g = nx.MultiDiGraph()
+        build_nodes(g, self.topo["nodes"]["are_prods"], self.topo["nodes"]["are_loads"],
+                    self.topo["nodes"]["prods_values"], self.topo["nodes"]["loads_values"])
+        self.build_edges_from_df(g, lines_to_cut)
+        return g
+
+    def build_edges_from_df(self, g, lines_to_cut):
+        for i, (origin, extremity, reported_flow, gray_edge) in enumerate(zip(
+                self.df["idx_or"], self.df["idx_ex"], self.df["delta_flows"], self.df["gray_edges"])):
+            penwidth = fabs(reported_flow) / 10
+            if penwidth == 0.0:
+                penwidth = 0.1
+            if i in lines_to_cut:
+                g.add_edge(origin, extremity, capacity=float("%.2f" % reported_flow), xlabel="%.2f" % reported_flow,
+                           color="black", style="dotted, setlinewidth(2)", fontsize=10, penwidth="%.2f" % penwidth,
+                           constrained=True)
+            elif gray_edge:  # Gray
+                g.add_edge(origin, extremity, capacity=float("%.2f" % reported_flow), xlabel="%.2f" % reported_flow,
+                           color="gray", fontsize=10, penwidth="%.2f" % penwidth)
+            elif reported_flow < 0:  # Blue
+                g.add_edge(origin, extremity, capacity=float("%.2f" % reported_flow), xlabel="%.2f" % reported_flow,
+                           color="blue", fontsize=10, penwidth="%.2f" % penwidth)
+            else:  # > 0  # Red
+                g.add_edge(origin, extremity, capacity=float("%.2f" % reported_flow), xlabel="%.2f" % reported_flow,
+                           color="red", fontsize=10, penwidth="%.2f" % penwidth)
+
+    def build_powerflow_graph_beforecut(self):
+        """
+        Builds a graph of the grid and its powerflow before the lines are cut
+        :return: NetworkX Graph of representing the grid
+        """
+        return build_powerflow_graph(self.topo)
+
+    def build_powerflow_graph_aftercut(self):
+        """
+        Builds a graph of the grid and its powerflow after the lines have been cut
+        :return: NetworkX Graph of representing the grid
+        """
+        return build_powerflow_graph(self.topo_linecut)
+
+    def plot_grid_beforecut(self):
+        return self.plot_grid(self.build_powerflow_graph_beforecut(), name="g_pow")
+
+    def plot_grid_aftercut(self):
+        return self.plot_grid(self.build_powerflow_graph_aftercut(), name="g_pow_prime")
+
+    def plot_grid_delta(self):
+        return self.plot_grid(self.build_graph_from_data_frame(self.ltc), name="g_overflow_print")
+
+    def plot_grid_from_obs(self, obs, name):
+        return self.plot_grid(build_powerflow_graph(self.extract_topo_from_obs(obs)), name=name)
+
+    def plot_simulated_states(self):
+        """Plots the simulated states kept in save bag, their graphs being rendered concurrently by the printer"""
+        graphs = [(name, build_powerflow_graph(self.extract_topo_from_obs(obs))) for name, obs in self.save_bag]
+        return self.printer.display_geo_all(graphs, self.get_layout())
+
+    def plot_grid(self, g, name):
+        """Plots graph g with alphadeesp.printer API, on the layout of the grid"""
+        return self.printer.display_geo(g, self.get_layout(), name=name)
+
+
+def build_powerflow_graph(topo):
+    """This function takes the topology information of a DC observation and returns a NetworkX Graph of its flows.
+    Disconnected lines have a null flow"""
+    g = nx.MultiDiGraph()
+    build_nodes(g, topo["nodes"]["are_prods"], topo["nodes"]["are_loads"], topo["nodes"]["prods_values"],
+                topo["nodes"]["loads_values"])
+    for origin, extremity, weight_value in zip(topo["edges"]["idx_or"], topo["edges"]["idx_ex"],
+                                               topo["edges"]["init_flows"]):
+        pen_width = fabs(weight_value) / 10
+        if pen_width == 0.0:
+            pen_width = 0.1
+        if weight_value >= 0:
+            g.add_edge(origin, extremity, xlabel="%.2f" % weight_value, color="gray", fontsize=10,
+                       penwidth="%.2f" % pen_width)
+        else:
+            g.add_edge(extremity, origin, xlabel="%.2f" % fabs(weight_value), color="gray", fontsize=10,
+                       penwidth="%.2f" % pen_width)
+    return g
+
+
+def build_nodes(g, are_prods, are_loads, prods_values, loads_values):
+    prods_iter, loads_iter = iter(prods_values), iter(loads_values)
+    # We color the nodes depending if they are production or consumption
+    for i, (is_prod, is_load) in enumerate(zip(are_prods, are_loads)):
+        prod = next(prods_iter) if is_prod else 0.
+        load = next(loads_iter) if is_load else 0.
+        prod_minus_load = prod - load
+        if prod_minus_load > 0:  # PROD
+            g.add_node(i, pin=True, prod_or_load="prod", value=str(prod_minus_load), style="filled",
+                       fillcolor="#f30000")  # red color
+        elif prod_minus_load < 0:  # LOAD
+            g.add_node(i, pin=True, prod_or_load="load", value=str(prod_minus_load), style="filled",
+                       fillcolor="#478fd0")  # blue color
+        else:  # WHITE COLOR
+            g.add_node(i, pin=True, prod_or_load="load", value=str(prod_minus_load), style="filled",
+                       fillcolor="#ffffed")  # white color
@@ -0,0 +1,110 @@
+"""Synthetic meshed grids of any size, to measure how the expert system scales with the grid.
+
+Substations are spread at random on a plane, and lines follow a Delaunay triangulation of them: a minimum spanning tree
+keeps the grid connected, and the other lines are drawn among the remaining triangulation edges, short ones first, as in
+transmission grids. Loads and generators are spread over the substations, generation matches consumption, and thermal
+limits are set so that lines are loaded between 30% and 90% in the base case, except for the overloaded lines.
+The same seed always gives the same grid.
+"""
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial import Delaunay
+
+from alphaDeesp.core.dc.DCGrid import DCGrid
+from alphaDeesp.core.dc.DCObservation import DCObservation
+
+# Nominal voltage (kV), line reactance (ohm/km) and mean distance between neighbouring substations (km)
+VN_KV = 225.
+X_OHM_PER_KM = 0.4
+SUBSTATION_SPACING_KM = 30.
+
+
+def generate_synthetic_grid(n_sub, lines_per_sub=1.5, loads_per_sub=0.8, gens_per_sub=0.3, seed=0):
+    """DCGrid of n_sub substations with about lines_per_sub lines, loads_per_sub loads and gens_per_sub generators per
+    substation (at least one generator, the largest being the slack), and its base injections. Thermal limits are
+    infinite, see generate_synthetic_observation"""
+    if n_sub < 3:
+        raise ValueError("A synthetic grid needs at least 3 substations")
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(0., SUBSTATION_SPACING_KM * np.sqrt(n_sub), size=(n_sub, 2))
+
+    # Candidate lines: edges of the Delaunay triangulation
+    triangles = Delaunay(positions).simplices
+    edges = np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [0, 2]]])
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    lengths = np.linalg.norm(positions[edges[:, 0]] - positions[edges[:, 1]], axis=1)
+
+    # Spanning tree first, then other edges drawn with a preference for short ones
+    tree = minimum_spanning_tree(coo_matrix((lengths, (edges[:, 0], edges[:, 1])), shape=(n_sub, n_sub))).tocoo()
+    in_tree = np.zeros(len(edges), dtype=bool)
+    edge_position = {(a, b): i for i, (a, b) in enumerate(edges)}
+    for a, b in zip(tree.row, tree.col):
+        in_tree[edge_position[(min(a, b), max(a, b))]] = True
+    others = np.flatnonzero(~in_tree)
+    n_others = int(np.clip(round(lines_per_sub * n_sub) - in_tree.sum(), 0, len(others)))
+    weights = 1. / lengths[others] ** 2
+    chosen = rng.choice(others, size=n_others, replace=False, p=weights / weights.sum())
+    lines = np.sort(np.concatenate([np.flatnonzero(in_tree), chosen]))
+
+    # random orientation of the lines
+    flip = rng.random(len(lines)) < 0.5
+    line_or = np.where(flip, edges[lines, 1], edges[lines, 0])
+    line_ex = np.where(flip, edges[lines, 0], edges[lines, 1])
+    length_km = np.maximum(lengths[lines], 1.)
+    susceptances = VN_KV ** 2 / (X_OHM_PER_KM * length_km)
+
+    n_load = max(1, int(round(loads_per_sub * n_sub)))
+    n_gen = max(1, int(round(gens_per_sub * n_sub)))
+    load_to_subid = np.sort(rng.choice(n_sub, size=n_load, replace=n_load > n_sub))
+    gen_to_subid = np.sort(rng.choice(n_sub, size=n_gen, replace=n_gen > n_sub))
+    load_p = rng.lognormal(np.log(30.), 0.5, size=n_load)
+    capacities = rng.lognormal(np.log(200.), 0.7, size=n_gen)
+    prod_p = np.sum(load_p) * capacities / np.sum(capacities)
+
+    grid_layout = {"sub_{}".format(i): [float(x), float(y)] for i, (x, y) in enumerate(positions)}
+    grid = DCGrid(line_or, line_ex, susceptances, np.full(len(lines), np.inf), gen_to_subid, load_to_subid,
+                  slack_gen=int(np.argmax(capacities)), n_sub=n_sub, grid_layout=grid_layout,
+                  line_vn_kv=np.full(len(lines), VN_KV))
+    grid.base_prod_p = prod_p
+    grid.base_load_p = load_p
+    return grid
+
+
+def generate_synthetic_observation(n_sub, n_overloads=1, seed=0, **grid_options):
+    """Returns (obs, ltc): the base case DCObservation of a synthetic grid (see generate_synthetic_grid for
+    grid_options), and the n_overloads lines overloaded in it, between 105% and 130%. Overloaded lines are among the
+    most loaded lines whose outage does not island the grid"""
+    grid = generate_synthetic_grid(n_sub, seed=seed, **grid_options)
+    rng = np.random.default_rng(seed + 1)
+    obs = DCObservation(grid, grid.base_prod_p, grid.base_load_p)
+    flows = np.abs(obs.p_or)
+
+    # base case loadings between 30% and 90%, limits of lines without flow being the median flow
+    limits = np.maximum(flows / rng.uniform(0.3, 0.9, size=grid.n_line), np.median(flows))
+
+    graph = nx.Graph()
+    graph.add_edges_from(zip(grid.line_or_to_subid, grid.line_ex_to_subid))
+    bridges = {frozenset(edge) for edge in nx.bridges(graph)}
+    meshed = np.array([frozenset((o, e)) not in bridges
+                       for o, e in zip(grid.line_or_to_subid, grid.line_ex_to_subid)])
+    candidates = np.flatnonzero(meshed)
+    candidates = candidates[np.argsort(-flows[candidates], kind="stable")][:max(10 * n_overloads, 1)]
+    ltc = sorted(int(l) for l in rng.choice(candidates, size=min(n_overloads, len(candidates)), replace=False))
+    limits[ltc] = flows[ltc] / rng.uniform(1.05, 1.3, size=len(ltc))
+
+    grid.thermal_limits = limits
+    return DCObservation(grid, grid.base_prod_p, grid.base_load_p), ltc
+
+
+def build_alphadeesp_inputs(sim):
+    """Keyword arguments of AlphaDeesp for a simulation (e.g. a DCSimulation of a synthetic observation): overflow
+    graph, dataframe and simulator data of its lines to cut, so that the expert system core can be run directly"""
+    return {"_g": sim.build_graph_from_data_frame(sim.ltc),
+            "df_of_g": sim.get_dataframe(),
+            "simulator_data": {"substations_elements": sim.get_substation_elements(),
+                               "substation_to_node_mapping": sim.get_substation_to_node_mapping(),
+                               "internal_to_external_mapping": sim.get_internal_to_external_mapping()},
+            "substation_in_cooldown": sim.substation_in_cooldown}
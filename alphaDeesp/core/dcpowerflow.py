@@ -0,0 +1,185 @@
+"""DC approximation of the power flows of a grid state, and its linear sensitivities (PTDF, LODF).
+
+It gives, without running any powerflow, cheap estimations of the flow changes due to line outages and bus splits.
+Buses are numbered from 0 to n_bus - 1 and lines are given by the buses of their extremities (-1 if disconnected).
+Buses without any connected line are left out of the system, with a null voltage angle.
+"""
+
+import numpy as np
+
+
+class DCPowerFlow:
+    """DC powerflow of one grid state. Sensitivity matrices are computed on first use, and kept for this state"""
+
+    def __init__(self, line_or_bus, line_ex_bus, susceptances, injections, slack_bus=None):
+        self.line_or_bus = np.asarray(line_or_bus, dtype=int)
+        self.line_ex_bus = np.asarray(line_ex_bus, dtype=int)
+        self.connected = (self.line_or_bus >= 0) & (self.line_ex_bus >= 0)
+        self.susceptances = np.where(self.connected, np.asarray(susceptances, dtype=float), 0.)
+        self.injections = np.asarray(injections, dtype=float)
+        self.n_bus = len(self.injections)
+        self.n_line = len(self.line_or_bus)
+
+        lines = np.flatnonzero(self.connected)
+        self.incidence = np.zeros((self.n_line, self.n_bus))
+        self.incidence[lines, self.line_or_bus[lines]] = 1.
+        self.incidence[lines, self.line_ex_bus[lines]] = -1.
+
+        active = np.zeros(self.n_bus, dtype=bool)
+        active[self.line_or_bus[lines]] = True
+        active[self.line_ex_bus[lines]] = True
+        if slack_bus is None:
+            # bus with the largest injection, ie generation
+            slack_bus = int(np.argmax(np.where(active, self.injections, -np.inf)))
+        self.slack_bus = slack_bus
+        active[slack_bus] = False
+        # buses of the reduced system, and their position in it
+        self.reduced_buses = np.flatnonzero(active)
+        self.reduced_position = np.full(self.n_bus, -1)
+        self.reduced_position[self.reduced_buses] = np.arange(len(self.reduced_buses))
+
+        susceptance_matrix = self.incidence.T @ (self.susceptances[:, None] * self.incidence)
+        reduced_matrix = susceptance_matrix[np.ix_(self.reduced_buses, self.reduced_buses)]
+        try:
+            self.inv_reduced_matrix = np.linalg.inv(reduced_matrix)
+        except np.linalg.LinAlgError:
+            # several islands: the minimum norm solution still gives the flows within each island
+            self.inv_reduced_matrix = np.linalg.pinv(reduced_matrix)
+
+        self.theta = np.zeros(self.n_bus)
+        self.theta[self.reduced_buses] = self.inv_reduced_matrix @ self.injections[self.reduced_buses]
+        self.flows = self.get_flows(self.theta)
+
+        self._ptdf = None
+        self._line_ptdf = None
+        self._lodf = None
+
+    def get_flows(self, theta, theta_or=None, theta_ex=None):
+        """Active flows of the lines for given voltage angles of the buses (or of the line extremities)"""
+        if theta_or is None:
+            theta_or = theta[self.line_or_bus]
+        if theta_ex is None:
+            theta_ex = theta[self.line_ex_bus]
+        return np.where(self.connected, self.susceptances * (theta_or - theta_ex), 0.)
+
+    @property
+    def ptdf(self):
+        """Power Transfer Distribution Factors (n_line, n_bus): flow change of each line for an injection of 1 at a
+        bus, withdrawn at the slack bus"""
+        if self._ptdf is None:
+            self._ptdf = np.zeros((self.n_line, self.n_bus))
+            self._ptdf[:, self.reduced_buses] = (self.susceptances[:, None] * self.incidence[:, self.reduced_buses]) \
+                @ self.inv_reduced_matrix
+        return self._ptdf
+
+    @property
+    def line_ptdf(self):
+        """(n_line, n_line) flow change of each line for a transfer of 1 from the origin to the extremity of a line"""
+        if self._line_ptdf is None:
+            self._line_ptdf = self.ptdf @ self.incidence.T
+        return self._line_ptdf
+
+    @property
+    def lodf(self):
+        """Line Outage Distribution Factors (n_line, n_line): share of the flow of the outaged line (column) which is
+        reported on each line (row). Columns of lines whose outage islands the grid are NaN"""
+        if self._lodf is None:
+            denominator = 1. - np.diag(self.line_ptdf)
+            bridges = np.isclose(denominator, 0.)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self._lodf = self.line_ptdf / np.where(bridges, 1., denominator)[None, :]
+            self._lodf[:, bridges & self.connected] = np.nan
+            self._lodf[:, ~self.connected] = 0.
+            np.fill_diagonal(self._lodf, -1.)
+        return self._lodf
+
+    def outage_flows(self, line_ids, flows=None):
+        """Flows after the simultaneous outage of line_ids, starting from flows (the DC flows by default, or any
+        measured flows of the same state). Raises ValueError if the outage islands part of the grid"""
+        flows = self.flows if flows is None else np.asarray(flows, dtype=float)
+        line_ids = [l for l in line_ids if self.connected[l]]
+        new_flows = flows.copy()
+        if not line_ids:
+            return new_flows
+        transfer = self.line_ptdf[:, line_ids]
+        try:
+            outage_transfer = np.linalg.solve(np.eye(len(line_ids)) - transfer[line_ids, :], flows[line_ids])
+        except np.linalg.LinAlgError:
+            raise ValueError("Outage of lines {} islands part of the grid".format(line_ids))
+        if not np.all(np.isfinite(outage_transfer)) or np.any(np.abs(outage_transfer) > 1e9):
+            raise ValueError("Outage of lines {} islands part of the grid".format(line_ids))
+        new_flows += transfer @ outage_transfer
+        new_flows[line_ids] = 0.
+        return new_flows
+
+    def n1_flows(self, flows=None):
+        """(n_line, n_line) flows of each line (row) after the outage of each line (column), in one matrix operation.
+        Columns of outages islanding part of the grid are NaN"""
+        flows = self.flows if flows is None else np.asarray(flows, dtype=float)
+        return flows[:, None] + self.lodf * flows[None, :]
+
+    def bus_split_flows(self, bus, moved_lines_or, moved_lines_ex, moved_injection=0.):
+        """Flows after splitting bus in two: lines whose origin (moved_lines_or) or extremity (moved_lines_ex) is at
+        bus are moved to a new bus, with moved_injection. Computed as a rank 2 update (Woodbury) of the reduced
+        susceptance matrix bordered by the new bus. Raises ValueError if the split islands part of the grid"""
+        moved_lines_or = [l for l in moved_lines_or if self.connected[l]]
+        moved_lines_ex = [l for l in moved_lines_ex if self.connected[l]]
+        if bus == self.slack_bus or self.reduced_position[bus] < 0:
+            return self.bus_split_flows_by_solve(bus, moved_lines_or, moved_lines_ex, moved_injection)
+
+        n = len(self.reduced_buses)
+        moved_susceptance = 0.
+        # coupling of the new bus with the other ends of the moved lines
+        coupling = np.zeros(n)
+        for other_ends, lines in [(self.line_ex_bus, moved_lines_or), (self.line_or_bus, moved_lines_ex)]:
+            for l in lines:
+                moved_susceptance += self.susceptances[l]
+                if self.reduced_position[other_ends[l]] >= 0:
+                    coupling[self.reduced_position[other_ends[l]]] += self.susceptances[l]
+        if np.isclose(moved_susceptance, 0.):
+            raise ValueError("Bus split at bus {} islands the moved elements".format(bus))
+
+        # The reduced matrix loses the moved lines at bus: B_r + U C U^T with U = [e_bus, coupling]
+        bus_vector = np.zeros(n)
+        bus_vector[self.reduced_position[bus]] = 1.
+        u = np.column_stack([bus_vector, coupling])
+        inv_c = np.array([[0., 1.], [1., moved_susceptance]])
+        x_u = self.inv_reduced_matrix @ u
+        try:
+            inv_capacitance = np.linalg.inv(inv_c + u.T @ x_u)
+        except np.linalg.LinAlgError:
+            raise ValueError("Bus split at bus {} islands part of the grid".format(bus))
+
+        def solve(y):
+            x_y = self.inv_reduced_matrix @ y
+            return x_y - x_u @ (inv_capacitance @ (u.T @ x_y))
+
+        injections = self.injections[self.reduced_buses].copy()
+        injections[self.reduced_position[bus]] -= moved_injection
+        theta_reduced = solve(injections)
+        theta_coupling = solve(-coupling)
+        denominator = moved_susceptance + coupling @ theta_coupling
+        if np.isclose(denominator, 0.):
+            raise ValueError("Bus split at bus {} islands part of the grid".format(bus))
+        theta_new_bus = (moved_injection + coupling @ theta_reduced) / denominator
+        theta_reduced = theta_reduced - theta_coupling * theta_new_bus
+
+        theta = np.zeros(self.n_bus)
+        theta[self.reduced_buses] = theta_reduced
+        theta_or = theta[self.line_or_bus]
+        theta_ex = theta[self.line_ex_bus]
+        theta_or[moved_lines_or] = theta_new_bus
+        theta_ex[moved_lines_ex] = theta_new_bus
+        return self.get_flows(theta, theta_or, theta_ex)
+
+    def bus_split_flows_by_solve(self, bus, moved_lines_or, moved_lines_ex, moved_injection=0.):
+        """Same as bus_split_flows, with a new DC powerflow of the split grid"""
+        new_bus = self.n_bus
+        line_or_bus = self.line_or_bus.copy()
+        line_ex_bus = self.line_ex_bus.copy()
+        line_or_bus[moved_lines_or] = new_bus
+        line_ex_bus[moved_lines_ex] = new_bus
+        injections = np.append(self.injections, moved_injection)
+        injections[bus] -= moved_injection
+        split = DCPowerFlow(line_or_bus, line_ex_bus, self.susceptances, injections, slack_bus=self.slack_bus)
+        return split.flows
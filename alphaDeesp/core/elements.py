@@ -1,6 +1,9 @@
 """
 This file contains substation elements, ie, Objects: Production, Consumption, Line.
 """
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class Production:
@@ -44,7 +47,7 @@ class Consumption:
 
     @busbar.setter
     def busbar(self, new_busbar):
-        print("debug inside busbar setter, new busbar =", new_busbar)
+        logger.debug("debug inside busbar setter, new busbar = %s", new_busbar)
         self.busbar_id = new_busbar
 
 
@@ -0,0 +1,138 @@
+"""N-1 screening: evaluates every single line outage of a grid state and ranks the contingencies creating overloads,
+so that the worst ones can be analysed by the expert system.
+
+Outages are evaluated either with the LODF of a DC approximation of the grid (one matrix operation for all lines),
+or with the backend powerflow, simulations being split between worker processes with their own environment.
+Lines are never disconnected for overflows in the simulations, so that the severity of the outages is not hidden by
+cascading disconnections.
+"""
+
+import contextlib
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SCREENING_METHODS = ["lodf", "backend"]
+
+
+def screen_contingencies(obs, action_space=None, lines=None, method="lodf", n_workers=1, loader_options=None):
+    """Returns (contingencies, timings): the contingencies creating overloads, worst first, as a pandas.DataFrame, and
+    the duration of each screening stage in seconds.
+    lines are the outages to evaluate (all connected lines by default). With the backend method, action_space is needed
+    and, for n_workers > 1, loader_options gives the (parameter_folder, difficulty, chronic_scenario, timestep) of obs
+    to rebuild it in the worker processes"""
+    from alphaDeesp.core.grid2op.Grid2opSimulation import build_dc_powerflow, estimate_rho
+
+    if method not in SCREENING_METHODS:
+        raise ValueError("Screening method should be one of {}".format(SCREENING_METHODS))
+    if lines is None:
+        lines = list(np.flatnonzero(obs.line_status))
+    timings = {}
+
+    start = time.time()
+    if method == "lodf":
+        dc_powerflow = build_dc_powerflow(obs)
+        timings["dc model"] = time.time() - start
+
+        start = time.time()
+        n1_flows = dc_powerflow.n1_flows(flows=obs.p_or)[:, lines]
+        rho_after = estimate_rho(obs, n1_flows).T
+        timings["outage flows"] = time.time() - start
+    elif n_workers > 1 and loader_options is not None:
+        chunks = [chunk for chunk in np.array_split(np.array(lines), n_workers) if len(chunk)]
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = pool.map(simulate_outages_in_worker, [loader_options] * len(chunks),
+                               [list(chunk) for chunk in chunks])
+            rho_after = np.concatenate(list(results))
+        timings["outage simulations"] = time.time() - start
+    else:
+        rho_after = simulate_outages(obs, action_space, lines)
+        timings["outage simulations"] = time.time() - start
+
+    start = time.time()
+    contingencies = rank_contingencies(lines, rho_after)
+    timings["ranking"] = time.time() - start
+
+    logger.info("N-1 screening (%s) of %d outages: %d contingencies with overloads", method, len(lines),
+                len(contingencies))
+    for stage, duration in timings.items():
+        logger.info("    %s: %.3fs", stage, duration)
+    return contingencies, timings
+
+
+def simulate_outages(obs, action_space, lines):
+    """(len(lines), n_line) line loadings after each outage, simulated with the backend. NaN if it fails"""
+    rho_after = np.full((len(lines), obs.n_line), np.nan)
+    with no_overflow_disconnection(obs._obs_env):
+        for i, line in enumerate(lines):
+            action = action_space({"set_line_status": [(int(line), -1)]})
+            virtual_obs, reward, done, info = obs.simulate(action, time_step=0)
+            if not done:
+                rho_after[i] = virtual_obs.rho
+    return rho_after
+
+
+def simulate_outages_in_worker(loader_options, lines):
+    """simulate_outages in a worker process, on the grid state rebuilt from loader_options"""
+    from alphaDeesp.core.grid2op.Grid2opObservationLoader import get_cached_loader
+
+    parameter_folder, difficulty, chronic_scenario, timestep = loader_options
+    loader = get_cached_loader(parameter_folder, difficulty=difficulty)
+    env, obs, action_space = loader.get_observation(chronic_scenario=chronic_scenario, timestep=timestep)
+    return simulate_outages(obs, action_space, lines)
+
+
+def rank_contingencies(lines, rho_after):
+    """Ranks the outages of lines creating overloads, given the line loadings after each of them (one row per outage,
+    NaN for outages that could not be evaluated). Severity is the sum of the overloads beyond 100%"""
+    rho_after = np.array(rho_after, dtype=float)
+    rho_after[np.arange(len(lines)), lines] = 0.  # the outaged line itself
+    overloads = np.where(rho_after > 1., rho_after - 1., 0.)
+    severities = np.nansum(overloads, axis=1)
+
+    rows = []
+    for i, line in enumerate(lines):
+        overloaded_lines = np.flatnonzero(rho_after[i] > 1.)
+        if len(overloaded_lines) == 0:
+            continue
+        overloaded_lines = overloaded_lines[np.argsort(-rho_after[i][overloaded_lines])]
+        rows.append({"Contingency": int(line),
+                     "Overloaded lines": [int(l) for l in overloaded_lines],
+                     "Max rho": float(rho_after[i][overloaded_lines[0]]),
+                     "Severity": float(severities[i])})
+
+    contingencies = pd.DataFrame(rows, columns=["Contingency", "Overloaded lines", "Max rho", "Severity"])
+    return contingencies.sort_values("Severity", ascending=False, kind="mergesort").reset_index(drop=True)
+
+
+def apply_contingency(loader, line, chronic_scenario=None, timestep=1):
+    """Returns (env, obs, action_space) of the grid state of the screened timestep after the outage of line, on which
+    the expert system can be run. The environment of loader is loaded at the previous timestep and stepped with the
+    outage, so that obs has the injections of the screened timestep. Lines are not disconnected for overflows during
+    the step"""
+    if timestep < 1:
+        raise ValueError("Outages are applied by a step from the previous timestep, timestep should be at least 1")
+    env, obs, action_space = loader.get_observation(chronic_scenario=chronic_scenario, timestep=timestep - 1)
+    with no_overflow_disconnection(env):
+        obs, reward, done, info = env.step(action_space({"set_line_status": [(int(line), -1)]}))
+    if done:
+        raise ValueError("Game over when applying the outage of line {}".format(line))
+    return env, obs, action_space
+
+
+@contextlib.contextmanager
+def no_overflow_disconnection(env):
+    """Disables the disconnection of overflowing lines in env (environment or observation environment of grid2op)"""
+    # the attribute is private in recent grid2op versions
+    name = "_no_overflow_disconnection" if hasattr(env, "_no_overflow_disconnection") else "no_overflow_disconnection"
+    previous = getattr(env, name, False)
+    setattr(env, name, True)
+    try:
+        yield env
+    finally:
+        setattr(env, name, previous)
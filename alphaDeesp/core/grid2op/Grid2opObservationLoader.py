@@ -2,6 +2,18 @@ import os
 import grid2op
 from grid2op.Parameters import Parameters
 
+# Loaders kept alive in the current process, so that grid2op environments are only created once
+_cached_loaders = {}
+
+
+def get_cached_loader(parameter_folder, difficulty=None):
+    """Returns a Grid2opObservationLoader for the given grid, creating its environment only on first call"""
+    key = (os.path.abspath(parameter_folder), difficulty)
+    if key not in _cached_loaders:
+        _cached_loaders[key] = Grid2opObservationLoader(parameter_folder, difficulty=difficulty)
+    return _cached_loaders[key]
+
+
 class Grid2opObservationLoader:
     def __init__(self, parameter_folder, difficulty = None):
         self.parameter_folder = parameter_folder
@@ -1,17 +1,22 @@
 from pprint import pprint
 import ast
 
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from math import fabs
 import networkx as nx
 from grid2op.dtypes import dt_int
 
-from grid2op.PlotGrid import PlotMatplot
-
 from alphaDeesp.core.simulation import Simulation
+from alphaDeesp.core.dcpowerflow import DCPowerFlow
+from alphaDeesp.core.records import RetentionBag, SimulationRecord, create_simulation_batch, get_batch_record
+from alphaDeesp.core.grid2op.Grid2opSimulationSession import Grid2opSimulationSession
 from alphaDeesp.core.network import Network
 from alphaDeesp.core.elements import OriginLine, Consumption, Production, ExtremityLine
-from alphaDeesp.core.printer import Printer
+from alphaDeesp.core.printer import Printer, get_layout_file
+
+logger = logging.getLogger(__name__)
 
 
 class Grid2opSimulation(Simulation):
@@ -20,18 +25,18 @@ class Grid2opSimulation(Simulation):
             layout = self.param_options['CustomLayout']
             # Conversion from string to list
             layout = ast.literal_eval(layout)
-            print("WARNING : A CustomLayout has been given in config.ini. This layout will be set for the simulator")
+            logger.warning("A CustomLayout has been given in config.ini. This layout will be set for the simulator")
         except:
             try:
                 # Grid2op Layout if exists
                 layout = list(self.obs.grid_layout.values())
-                print("WARNING : No CustomLayout has been given in config.ini. The grid_layout in Grid2Op structure will be set for the simulator")
+                logger.warning("No CustomLayout has been given in config.ini. The grid_layout in Grid2Op structure will be set for the simulator")
             except:
                 layout = [(-280, -81), (-100, -270), (366, -270), (366, -54), (-64, -54), (-64, 54), (366, 0),
                           (438, 0), (326, 54), (222, 108), (79, 162), (-152, 270), (-64, 270), (222, 216),
                           (-280, -151), (-100, -340), (366, -340), (390, -110), (-14, -104), (-184, 54), (400, -80),
                           (438, 100), (326, 140), (200, 8), (79, 12), (-152, 170), (-70, 200), (222, 200)]
-                print("WARNING : No CustomLayout has been given in config.ini and no grid_layout has been found in Grid2op data. Default layout is set and might cause plotting errors : "+str(layout))
+                logger.warning("No CustomLayout has been given in config.ini and no grid_layout has been found in Grid2op data. Default layout is set and might cause plotting errors : %s", layout)
         return layout
 
     def get_layout(self):
@@ -43,14 +48,19 @@ class Grid2opSimulation(Simulation):
         # Get Grid2op objects
         if ltc is None:
             ltc = [9]
+        self.plot = plot
         if plot: # Manual mode
             self.plot_folder = plot_folder
-            self.printer = Printer(plot_folder)
+            self.printer = Printer(plot_folder, workers=int(param_options.get("plotworkers", 0)),
+                                   layout_file=get_layout_file(param_options.get("gridpath")))
         self.obs = obs
         self.obs_linecut = None
+        self.line_status_linecut = None
         self.action_space = action_space
         self.observation_space = observation_space
-        self.plot_helper = self.get_plot_helper()
+        self.plot_helper = None  # Created on first plot, as it pulls matplotlib
+        self.dc_powerflow = None  # DC approximation of the observation, created on first use
+        self.simulation_session = None  # Pool of backends to simulate actions, created on first use if enabled
         self.no_overflow_disc = self.obs._obs_env.no_overflow_disconnection # Keep it in memory to activate and deactivate during computation steps
 
         # Get Alphadeesp configuration
@@ -62,11 +72,11 @@ class Grid2opSimulation(Simulation):
         self.args_number_of_simulated_topos = param_options["totalnumberofsimulatedtopos"]
         self.args_inner_number_of_simulated_topos_per_node = param_options["numberofsimulatedtopospernode"]
 
-        print("Number of generators of the powergrid: {}".format(self.obs.n_gen))
-        print("Number of loads of the powergrid: {}".format(self.obs.n_load))
-        print("Number of powerline of the powergrid: {}".format(self.obs.n_line))
-        print("Number of elements connected to each substations in the powergrid: {}".format(self.obs.sub_info))
-        print("Total number of elements: {}".format(self.obs.dim_topo))
+        logger.info("Number of generators of the powergrid: %s", self.obs.n_gen)
+        logger.info("Number of loads of the powergrid: %s", self.obs.n_load)
+        logger.info("Number of powerline of the powergrid: %s", self.obs.n_line)
+        logger.info("Number of elements connected to each substations in the powergrid: %s", self.obs.sub_info)
+        logger.info("Total number of elements: %s", self.obs.dim_topo)
         self.internal_to_external_mapping = {}
         self.external_to_internal_mapping = {}
         self.substations_elements = {}
@@ -79,7 +89,11 @@ class Grid2opSimulation(Simulation):
         self.topo_linecut = None
         self.df = None
         self.load()
-        self.save_bag = []
+        self.save_bag = self.create_save_bag()
+        # full observations of the best simulations
+        self.retained_observations = RetentionBag(int(param_options.get("numberofretainedobservations", 0)))
+        # powerflow iterations of the simulated candidates, in end result dataframe order
+        self.candidate_iterations = []
 
     def load(self):
         self.load_from_observation(self.obs, self.ltc+self.other_ltc)
@@ -121,8 +135,10 @@ class Grid2opSimulation(Simulation):
         return self.internal_to_external_mapping
 
     def get_plot_helper(self):
-        plot_helper = PlotMatplot(self.observation_space)
-        return plot_helper
+        if self.plot_helper is None:
+            from grid2op.PlotGrid import PlotMatplot
+            self.plot_helper = PlotMatplot(self.observation_space)
+        return self.plot_helper
 
     @staticmethod
     def merge_two_dicts(x, y):
@@ -164,74 +180,137 @@ class Grid2opSimulation(Simulation):
         Number of tested combinations and topo per node is given in alphadeesp parameters
         :returns pandas.DataFrame with results of simulations
         """
-        print("\n##############################################################################")
-        print("##########...........COMPUTE NEW NETWORK CHANGES..........####################")
-        print("##############################################################################")
-        end_result_dataframe = self.create_end_result_empty_dataframe()
-        actions = []
-        j = 0
-        for df in ranked_combinations:
-            ii = 0
-            if j == int(self.args_number_of_simulated_topos):
-                break
-            for i, row in df.iterrows():
-                if ii == int(self.args_inner_number_of_simulated_topos_per_node):
-                    break
-                obs = self.obs
-                # target_node = row["node"] + 1
-                internal_target_node = row["node"]
-                # target_node = row["node"]
-                alphaDeesp_Internal_topo=np.array([n for n in row["topology"]])
-
-                new_conf = np.array([n + 1 for n in row["topology"]])
-                if(len(alphaDeesp_Internal_topo)==1):#this is a line to disconnect, not a topology to change
-                    l=alphaDeesp_Internal_topo[0]
-                    #sub_id,new_conf_grid2op=self.get_overload_disconnection_topovec_subor(l)
-                    new_conf=[l]
-                    #action = self.action_space({"set_bus": {"substations_id": [(sub_id, new_conf_grid2op)] }})
-
-
-                score_topo = i
-                print("###########"" Compute new network changes on node [{}] with new topo [{}] ###########"
-                      .format(internal_target_node, new_conf))
-
-
-                if(len(alphaDeesp_Internal_topo)==1):#this is a line to disconnect, not a topology to change
-                    new_conf_grid2op=[l]
-                    new_conf=[l]
-                    action = self.action_space({"set_line_status": [(l, -1)]})
-                else:
-                    action = self.get_action_from_topo(internal_target_node, new_conf, obs)
-                    new_conf_grid2op = list(action.effect_on(substation_id=internal_target_node)[
-                                                'set_bus'])  # grid2op conf is different from alphadeesp conf, because the elements are ordered differently
-                actions.append(action)
-
-
-                # virtual_obs, reward, done, info = self.obs.simulate(action)
-                virtual_obs, reward, done, info = self.obs.simulate(action, time_step = 0)
-
-                score_data=self.compute_one_network_change_score_data(obs,virtual_obs,done,info,new_conf,internal_target_node,alphaDeesp_Internal_topo,new_conf_grid2op,score_topo)
-                #print(score_data)
-                max_index = end_result_dataframe.shape[0]  # rows
-                end_result_dataframe.loc[max_index] = score_data
-                ii += 1
-                j += 1
-
-        end_result_dataframe.to_csv("./END_RESULT_DATAFRAME.csv", index=True)
-
-        # Case there are no hubs --> action do nothing
-        if len(actions) == 0:
-            actions = [self.action_space()]
+        end_result_dataframe, actions = super().compute_new_network_changes(ranked_combinations)
+        if self.get_simulation_session() is not None:
+            logger.info("Simulation session convergence: %s", self.simulation_session.get_convergence_report())
         return end_result_dataframe, actions
 
+    def get_candidate_action(self, node, topology):
+        if len(topology) == 1:  # this is a line to disconnect, not a topology to change
+            l = topology[0]
+            return self.action_space({"set_line_status": [(l, -1)]}), [l]
+        new_conf = np.array([n + 1 for n in topology])
+        action = self.get_action_from_topo(node, new_conf, self.obs)
+        # grid2op conf is different from alphadeesp conf, because the elements are ordered differently
+        return action, list(action.effect_on(substation_id=node)['set_bus'])
+
+    def get_do_nothing_action(self):
+        return self.action_space()
+
+    def simulate_batch(self, actions):
+        """Simulates actions on the observation. With a simulation session of several backends, simulations run
+        concurrently on them. reward is the one of reward_type if given. Full observations are kept when plotting or
+        when some of them are to be retained, see save_simulated_state"""
+        session = self.get_simulation_session()
+        if session is not None and session.backends.qsize() > 1 and len(actions) > 1:
+            with ThreadPoolExecutor(max_workers=session.backends.qsize()) as pool:
+                simulations = list(pool.map(self.simulate, actions))
+        else:
+            simulations = [self.simulate(action) for action in actions]
+
+        simulations = [(virtual_obs, info.get("rewards", {}).get(self.reward_type), done, info)
+                       for virtual_obs, reward, done, info in simulations]
+        keep_observations = self.plot or int(self.param_options.get("numberofretainedobservations", 0)) > 0
+        observations = [virtual_obs for virtual_obs, reward, done, info in simulations] if keep_observations else None
+        return create_simulation_batch(simulations, observations)
+
+    def score_simulations(self, results, changes):
+        all_score_data = []
+        for result, (node, internal_topology, applied_topology, score_topo) in zip(results, changes):
+            if not isinstance(node, tuple):
+                internal_topology = np.array([n for n in internal_topology])
+            virtual_obs = result["observation"]
+            if virtual_obs is None:
+                virtual_obs = get_batch_record(result)
+            rewards = {} if np.isnan(result["reward"]) else {self.reward_type: result["reward"]}
+            info = {"disc_lines": result["disc_lines"], "rewards": rewards}
+            score_data = self.compute_one_network_change_score_data(
+                self.obs, virtual_obs, result["done"], info, None, node, internal_topology, applied_topology,
+                score_topo)
+            if score_data is not None:
+                self.candidate_iterations.append(None if result["iterations"] < 0 else int(result["iterations"]))
+            all_score_data.append(score_data)
+        return all_score_data
+
+    def save_simulated_state(self, name, virtual_obs, simulated_score, efficacity):
+        """Fills save bag with the simulated state for further analysis: the full observation when plotting, else a
+        compact SimulationRecord. With a bounded simulationRetention, the best ones are kept by simulated score, then
+        efficacity. Full observations of the best simulations are also kept in retained_observations, up to
+        numberOfRetainedObservations in alphadeesp parameters"""
+        if efficacity != efficacity:  # NaN
+            efficacity = -np.inf
+        score = (simulated_score, efficacity)
+        if self.save_bag.max_items != 0:
+            if self.plot:
+                self.save_bag.add(name, virtual_obs, score)
+            else:
+                # copied, not to keep the whole batch alive
+                self.save_bag.add(name, SimulationRecord.from_observation(virtual_obs, copy=True), score)
+        self.retained_observations.add(name, virtual_obs, score)
+
+    def get_retained_observations(self):
+        """Returns [name, observation] of the retained simulations, best first"""
+        return list(self.retained_observations)
+
+    def clear_simulated_states(self):
+        super().clear_simulated_states()
+        self.retained_observations.clear()
+        self.candidate_iterations = []
+
+    def get_run_metadata(self):
+        """Run metadata, with the powerflow iterations of each candidate (row of the end result dataframe) when the
+        simulation session reports them"""
+        metadata = super().get_run_metadata()
+        if any(iterations is not None for iterations in self.candidate_iterations):
+            metadata["powerflow iterations"] = list(self.candidate_iterations)
+        return metadata
+
+    def close(self):
+        """Releases the observations, dataframes, simulated states and backend copies held by the simulation. It
+        cannot be used for further analyses afterwards"""
+        super().close()
+        if self.simulation_session:
+            self.simulation_session.close()
+        self.simulation_session = None
+        self.dc_powerflow = None
+        self.plot_helper = None
+        self.line_status_linecut = None
+        self.action_space = None
+        self.observation_space = None
+
+    def get_simulation_session(self):
+        """Simulation session of the observation if enabled by simulationSession (number of backend copies) in
+        alphadeesp parameters, else None. Not used when plotting, as plots need full observations"""
+        n_backends = int(self.param_options.get("simulationsession", 0))
+        if self.simulation_session is None and n_backends > 0 and not self.plot:
+            try:
+                warm_start = bool(int(self.param_options.get("warmstart", 1)))
+                self.simulation_session = Grid2opSimulationSession(self.obs, n_backends=n_backends,
+                                                                   warm_start=warm_start)
+            except AttributeError as e:  # grid2op version without the needed backend interface
+                logger.warning("simulation session not available (%s), obs.simulate is used", e)
+                self.simulation_session = False
+        return self.simulation_session or None
+
+    def simulate(self, action):
+        """Simulates action on the observation, with the simulation session if enabled, else with obs.simulate"""
+        session = self.get_simulation_session()
+        if session is not None:
+            return session.simulate(action)
+        return self.obs.simulate(action, time_step = 0)
+
     def compute_one_network_change_score_data(self, obs,virtual_obs,done,info,new_conf,internal_target_node,alphaDeesp_Internal_topo,new_conf_grid2op,score_topo):
-        # Same as in Pypownet, this is not what we would want though, as we do the work for only one ltc
-        only_line = self.ltc[0]
-        line_state_before = obs.state_of(line_id=only_line)
-        line_state_after = virtual_obs.state_of(line_id=only_line)
-        flow_before = line_state_before["origin"]["p"]
-        flow_after = line_state_after["origin"]["p"]
-        delta_flow = flow_before - flow_after
+        if len(self.ltc) == 1:
+            only_line = self.ltc[0]
+            flow_before = obs.p_or[only_line]
+            flow_after = virtual_obs.p_or[only_line]
+            delta_flow = flow_before - flow_after
+        else:
+            # several overloaded lines: overflow ID and flows are given per line
+            only_line = list(self.ltc)
+            flow_before = [float(p) for p in obs.p_or[self.ltc]]
+            flow_after = [float(p) for p in virtual_obs.p_or[self.ltc]]
+            delta_flow = [before - after for before, after in zip(flow_before, flow_after)]
 
         if done:  # Game over: no need to compute further operations
             worsened_line_ids = []
@@ -242,16 +321,19 @@ class Grid2opSimulation(Simulation):
 
         else:
             # Fill save bag with observations for further analysis (detailed graph)
-            name = "".join(str(e) for e in alphaDeesp_Internal_topo)#"".join(str(e) for e in new_conf)
-            name = str(internal_target_node) + "_" + name
-            self.save_bag.append([name, virtual_obs])
+            if isinstance(internal_target_node, tuple):  # combined action on several substations
+                name = "+".join(str(node) + "_" + "".join(str(e) for e in topo)
+                                for node, topo in zip(internal_target_node, alphaDeesp_Internal_topo))
+            else:
+                name = "".join(str(e) for e in alphaDeesp_Internal_topo)#"".join(str(e) for e in new_conf)
+                name = str(internal_target_node) + "_" + name
             worsened_line_ids = self.create_boolean_array_of_worsened_line_ids(obs, virtual_obs,
                                                                                self.observation_space.parameters.NB_TIMESTEP_COOLDOWN_LINE)
             simulated_score = score_changes_between_two_observations(self.ltc, obs, virtual_obs,
                                                                      self.observation_space.parameters.NB_TIMESTEP_COOLDOWN_LINE)
 
             # update simulated score to 0 in case our line got disconnected, starting a cascading failure
-            if (bool(info['disc_lines'][self.ltc])):#other line disconnections are already accounted in worsened lines
+            if (np.any(info['disc_lines'][self.ltc])):#other line disconnections are already accounted in worsened lines
             #if (info['disc_lines'].any()):
                 simulated_score = 0
 
@@ -262,13 +344,17 @@ class Grid2opSimulation(Simulation):
             ExpectedNewLoad = TotalProd - Losses
             redistribution_load = (np.sum(virtual_obs.load_p) - ExpectedNewLoad)  # / np.sum(old_obs.load_p)
 
+            # relief of the overloads of interest, summed up over the lines to cut
+            relief = sum(fabs(delta / virtual_obs.rho[line])
+                         for delta, line in zip(np.atleast_1d(delta_flow), self.ltc))
             if simulated_score in [4, 3, 2, 1]:  # success
-                efficacity = fabs(delta_flow / virtual_obs.rho[self.ltc[0]])
+                efficacity = relief
                 if (self.reward_type is not None) and (self.reward_type in info["rewards"]):  # & (simulated_score==4):
                     # dans le cas ou on resoud bien les contraintes, on prend la reward L2RPN
                     efficacity = info["rewards"][self.reward_type]
             else:  # failure
-                efficacity = -fabs(delta_flow / virtual_obs.rho[self.ltc[0]])
+                efficacity = -relief
+            self.save_simulated_state(name, virtual_obs, simulated_score, efficacity)
 
         # To store in data frame
         score_data = [only_line,
@@ -313,6 +399,60 @@ class Grid2opSimulation(Simulation):
             res = list(res)
         return res
 
+    def get_dc_powerflow(self):
+        """DC approximation of the grid state of the observation, computed once"""
+        if self.dc_powerflow is None:
+            self.dc_powerflow = build_dc_powerflow(self.obs)
+        return self.dc_powerflow
+
+    def estimate_candidate_flows(self, internal_target_node, topology):
+        """Active flows at line origins after applying a candidate topology: the flows of the observation, corrected
+        by the change of the DC flows. Raises ValueError if the candidate islands part of the grid"""
+        obs = self.obs
+        dc_powerflow = self.get_dc_powerflow()
+        if len(topology) == 1:  # this is a line to disconnect
+            return dc_powerflow.outage_flows([topology[0]], flows=obs.p_or)
+
+        new_conf = np.array([n + 1 for n in topology])
+        conf = self.get_action_from_topo(internal_target_node, new_conf, obs).effect_on(
+            substation_id=internal_target_node)['set_bus']
+        start = int(np.sum(obs.sub_info[:internal_target_node]))
+        current_conf = obs.topo_vect[start:start + len(conf)]
+        topo_vect = obs.topo_vect.copy()
+        topo_vect[start:start + len(conf)] = np.where(conf > 0, conf, current_conf)
+        new_conf = topo_vect[start:start + len(conf)]
+
+        current_buses = set(current_conf[current_conf > 0])
+        new_buses = set(new_conf[new_conf > 0])
+        if len(current_buses) <= 1 and len(new_buses) <= 1:  # no split, flows are unchanged
+            return obs.p_or.copy()
+
+        line_or_bus, line_ex_bus, injections = get_dc_buses(obs, topo_vect)
+        if len(current_buses) == 1 and len(new_buses) == 2 and current_buses < new_buses:
+            # bus split of a substation on a single bus: low rank update of the DC powerflow
+            bus = internal_target_node + (min(current_buses) - 1) * obs.n_sub
+            new_bus = internal_target_node + (min(new_buses - current_buses) - 1) * obs.n_sub
+            moved_lines_or = np.flatnonzero(line_or_bus == new_bus)
+            moved_lines_ex = np.flatnonzero(line_ex_bus == new_bus)
+            new_flows = dc_powerflow.bus_split_flows(bus, moved_lines_or, moved_lines_ex, injections[new_bus])
+        else:
+            new_flows = DCPowerFlow(line_or_bus, line_ex_bus, dc_powerflow.susceptances, injections,
+                                    slack_bus=dc_powerflow.slack_bus).flows
+        return obs.p_or + new_flows - dc_powerflow.flows
+
+    def estimate_candidate_relief(self, node, topology):
+        obs = self.obs
+        try:
+            flows = self.estimate_candidate_flows(node, topology)
+        except ValueError:
+            return None
+        relief = self.get_estimated_relief(obs.p_or[self.ltc], obs.p_or[self.ltc] - flows[self.ltc])
+
+        # loading of all lines, assuming unchanged reactive flows
+        estimated_rho = estimate_rho(obs, flows)
+        n_new_overloads = int(np.sum((estimated_rho > 1) & (obs.rho <= 1)))
+        return relief, n_new_overloads
+
     def create_and_fill_internal_structures(self, obs, df):
         """This function fills multiple structures:
         self.substation_elements, self.substation_to_node_mapping, self.internal_to_external_mapping
@@ -392,20 +532,42 @@ class Grid2opSimulation(Simulation):
         #         print(d[key][key2])
         return d
 
-    def cut_lines_and_recomputes_flows(self, ids: list):
-        """This functions cuts lines: [ids], simulates and returns new line flows"""
+    def cut_lines_and_recomputes_flows(self, ids: list, approximate=None):
+        """This functions cuts lines: [ids], simulates and returns new line flows.
+        If approximate (by default approximateLineCut in alphadeesp parameters), new flows are computed from the
+        flows of the observation with the LODF of its DC approximation, instead of a powerflow. The exact simulation
+        is still used when the line cut islands part of the grid"""
+        if approximate is None:
+            approximate = bool(int(self.param_options.get("approximatelinecut", 0)))
 
-        # First, set parameter to avoid disconnection
-        self.obs._obs_env.no_overflow_disconnection = True
-        max_line_actions=self.obs._obs_env.parameters.MAX_LINE_STATUS_CHANGED
-
-        self.obs._obs_env.parameters.MAX_LINE_STATUS_CHANGED = 999
+        if approximate:
+            try:
+                new_flow = self.get_dc_powerflow().outage_flows(ids, flows=self.obs.p_or)
+            except ValueError as e:
+                logger.warning("%s. Line cut is simulated", e)
+            else:
+                # No observation after the line cut in that case
+                self.obs_linecut = None
+                self.line_status_linecut = self.obs.line_status.copy()
+                self.line_status_linecut[ids] = False
+                self.topo_linecut = dict(self.topo, edges=dict(self.topo["edges"], init_flows=new_flow))
+                return new_flow
+
+        session = self.get_simulation_session()
+        if session is not None:
+            result, reward, done, info = session.simulate(
+                self.action_space({"set_line_status": [(id_, -1) for id_ in ids]}))
+            self.line_cut_powerflows += 1
+            if not done:
+                self.obs_linecut = None
+                self.line_status_linecut = result.line_status
+                self.topo_linecut = dict(self.topo, edges=dict(self.topo["edges"], init_flows=result.p_or))
+                return result.p_or
 
-        # Set action which disconects the specified lines (by ids)
-        deconexion_action = self.action_space({"set_line_status": [(id_, -1) for id_ in ids]})
-        obs_linecut, reward, done, info = self.obs.simulate(deconexion_action)
         # Storage of new observation to access features in other function
-        self.obs_linecut = obs_linecut
+        self.obs_linecut = self.simulate_line_cut(ids)
+        self.line_cut_powerflows += 1
+        self.line_status_linecut = self.obs_linecut.line_status
         self.topo_linecut = self.extract_topo_from_obs(self.obs_linecut)
 
         # Get new flow simulated
@@ -414,11 +576,30 @@ class Grid2opSimulation(Simulation):
         # Graph building
         # self.g_pow_prime = self.build_powerflow_graph(self.obs_cutted)
 
+        return new_flow
+
+    def simulate_line_cut(self, ids: list):
+        """Simulates the disconnection of lines [ids] and returns the resulting observation"""
+        # First, set parameter to avoid disconnection
+        self.obs._obs_env.no_overflow_disconnection = True
+        max_line_actions=self.obs._obs_env.parameters.MAX_LINE_STATUS_CHANGED
+
+        self.obs._obs_env.parameters.MAX_LINE_STATUS_CHANGED = 999
+
+        # Set action which disconects the specified lines (by ids)
+        deconexion_action = self.action_space({"set_line_status": [(id_, -1) for id_ in ids]})
+        obs_linecut, reward, done, info = self.obs.simulate(deconexion_action)
+
         # Finaly, reset previous parameter
         self.obs._obs_env.no_overflow_disconnection = self.no_overflow_disc
         self.obs._obs_env.parameters.MAX_LINE_STATUS_CHANGED=max_line_actions
 
-        return new_flow
+        return obs_linecut
+
+    def get_n1_flows(self):
+        """(n_line, n_line) active flows of each line (row) after the outage of each line alone (column), estimated
+        from the flows of the observation with the LODF. Columns of outages islanding part of the grid are NaN"""
+        return self.get_dc_powerflow().n1_flows(flows=self.obs.p_or)
 
     def build_powerflow_graph_beforecut(self):
         """
@@ -433,7 +614,7 @@ class Grid2opSimulation(Simulation):
         Builds a graph of the grid and its powerflow after the lines have been cut
         :return: NetworkX Graph of representing the grid
         """
-        g = build_powerflow_graph(self.topo_linecut, self.obs_linecut)
+        g = build_powerflow_graph(self.topo_linecut, self.obs_linecut, line_status=self.line_status_linecut)
         return g
 
     def get_dataframe(self):
@@ -443,16 +624,28 @@ class Grid2opSimulation(Simulation):
         return self.df
 
     def isAntenna(self):
-        linesAtBusbar_dic = self.getLinesAtSubAndBusbar()
+        for ltc in self.ltc:
+            linesAtBusbar_dic = self.getLinesAtSubAndBusbar(ltc)
 
-        for sub in linesAtBusbar_dic.keys():
-            linesAtBusbar = linesAtBusbar_dic[sub]
-            if len(linesAtBusbar) <= 1:
-                return sub  # this is an Antenna
+            for sub in linesAtBusbar_dic.keys():
+                linesAtBusbar = linesAtBusbar_dic[sub]
+                if len(linesAtBusbar) <= 1:
+                    return sub  # this is an Antenna
         return None
 
     def isDoubleLine(self):
-        ltc = self.ltc[0]
+        double_lines = []
+        for ltc in self.ltc:
+            common_lines = self.get_parallel_lines(ltc)
+            double_lines += [l for l in common_lines if l not in double_lines]
+
+        if(len(double_lines)==0):
+            return None
+        else:
+            return double_lines
+
+    def get_parallel_lines(self, ltc):
+        """Returns the lines connecting the same substations as line ltc"""
         obs = self.obs
 
         sub_or = int(obs.line_or_to_subid[ltc])
@@ -469,15 +662,12 @@ class Grid2opSimulation(Simulation):
         lines_atSubEx = linesOr_atSubEx+linesEx_atSubEx
 
         Common_lines=[l for l in lines_atSubEx if (l in lines_atSubOr) and (l != ltc)]
-
-        if(len(Common_lines)==0):
-            return None
-        else:
-            return Common_lines
+        return Common_lines
 
 
-    def getLinesAtSubAndBusbar(self):
-        ltc = self.ltc[0]
+    def getLinesAtSubAndBusbar(self, ltc=None):
+        if ltc is None:
+            ltc = self.ltc[0]
         obs=self.obs
         linesAtBusbar_dic = {}
 
@@ -571,7 +761,10 @@ class Grid2opSimulation(Simulation):
         Plots the grid with Grid2op PlotHelper for Observations, after lines have been cut
         :return: Figure
         """
-        return self.plot_grid(self.obs_linecut, name = "g_pow_prime")
+        obs_linecut = self.obs_linecut
+        if obs_linecut is None:  # flows after line cut were approximated, the plot needs the simulated observation
+            obs_linecut = self.simulate_line_cut(self.ltc + self.other_ltc)
+        return self.plot_grid(obs_linecut, name = "g_pow_prime")
 
     def plot_grid_delta(self):
         """
@@ -587,6 +780,20 @@ class Grid2opSimulation(Simulation):
         """
         return self.plot_grid(obs, name=name)
 
+    def plot_simulated_states(self):
+        """Plots the simulated states kept in save bag. With several plotWorkers and gridPath in alphadeesp parameters,
+        they are drawn concurrently on the worker processes of the printer. Only the observation vectors are sent to
+        the workers, which rebuild the observations with the observation space of their own environment of the grid"""
+        states = list(self.save_bag)
+        grid_path = self.param_options.get("gridpath")
+        if grid_path is None or min(self.printer.workers, len(states)) <= 1:
+            return super().plot_simulated_states()
+        filenames = [self.printer.create_namefile("geo", name=name, type="results")[1] for name, obs in states]
+        self.printer.map_on_workers(plot_observation_in_worker, [grid_path] * len(states),
+                                    [self.param_options.get("grid2opdifficulty")] * len(states),
+                                    [obs.to_vect() for name, obs in states], filenames)
+        return filenames
+
     def plot_grid(self, obs, name):
         type_ = "results"
         if name in ["g_pow", "g_overflow_print", "g_pow_prime"]:
@@ -597,8 +804,11 @@ class Grid2opSimulation(Simulation):
             self.printer.display_geo(g_over, self.get_layout(), name=name)
         else:   # Use grid2op plot functionalities to plot all other graphs
             output_name = self.printer.create_namefile("geo", name = name, type = type_)
-            fig_obs = self.plot_helper.plot_obs(obs, line_info='p')
+            fig_obs = self.get_plot_helper().plot_obs(obs, line_info='p')
             fig_obs.savefig(output_name[1])
+            # figures are only saved, not to accumulate them in batch runs
+            import matplotlib.pyplot as plt
+            plt.close(fig_obs)
 
     def change_nodes_configurations(self, new_configurations, node_ids, env):
         change = []
@@ -611,12 +821,30 @@ class Grid2opSimulation(Simulation):
         return new_obs
 
 
-def build_powerflow_graph(topo, obs):
-    """This function takes a Grid2op Observation and returns a NetworkX Graph"""
+def plot_observation_in_worker(grid_path, difficulty, observation_vector, filename):
+    """Plots the observation of vector observation_vector with Grid2op PlotMatplot to filename, in a worker process
+    whose environment of the grid is created on first call"""
+    import matplotlib.pyplot as plt
+    from grid2op.PlotGrid import PlotMatplot
+    from alphaDeesp.core.grid2op.Grid2opObservationLoader import get_cached_loader
+
+    observation_space = get_cached_loader(grid_path, difficulty=difficulty).env.observation_space
+    obs = observation_space.from_vect(observation_vector)
+    fig_obs = PlotMatplot(observation_space).plot_obs(obs, line_info='p')
+    fig_obs.savefig(filename)
+    # figures are only saved, not to accumulate them in the worker
+    plt.close(fig_obs)
+
+
+def build_powerflow_graph(topo, obs, line_status=None):
+    """This function takes a Grid2op Observation and returns a NetworkX Graph.
+    line_status overrides the line status of the observation, which can then be None"""
     g = nx.MultiDiGraph()
 
     # Get the id of lines that are disconnected from network
-    lines_cut = np.argwhere(obs.line_status == False)[:, 0]
+    if line_status is None:
+        line_status = obs.line_status
+    lines_cut = np.argwhere(line_status == False)[:, 0]
 
     # Get the whole topology information
     idx_or = topo["edges"]['idx_or']
@@ -646,7 +874,7 @@ def build_nodes(g, are_prods, are_loads, prods_values, loads_values, debug=False
         load = next(loads_iter) if is_load else 0.
         prod_minus_load = prod - load
         if debug:
-            print(f"Node n°[{i}] : Production value: [{prod}] - Load value: [{load}] ")
+            logger.debug("Node n°[%s] : Production value: [%s] - Load value: [%s]", i, prod, load)
         if prod_minus_load > 0:  # PROD
             g.add_node(i, pin=True, prod_or_load="prod", value=str(prod_minus_load), style="filled",
                        fillcolor="#f30000")  # red color
@@ -905,3 +1133,54 @@ def score_changes_between_two_observations(ltc, old_obs, new_obs,nb_timestep_coo
 
     else:
         raise ValueError("Probleme with Scoring")
+
+
+def build_dc_powerflow(obs):
+    """DC approximation of the grid state of a Grid2op Observation"""
+    line_or_bus, line_ex_bus, injections = get_dc_buses(obs, obs.topo_vect)
+    return DCPowerFlow(line_or_bus, line_ex_bus, get_line_susceptances(obs), injections)
+
+
+def get_dc_buses(obs, topo_vect):
+    """Returns the buses of line origins and extremities, and the injections of each bus, for a topo_vect of the grid
+    of obs. Bus b of substation s is numbered s + (b - 1) * n_sub"""
+    n_sub = obs.n_sub
+
+    def get_buses(pos_topo_vect, to_subid):
+        bus = topo_vect[pos_topo_vect]
+        return np.where(bus > 0, to_subid + (bus - 1) * n_sub, -1)
+
+    line_or_bus = get_buses(obs.line_or_pos_topo_vect, obs.line_or_to_subid)
+    line_ex_bus = get_buses(obs.line_ex_pos_topo_vect, obs.line_ex_to_subid)
+    gen_bus = get_buses(obs.gen_pos_topo_vect, obs.gen_to_subid)
+    load_bus = get_buses(obs.load_pos_topo_vect, obs.load_to_subid)
+    injections = np.zeros(n_sub * max(2, int(np.max(topo_vect))))
+    np.add.at(injections, gen_bus[gen_bus >= 0], obs.prod_p[gen_bus >= 0])
+    np.subtract.at(injections, load_bus[load_bus >= 0], obs.load_p[load_bus >= 0])
+    return line_or_bus, line_ex_bus, injections
+
+
+def get_line_susceptances(obs):
+    """Line susceptances estimated from the active flows and voltage angles of the observation (p = b * dtheta).
+    Lines for which it cannot be estimated get the median susceptance"""
+    susceptances = np.full(obs.n_line, np.nan)
+    if getattr(obs, "theta_or", None) is not None:
+        delta_theta = np.radians(obs.theta_or - obs.theta_ex)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            estimated = obs.p_or / delta_theta
+        valid = obs.line_status & (np.abs(delta_theta) > 1e-6) & (estimated > 0)
+        susceptances[valid] = estimated[valid]
+    known = ~np.isnan(susceptances)
+    susceptances[~known] = np.median(susceptances[known]) if known.any() else 1.
+    return susceptances
+
+
+def estimate_rho(obs, flows):
+    """Line loadings estimated for new active flows (n_line,) or (n_line, n_case), assuming unchanged reactive flows"""
+    q_or = obs.q_or if np.ndim(flows) == 1 else obs.q_or[:, None]
+    p_or = obs.p_or if np.ndim(flows) == 1 else obs.p_or[:, None]
+    rho = obs.rho if np.ndim(flows) == 1 else obs.rho[:, None]
+    apparent_flows_before = np.sqrt(p_or ** 2 + q_or ** 2)
+    apparent_flows_after = np.sqrt(flows ** 2 + q_or ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(apparent_flows_before > 0, rho * apparent_flows_after / apparent_flows_before, rho)
@@ -0,0 +1,142 @@
+"""Simulation session: simulates candidate actions on the grid state of an observation without going through
+obs.simulate, on a pool of backend copies prepared once for the whole analysis."""
+
+import logging
+import queue
+import threading
+
+import numpy as np
+
+from alphaDeesp.core.records import SimulationRecord
+
+logger = logging.getLogger(__name__)
+
+
+class Grid2opSimulationSession:
+    """Simulates actions on the grid state of obs with copies of the backend of its observation environment.
+    For each action, the base state of obs and the action are applied to an idle backend of the pool, and a powerflow is
+    run. As with no_overflow_disconnection, lines are never disconnected for overflows, and no legality checks are
+    made. Several backends allow concurrent simulations from different threads.
+    With warm_start, every powerflow starts from the solution of the base case (LightSim and PandaPower backends)"""
+
+    def __init__(self, obs, n_backends=1, warm_start=True):
+        obs_env = obs._obs_env
+        self.obs = obs
+        self.backend_action_class = obs_env._backend_action_class
+        # Action setting the backend to the grid state of obs: topology and injections
+        self.base_action = obs_env._helper_action_env({
+            "injection": {"prod_p": obs.prod_p, "prod_v": obs.prod_v, "load_p": obs.load_p, "load_q": obs.load_q},
+            "set_bus": obs.topo_vect})
+        self.no_disconnection = np.zeros(obs.n_line, dtype=bool)
+        # Newton-Raphson iterations of the simulations in completion order, for the convergence report (None if the
+        # backend does not report it, or if it diverged). Iterations of each candidate are in info["iterations"]
+        self.iterations = []
+        self.n_diverged = 0
+        # simulations run from several threads update the statistics
+        self.statistics_lock = threading.Lock()
+
+        self.backends = queue.Queue()
+        self.base_voltages = None
+        for i in range(n_backends):
+            backend = obs_env.backend.copy()
+            if warm_start and self.base_voltages is None:
+                # Solution of the base case, used as starting point of every candidate powerflow
+                if self.run_powerflow(backend, None) is not None:
+                    self.base_voltages = get_voltages(backend)
+            self.backends.put(backend)
+
+    def simulate(self, action):
+        """Same returns as obs.simulate(action, time_step=0), the observation being a SimulationRecord.
+        info also gives the number of powerflow iterations"""
+        backend = self.backends.get()
+        try:
+            result = self.run_powerflow(backend, action)
+            iterations = get_iterations(backend) if result is not None else None
+        finally:
+            self.backends.put(backend)
+
+        done = result is None
+        with self.statistics_lock:
+            self.iterations.append(iterations)
+            self.n_diverged += int(done)
+        if done:  # Game over, as for obs.simulate flows are all null
+            zeros = np.zeros(self.obs.n_line)
+            result = SimulationRecord(zeros, zeros, zeros, np.zeros(self.obs.n_gen), np.zeros(self.obs.n_load),
+                                      np.zeros(self.obs.n_line, dtype=bool), self.obs.time_before_cooldown_line)
+        info = {"disc_lines": self.no_disconnection, "rewards": {}, "exception": [], "iterations": iterations}
+        return result, None, done, info
+
+    def run_powerflow(self, backend, action):
+        """Applies the base state and action to backend and runs the powerflow, warm started from the base case
+        solution if available. Returns None if it diverges"""
+        backend_action = self.backend_action_class()
+        backend_action += self.base_action
+        if action is not None:
+            backend_action += action
+        try:
+            backend.apply_action(backend_action)
+            set_voltages(backend, self.base_voltages)
+            converged = backend.runpf(is_dc=False)
+        except Exception as e:  # grid2op raises on divergence or islanding, depending on the backend
+            logger.warning("powerflow failed in simulation session: %s", e)
+            return None
+        if isinstance(converged, tuple):  # (converged, exception) for recent grid2op versions
+            converged = converged[0]
+        if not converged:
+            return None
+
+        p_or, q_or, v_or, a_or = backend.lines_or_info()
+        p_ex, q_ex, v_ex, a_ex = backend.lines_ex_info()
+        prod_p, prod_q, prod_v = backend.generators_info()
+        load_p, load_q, load_v = backend.loads_info()
+        return SimulationRecord(backend.get_relative_flow(), p_or, p_ex, prod_p, load_p, backend.get_line_status(),
+                                self.obs.time_before_cooldown_line)
+
+    def close(self):
+        """Closes the backend copies of the pool"""
+        while not self.backends.empty():
+            self.backends.get_nowait().close()
+        self.obs = None
+
+    def get_convergence_report(self):
+        """Number of simulations and divergences, and powerflow iterations statistics over the simulations"""
+        with self.statistics_lock:
+            all_iterations = list(self.iterations)
+            n_diverged = self.n_diverged
+        iterations = [n for n in all_iterations if n is not None]
+        return {"simulations": len(all_iterations),
+                "diverged": n_diverged,
+                "warm start": self.base_voltages is not None,
+                "mean iterations": float(np.mean(iterations)) if iterations else None,
+                "max iterations": int(np.max(iterations)) if iterations else None}
+
+
+def get_voltages(backend):
+    """Solved voltages of the last powerflow of backend, to warm start the next ones. None if not supported"""
+    if getattr(backend, "V", None) is not None:  # LightSimBackend: complex voltages of the buses
+        return backend.V.copy()
+    res_bus = getattr(getattr(backend, "_grid", None), "res_bus", None)
+    if res_bus is not None and len(res_bus):  # PandaPowerBackend: pandapower results
+        return res_bus[["vm_pu", "va_degree"]].copy()
+    return None
+
+
+def set_voltages(backend, voltages):
+    """Sets the starting point of the next powerflow of backend"""
+    if voltages is None:
+        return
+    if getattr(backend, "V", None) is not None:
+        backend.V[:] = voltages
+    else:
+        backend._grid.res_bus[["vm_pu", "va_degree"]] = voltages
+        backend._pf_init = "results"
+
+
+def get_iterations(backend):
+    """Newton-Raphson iterations of the last powerflow of backend, None if the backend does not report it"""
+    try:
+        if getattr(backend, "V", None) is not None:
+            return int(backend._grid.get_solver().get_nb_iter())
+        return int(backend._grid._ppc["iterations"])
+    except (AttributeError, KeyError, TypeError):
+        return None
@@ -1,19 +1,25 @@
-"""This file contains all the possible displays for graph from NetworkX"""
+"""This file contains all the possible displays for graph from NetworkX, rendered to files without any viewer"""
 
-import os
-import pprint
 import datetime
-import networkx as nx
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
 
-from alphaDeesp.core import alphadeesp
+logger = logging.getLogger(__name__)
 
-from pathlib import Path
+# graphs of the grid before simulating topologies, saved apart from the results
+BASE_GRAPHS = ["g_pow", "g_overflow_print", "g_pow_prime"]
+# layouts computed for grids without custom layout, one JSON file per grid
+LAYOUT_CACHE_FOLDER = "alphaDeesp/ressources/output/layouts"
 
 
 class Printer:
     save_id_number = 0
 
-    def __init__(self, output_path = None):
+    def __init__(self, output_path = None, workers=1, layout_file=None):
         if output_path is None:
             self.default_output_path = "alphaDeesp/ressources/output"
         else:
@@ -22,84 +28,54 @@ class Printer:
         os.makedirs(self.base_output_path, exist_ok=True)
         self.results_output_path = os.path.join(self.default_output_path,"Result graph")
         os.makedirs(self.results_output_path, exist_ok=True)
-        print("self.default output path = ", self.default_output_path)
+        # processes rendering graphs in display_geo_all, one per CPU if 0
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        # node positions, computed once for all the plots
+        self.layouts = {}
+        self.layout_file = layout_file
+        logger.debug("Printer output path: %s", self.default_output_path)
 
     def display_geo(self, g, custom_layout=None, axial_symetry=False, save=False, name=None):
-        """This function displays the graph g in a "geographical" way"""
-
-        "filenames are pathlib.Paths objects"
+        """This function renders the graph g in a "geographical" way to a pdf file, without opening any viewer.
+        Nodes are placed on custom_layout if given, else on a layout computed once for the grid. Returns the pdf
+        filename"""
         type_ = "results"
-        if name in ["g_pow", "g_overflow_print", "g_pow_prime"]:
+        if name in BASE_GRAPHS:
             type_ = "base"
         filename_dot, filename_pdf = self.create_namefile("geo", name=name, type = type_)
-
-        dic_pos_attributes = {}
-        if custom_layout is not None:
-            custom_layout2 = {
-                '6661': (-280, -151),
-                '6662': (-100, -340),
-                '6663': (366, -340),
-                '6664': (390, -110),
-                '6665': (-14, -74),
-                '6666': (-184, 54),
-                '6667': (400, -80),
-                '6668': (438, 100),
-                '6669': (326, 140),
-                '66610': (200, 8),
-                '66611': (79, 12),
-                '66612': (-152, 170),
-                '66613': (-70, 200),
-                '66614': (222, 200)
-            }
-            assert isinstance(custom_layout, list) is True
-            # we create a dictionary to add a position attribute to the nodes
-            ii = 0
-            for i, value in enumerate(custom_layout):
-                # i += 1
-                # print(f"i:{i} value:{value}")
-                if i < len(custom_layout):
-                    dic_pos_attributes[i] = {"pos": (str(value[0]) + ", " + str(value[1]) + "!")}
-                else:
-                    i = int("666" + str(ii))
-                    dic_pos_attributes[i] = {"pos": (str(value[0]) + ", " + str(value[1]) + "!")}
-                    ii += 1
-
-            # we update the graph with some specific position
-            nx.set_node_attributes(g, dic_pos_attributes)
-
-        # print("############### debug in Printer ###############")
-        # pprint.pprint(dic_pos_attributes)
-
-        nx.drawing.nx_pydot.write_dot(g, filename_dot)
-
-        if custom_layout is None:
-            cmd_line = 'neato -Tpdf "' + str(filename_dot) + '" -o "' + str(filename_pdf) + '"'
-        else:
-            cmd_line = 'neato -n -Tpdf "' + str(filename_dot) + '" -o "' + str(filename_pdf) + '"'
-        print("we print the cmd line = ", cmd_line)
-
-        assert alphadeesp.execute_command(cmd_line)
-
-        # os.system(cmd_line)
-
-        cmd_line = f"evince {str(filename_pdf)} &"
-        os.system(cmd_line)
-
-        # try:
-        #     alphadeesp.execute_command(cmd_line)
-        # except RuntimeError:
-        #     print("A problem while executing a command occured.")
-
-        os.system(cmd_line)
-        os.system("evince " + str(filename_pdf) + " &")
-
-        # if save is False:
-        #     assert(alphadeesp.execute_command(f"rm {filename_dot}"))
-        #     assert(alphadeesp.execute_command(f"rm {filename_pdf}"))
-
-        # if save is False:
-        #     os.system("rm " + filename_dot)
-        #     os.system("rm " + filename_pdf)
+        render_graph(g, filename_dot, filename_pdf, self.get_layout(g, custom_layout).get_positions(g))
+        return filename_pdf
+
+    def display_geo_all(self, graphs, custom_layout=None):
+        """Renders the (name, graph) pairs as display_geo, concurrently on the worker processes of the printer.
+        Returns the pdf filenames, in order"""
+        filenames = [self.create_namefile("geo", name=name, type="base" if name in BASE_GRAPHS else "results")
+                     for name, g in graphs]
+        # positions are given to the workers, which then only render
+        self.map_on_workers(render_graph, [g for name, g in graphs], [dot for dot, pdf in filenames],
+                            [pdf for dot, pdf in filenames],
+                            [self.get_layout(g, custom_layout).get_positions(g) for name, g in graphs])
+        return [pdf for dot, pdf in filenames]
+
+    def map_on_workers(self, function, *arguments):
+        """Returns the list of function(*args) for each args of zip(*arguments), the calls being made concurrently on
+        the worker processes of the printer if more than one. function and arguments have to be picklable"""
+        n_workers = min(self.workers, len(arguments[0]))
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                return list(pool.map(function, *arguments))
+        return list(map(function, *arguments))
+
+    def get_layout(self, g, custom_layout=None):
+        """GraphLayout of custom_layout, or computed from g (and stored in the layout file of the printer) if None.
+        It is created on first use, and reused for all further plots"""
+        key = tuple(tuple(position) for position in custom_layout) if custom_layout is not None else None
+        if key not in self.layouts:
+            if custom_layout is not None:
+                self.layouts[key] = GraphLayout.from_custom_layout(custom_layout, get_number_of_substations(g))
+            else:
+                self.layouts[key] = GraphLayout.load_or_compute(g, self.layout_file)
+        return self.layouts[key]
 
     def display_elec(self, g, save=False):
         pass
@@ -116,7 +92,6 @@ class Printer:
 
         if name is None:
             name = ""
-        print("name = ", name)
         filename_dot = name + "_" + display_type + "_" + current_date + ".dot"
         filename_pdf = name + "_" + display_type + "_" + current_date + ".pdf"
 
@@ -130,11 +105,133 @@ class Printer:
         # hard_filename_dot = filename_dot
         hard_filename_pdf = os.path.join(output_path,filename_pdf)
 
-        print("============================= FUNCTION create_namefile =============================")
-        print("hard_filename = ", hard_filename_pdf)
+        logger.debug("Plot file: %s", hard_filename_pdf)
 
         return hard_filename_dot, hard_filename_pdf
 
 
-def shell_print_project_header():
-    os.system("cat ./print_header.txt")
+class GraphLayout:
+    """Positions of the nodes of the plots of a grid, in points. Substation i is at substations[i], and twin node
+    666i (second busbar of substation i) at twins[i] if given, else next to its substation"""
+
+    def __init__(self, substations, twins=None):
+        self.substations = [tuple(position) for position in substations]
+        self.twins = {int(sub): tuple(position) for sub, position in (twins or {}).items()}
+        xs = [x for x, y in self.substations]
+        ys = [y for x, y in self.substations]
+        span = max(max(xs) - min(xs), max(ys) - min(ys)) if self.substations else 0
+        self.twin_offset = max(20., 0.02 * span)
+
+    @classmethod
+    def from_custom_layout(cls, custom_layout, n_sub):
+        """Layout of the positions of custom_layout. Positions after the n_sub first ones are the positions of the
+        twin nodes of the substations, in order, as in the layout of the 14 substations grid"""
+        assert isinstance(custom_layout, list) is True
+        n_sub = min(n_sub, len(custom_layout)) if n_sub else len(custom_layout)
+        return cls(custom_layout[:n_sub], dict(enumerate(custom_layout[n_sub:2 * n_sub])))
+
+    @classmethod
+    def compute(cls, g):
+        """Kamada-Kawai layout of the substations of graph g, scaled to about 100 points between neighbours"""
+        # networkx is only needed when something gets drawn
+        import networkx as nx
+
+        n_sub = get_number_of_substations(g)
+        graph = nx.Graph()
+        graph.add_nodes_from(range(n_sub))
+        graph.add_edges_from((get_substation(u), get_substation(v)) for u, v in g.edges())
+        positions = nx.kamada_kawai_layout(graph, scale=50. * max(n_sub, 1) ** 0.5)
+        return cls([(float(positions[sub][0]), float(positions[sub][1])) for sub in range(n_sub)])
+
+    @classmethod
+    def load_or_compute(cls, g, filename=None):
+        """Layout stored in filename if it has the substations of g, else computed from g and stored in filename"""
+        n_sub = get_number_of_substations(g)
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as f:
+                layout = cls(**json.load(f))
+            if len(layout.substations) == n_sub:
+                return layout
+            logger.info("Layout of %s is not the one of the grid, it is computed again", filename)
+        layout = cls.compute(g)
+        if filename is not None:
+            os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+            with open(filename, "w") as f:
+                json.dump({"substations": layout.substations, "twins": layout.twins}, f)
+        return layout
+
+    def get_position(self, node):
+        """Position of node, None if unknown"""
+        sub = get_substation(node)
+        if sub is None or sub >= len(self.substations):
+            return None
+        if sub == node:
+            return self.substations[sub]
+        if sub in self.twins:
+            return self.twins[sub]
+        x, y = self.substations[sub]
+        return x + self.twin_offset, y - self.twin_offset
+
+    def get_positions(self, g):
+        """Positions of the nodes of g, the nodes of unknown position being left out"""
+        positions = {node: self.get_position(node) for node in g.nodes()}
+        return {node: position for node, position in positions.items() if position is not None}
+
+
+def get_substation(node):
+    """Substation of a node of a grid graph: node itself, or XX for a twin node 666XX. None if it is not a substation"""
+    try:
+        node = int(node)
+    except (TypeError, ValueError):
+        return None
+    name = str(node)
+    if name.startswith("666") and len(name) > 3:
+        return int(name[3:])
+    return node
+
+
+def get_number_of_substations(g):
+    """Number of substations of a grid graph, from the largest substation of its nodes"""
+    return max((sub + 1 for sub in map(get_substation, g.nodes()) if sub is not None), default=0)
+
+
+def get_layout_file(grid_path):
+    """File where the layout computed for the grid of grid_path is stored, None without grid path"""
+    if not grid_path:
+        return None
+    return os.path.join(LAYOUT_CACHE_FOLDER, os.path.basename(os.path.normpath(grid_path)) + ".json")
+
+
+def render_graph(g, filename_dot, filename_pdf, positions=None):
+    """Writes graph g to filename_dot and renders it with neato to filename_pdf. Nodes are pinned to their positions
+    if given, neato only laying out the graph when some of them are missing. Rendering is made in process with
+    pygraphviz if installed, else by running the neato executable"""
+    # networkx is only needed when something gets drawn
+    import networkx as nx
+
+    positions = positions or {}
+    # position attribute of the nodes, pinned with "!"
+    nx.set_node_attributes(g, {node: {"pos": "%s, %s!" % (x, y)} for node, (x, y) in positions.items()})
+    neato_args = "-n" if positions and len(positions) == g.number_of_nodes() else ""
+
+    if importlib.util.find_spec("pygraphviz") is None:
+        nx.drawing.nx_pydot.write_dot(g, filename_dot)
+        command = ["neato"] + neato_args.split() + ["-Tpdf", str(filename_dot), "-o", str(filename_pdf)]
+        logger.debug("Rendering %s with %s", filename_dot, " ".join(command))
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError("neato failed to render {}: {}".format(filename_dot, completed.stderr))
+    else:
+        graph = nx.nx_agraph.to_agraph(g)
+        graph.write(str(filename_dot))
+        graph.draw(str(filename_pdf), format="pdf", prog="neato", args=neato_args)
+    return filename_pdf
+
+
+def shell_print_project_header(header_path="./print_header.txt"):
+    """Prints the project header without spawning a subprocess"""
+    try:
+        with open(header_path) as header_file:
+            print(header_file.read())
+    except OSError:
+        pass
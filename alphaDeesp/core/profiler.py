@@ -0,0 +1,385 @@
+"""Per stage instrumentation of the expert system: wall time, CPU time, peak memory and counters.
+
+    profiler = Profiler(trace_memory=True)
+    with profiler.stage("simulation"):
+        ...
+    profiler.count("candidates simulated", len(actions))
+    report = profiler.report()
+
+A disabled profiler (the default of simulations) does nothing: stage returns a shared no-op context manager and
+count returns at once, so that instrumented code costs next to nothing when not profiled.
+
+For a call stack level view of one analysis, profile_call runs it under cProfile or under SamplingProfiler, and writes
+a collapsed stack file (input of flamegraph.pl, speedscope...) and a summary of the hotspots to a folder:
+
+    result, paths = profile_call(expert_operator, sim, output_folder=plot_folder, method="sampling")
+"""
+
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import contextlib
+import functools
+import types
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+
+class Profiler:
+    """Records, for each stage, its number of calls, wall time and CPU time in seconds, plus counters. Stages may be
+    nested. With trace_memory, allocations are traced with tracemalloc: each stage also gets its peak memory (largest
+    amount allocated during one call) and its retained memory (allocated and not freed, over all calls) in bytes, and
+    the sizes of the largest structures and allocation sites can be recorded (record_structures, record_allocations)"""
+
+    def __init__(self, enabled=True, trace_memory=False):
+        if trace_memory and not hasattr(tracemalloc, "reset_peak"):
+            # peaks of the stages are measured by resetting the tracemalloc peak, added in Python 3.9
+            raise RuntimeError("Memory tracing of the stages needs Python 3.9 or later")
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counters = {}
+        self.structures = {}
+        self.allocations = []
+        self._started_tracemalloc = False
+        self._open_stages = []
+
+    def stage(self, name):
+        """Context manager recording the execution of a stage, accumulated over its calls"""
+        if not self.enabled:
+            return _NO_STAGE
+        return self._stage(name)
+
+    @contextlib.contextmanager
+    def _stage(self, name):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            # peak of the enclosing stages so far, then peak of this stage only
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in self._open_stages:
+                frame["peak"] = max(frame["peak"], peak)
+            tracemalloc.reset_peak()
+            frame = {"start": current, "peak": current}
+            self._open_stages.append(frame)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = time.process_time() - start_cpu
+            peak_memory = None
+            retained_memory = None
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                frame["peak"] = max(frame["peak"], peak)
+                self._open_stages.remove(frame)
+                if self._open_stages:
+                    self._open_stages[-1]["peak"] = max(self._open_stages[-1]["peak"], frame["peak"])
+                peak_memory = frame["peak"] - frame["start"]
+                retained_memory = current - frame["start"]
+            self.record(name, wall_time, cpu_time, peak_memory, retained_memory)
+
+    def profile(self, name=None):
+        """Decorator recording each call of a function as a stage, named after the function by default"""
+        def decorator(function):
+            stage_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, wall_time, cpu_time=None, peak_memory=None, retained_memory=None):
+        """Adds one call of a stage measured elsewhere (e.g. AlphaDeesp.timings), cpu_time and memories being
+        unknown if None"""
+        if not self.enabled:
+            return
+        stage = self.stages.setdefault(name, {"calls": 0, "wall_time": 0., "cpu_time": None, "peak_memory": None,
+                                              "retained_memory": None})
+        stage["calls"] += 1
+        stage["wall_time"] += wall_time
+        if cpu_time is not None:
+            stage["cpu_time"] = (stage["cpu_time"] or 0.) + cpu_time
+        if peak_memory is not None:
+            stage["peak_memory"] = max(stage["peak_memory"] or 0, peak_memory)
+        if retained_memory is not None:
+            stage["retained_memory"] = (stage["retained_memory"] or 0) + retained_memory
+
+    def record_structures(self, objects):
+        """With trace_memory, records the deep size of each attribute of the given objects, {name: object}, as
+        "name.attribute". Attributes sharing objects (e.g. a graph and a dataframe it was built from) are each
+        counted with the shared objects"""
+        if not self.enabled or not self.trace_memory:
+            return
+        for name, obj in objects.items():
+            for attribute, value in vars(obj).items():
+                if not isinstance(value, Profiler):
+                    self.structures[name + "." + attribute] = deep_sizeof(value)
+
+    def record_allocations(self, top=10):
+        """With trace_memory, records the top allocation sites of the memory currently traced, as
+        {"site": file:line, "size": bytes, "count": number of blocks}"""
+        if not self.enabled or not self.trace_memory or not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        self.allocations = [{"site": "{}:{}".format(stat.traceback[0].filename, stat.traceback[0].lineno),
+                             "size": stat.size, "count": stat.count}
+                            for stat in snapshot.statistics("lineno")[:top]]
+
+    def count(self, name, n=1):
+        """Increments counter name by n"""
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def stop(self):
+        """Stops memory tracing if this profiler started it"""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def report(self, top=10):
+        """Structured report: {"stages": {name: {calls, wall_time, cpu_time, peak_memory, retained_memory}},
+        "counters": {name: n}}. With trace_memory, also the top largest recorded structures, as a list of
+        {"name": name, "size": bytes}, and the recorded allocation sites"""
+        report = {"stages": {name: dict(stage) for name, stage in self.stages.items()},
+                  "counters": dict(self.counters)}
+        if self.trace_memory:
+            largest = sorted(self.structures.items(), key=lambda structure: -structure[1])[:top]
+            report["structures"] = [{"name": name, "size": size} for name, size in largest]
+            report["allocations"] = list(self.allocations)
+        return report
+
+    def to_json(self, **kwargs):
+        return report_to_json(self.report(), **kwargs)
+
+    def to_prometheus(self, prefix="alphadeesp", labels=None):
+        return report_to_prometheus(self.report(), prefix=prefix, labels=labels)
+
+
+def report_to_json(report, **kwargs):
+    """JSON text of a Profiler report"""
+    return json.dumps(report, **kwargs)
+
+
+def report_to_prometheus(report, prefix="alphadeesp", labels=None):
+    """Prometheus text exposition of a Profiler report. Stage metrics are labelled with the stage name, and with the
+    given labels (e.g. {"contingency": "9"}) as all other metrics"""
+    labels = labels or {}
+    metrics = [("stage_calls", "calls", "Number of calls of the stage", "counter"),
+               ("stage_wall_seconds", "wall_time", "Wall time spent in the stage", "counter"),
+               ("stage_cpu_seconds", "cpu_time", "CPU time spent in the stage", "counter"),
+               ("stage_peak_memory_bytes", "peak_memory", "Peak memory allocated during the stage", "gauge"),
+               ("stage_retained_memory_bytes", "retained_memory", "Memory allocated and not freed by the stage",
+                "gauge")]
+    lines = []
+    for metric, key, description, metric_type in metrics:
+        samples = [(name, stage[key]) for name, stage in report["stages"].items() if stage[key] is not None]
+        if not samples:
+            continue
+        lines.append("# HELP {}_{} {}".format(prefix, metric, description))
+        lines.append("# TYPE {}_{} {}".format(prefix, metric, metric_type))
+        for name, value in samples:
+            lines.append("{}_{}{} {}".format(prefix, metric, _format_labels(dict(labels, stage=name)), value))
+    if report.get("structures"):
+        lines.append("# HELP {}_structure_bytes Deep size of the structure".format(prefix))
+        lines.append("# TYPE {}_structure_bytes gauge".format(prefix))
+        for structure in report["structures"]:
+            lines.append("{}_structure_bytes{} {}".format(prefix, _format_labels(dict(labels, structure=structure["name"])),
+                                                          structure["size"]))
+    for name, value in report["counters"].items():
+        metric = "{}_{}_total".format(prefix, _metric_name(name))
+        lines.append("# TYPE {} counter".format(metric))
+        lines.append("{}{} {}".format(metric, _format_labels(labels), value))
+    return "\n".join(lines) + "\n"
+
+
+def deep_sizeof(obj):
+    """Approximate size in bytes of obj and of all the objects it references (containers, instance attributes, NumPy
+    arrays, pandas objects), each object being counted once. Classes, modules and functions are not followed"""
+    seen = set()
+    size = 0
+    to_visit = [obj]
+    while to_visit:
+        o = to_visit.pop()
+        if id(o) in seen or isinstance(o, (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)):
+            continue
+        seen.add(id(o))
+        if isinstance(o, (pd.DataFrame, pd.Series, pd.Index)):
+            size += int(np.sum(o.memory_usage(deep=True)))
+            continue
+        size += sys.getsizeof(o)
+        if isinstance(o, np.ndarray):
+            if o.dtype == object:
+                to_visit.extend(o.ravel())
+            elif o.base is not None and not isinstance(o.base, bytes):
+                to_visit.append(o.base)
+            continue
+        if isinstance(o, dict):
+            to_visit.extend(o.keys())
+            to_visit.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            to_visit.extend(o)
+        if hasattr(o, "__dict__"):
+            to_visit.append(o.__dict__)
+        slots = getattr(type(o), "__slots__", ())
+        for slot in (slots,) if isinstance(slots, str) else slots:
+            if hasattr(o, slot):
+                to_visit.append(getattr(o, slot))
+    return size
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name.lower())
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = ('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+               for key, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+_NO_STAGE = contextlib.nullcontext()
+
+
+class SamplingProfiler:
+    """Samples the call stack of the thread starting the profiler every interval seconds from a background thread.
+    Samples are counted per stack, as tuples of frame labels from the outermost call below the one starting the
+    profiler. As the sampling thread needs the GIL, the switch interval of the interpreter is lowered to the sampling
+    interval while sampling"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread_id = None
+        self.samples = Counter()
+        self._root_depth = 0
+        self._switch_interval = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        # frames of the caller and above are left out of the samples
+        caller = sys._getframe(1)
+        if caller.f_code is SamplingProfiler.__enter__.__code__:
+            caller = caller.f_back
+        self._root_depth = 0
+        while caller is not None:
+            self._root_depth += 1
+            caller = caller.f_back
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample, name="alphadeesp-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            # the profiled thread may already be stopping the profiler
+            if self._stop_event.is_set():
+                break
+            stack = stack[::-1][self._root_depth:]
+            if stack:
+                self.samples[tuple(stack)] += 1
+
+    def write_collapsed(self, path):
+        """Writes the samples in collapsed stack format, one "outer;...;inner count" line per stack"""
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write("{} {}\n".format(";".join(stack), count))
+
+    def hotspots(self, top=20):
+        """Summary of the top functions by own samples (time spent in the function itself) and by total samples
+        (time spent in the function and its callees)"""
+        n_samples = sum(self.samples.values())
+        own = Counter()
+        total = Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        lines = ["{} samples every {}s".format(n_samples, self.interval)]
+        for title, counter in [("own time", own), ("total time", total)]:
+            lines.append("")
+            lines.append("Top {} functions by {}:".format(top, title))
+            for label, count in counter.most_common(top):
+                lines.append("{:7.2%} {:7d}  {}".format(count / max(n_samples, 1), count, label))
+        return "\n".join(lines) + "\n"
+
+
+def profile_call(function, *args, output_folder, method="sampling", top=20, interval=0.005, name="profile",
+                 **kwargs):
+    """Runs function(*args, **kwargs) under cProfile ("cprofile") or SamplingProfiler ("sampling") and writes to
+    output_folder (created if needed) a summary of the top hotspots, name_hotspots.txt, and:
+    - with sampling, the collapsed stacks of the samples, name.collapsed, to render as a flame graph;
+    - with cprofile, the pstats dump, name.prof, and collapsed stacks of caller -> callee pairs weighted by time, a
+      coarser flame graph as cProfile does not keep whole stacks.
+    Returns (result of the function, list of written files)"""
+    os.makedirs(output_folder, exist_ok=True)
+    hotspots_path = os.path.join(output_folder, name + "_hotspots.txt")
+    if method == "sampling":
+        with SamplingProfiler(interval=interval) as sampler:
+            result = function(*args, **kwargs)
+        collapsed_path = os.path.join(output_folder, name + ".collapsed")
+        sampler.write_collapsed(collapsed_path)
+        with open(hotspots_path, "w") as f:
+            f.write(sampler.hotspots(top))
+        return result, [collapsed_path, hotspots_path]
+    elif method == "cprofile":
+        profile = cProfile.Profile()
+        result = profile.runcall(function, *args, **kwargs)
+        prof_path = os.path.join(output_folder, name + ".prof")
+        profile.dump_stats(prof_path)
+        collapsed_path = os.path.join(output_folder, name + ".collapsed")
+        stats = pstats.Stats(profile)
+        with open(collapsed_path, "w") as f:
+            for (callee, (cc, nc, tt, ct, callers)) in stats.stats.items():
+                for caller, (caller_cc, caller_nc, caller_tt, caller_ct) in callers.items():
+                    # time in microseconds, as collapsed stack counts are integers
+                    f.write("{};{} {}\n".format(_stats_label(caller), _stats_label(callee), int(caller_tt * 1e6)))
+        with open(hotspots_path, "w") as f:
+            for sort_key in ["tottime", "cumulative"]:
+                stats.stream = f
+                stats.sort_stats(sort_key).print_stats(top)
+        return result, [prof_path, collapsed_path, hotspots_path]
+    raise ValueError("Unknown profiling method {}, choose sampling or cprofile".format(method))
+
+
+def _frame_label(code):
+    return "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def _stats_label(function):
+    filename, line, name = function
+    return "{} ({}:{})".format(name, os.path.basename(filename), line)
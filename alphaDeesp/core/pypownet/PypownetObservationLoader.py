@@ -1,27 +1,45 @@
+import os
+
 import pypownet.environment
 from pypownet.agent import *
 from pypownet.environment import ElementType
 
+# Loaders already created in this process, by parameters folder
+_cached_loaders = {}
+
+
+def get_cached_loader(param_folder):
+    """Returns a PypownetObservationLoader for the given grid, creating its environment only on first call"""
+    key = os.path.abspath(param_folder)
+    if key not in _cached_loaders:
+        _cached_loaders[key] = PypownetObservationLoader(param_folder)
+    return _cached_loaders[key]
+
+
 class PypownetObservationLoader:
     def __init__(self, param_folder):
 
         if not param_folder or param_folder is None:
             raise AttributeError("\nThe parameters folder for Pypownet is empty or None.")
-        parameters_folder = param_folder
+        self.parameters_folder = param_folder
+        self.env = None
+        self.current_timestep = 0
+        self.create_environment()
 
+    def create_environment(self):
+        """(Re)creates the environment, at the first timestep of the first chronic"""
         game_level = "level0"
         chronic_looping_mode = 'natural'
         chronic_starting_id = 0
         game_over_mode = 'easy'
         without_overflow_cuttof = True
 
-        self.env = pypownet.environment.RunEnv(parameters_folder=parameters_folder, game_level=game_level,
+        self.env = pypownet.environment.RunEnv(parameters_folder=self.parameters_folder, game_level=game_level,
                                                        chronic_looping_mode=chronic_looping_mode,
                                                        start_id=chronic_starting_id,
                                                        game_over_mode=game_over_mode,
                                                        without_overflow_cutoff=without_overflow_cuttof)
-
-
+        self.current_timestep = 0
 
     def get_observation(self, timestep = 0):
         # Get action space
@@ -30,11 +48,20 @@ class PypownetObservationLoader:
         # Create do_nothing action.
         action_do_nothing = action_space.get_do_nothing_action()
 
+        # Go to timestep by playing do nothing actions. Environment has to be recreated to go back in time
+        if timestep < self.current_timestep:
+            self.create_environment()
+            action_space = self.env.action_space
+            action_do_nothing = action_space.get_do_nothing_action()
+        while self.current_timestep < timestep:
+            observation, reward, done, info = self.env.step(action_do_nothing)
+            if done:
+                raise ValueError("Game over at timestep {} while going to timestep {}".format(self.current_timestep,
+                                                                                              timestep))
+            self.current_timestep += 1
+
         # Run one step in the environment
         raw_simulated_obs = self.env.simulate(action_do_nothing)
         obs = self.env.observation_space.array_to_observation(raw_simulated_obs[0])
 
-        # TODO: go to timestep
-
         return self.env, obs, action_space
-
@@ -1,5 +1,7 @@
 from math import fabs
 import ast
+import logging
+from concurrent.futures import ProcessPoolExecutor
 
 import networkx as nx
 import pypownet.environment
@@ -9,18 +11,25 @@ from pypownet.environment import ElementType
 from alphaDeesp.core.elements import *
 from alphaDeesp.core.network import Network
 from alphaDeesp.core.simulation import Simulation
-from alphaDeesp.core.printer import Printer
+from alphaDeesp.core.records import SimulationRecord, create_simulation_batch
+from alphaDeesp.core.scoring import score_changes, get_worsened_lines
+from alphaDeesp.core.printer import Printer, get_layout_file
+
+logger = logging.getLogger(__name__)
 
 
 class PypownetSimulation(Simulation):
-    def __init__(self, env, obs, action_space, param_options=None, debug=False, ltc=[9], plot_folder = None,isScoreFromBackend=False):
+    # Full observations are needed to plot the simulated states, see main
+    keep_observations = True
+
+    def __init__(self, env, obs, action_space, param_options=None, debug=False, ltc=[9], plot_folder = None,isScoreFromBackend=False,
+                 loader_options=None):
         super().__init__()
-        print("PypownetSimulation object created...")
+        logger.debug("PypownetSimulation object created...")
 
         if not param_options or param_options is None:
             raise AttributeError("\nparam_options are empty or None, meaning the config file is not properly read.")
 
-        self.save_bag = []
         self.debug = debug
         self.args_number_of_simulated_topos = param_options["totalnumberofsimulatedtopos"]
         self.args_inner_number_of_simulated_topos_per_node = param_options["numberofsimulatedtopospernode"]
@@ -29,7 +38,9 @@ class PypownetSimulation(Simulation):
         self.topo = None  # a dict create in retrieve topology
         self.ltc = ltc
         self.param_options = param_options
-        self.printer = Printer(plot_folder)
+        self.save_bag = self.create_save_bag()
+        self.printer = Printer(plot_folder, workers=int(param_options.get("plotworkers", 0)),
+                               layout_file=get_layout_file(param_options.get("gridpath")))
         #############################
         self.environment = env
         self.action_space = action_space
@@ -37,12 +48,14 @@ class PypownetSimulation(Simulation):
         self.obs = obs
         self.obs_linecut = None
         self.isScoreFromBackend=isScoreFromBackend
+        # (parameters_folder, timestep) of the observation, to rebuild it in worker processes
+        self.loader_options = loader_options
+        self.simulation_pool = None  # Worker processes to simulate actions, created on first use if enabled
 
         # Layout of the grid
         self.layout = self.compute_layout()
 
-        print("HARD OVERFLOW = ", self.environment.game.hard_overflow_coefficient)
-        print("")
+        logger.info("HARD OVERFLOW = %s", self.environment.game.hard_overflow_coefficient)
 
         observation_space = self.environment.observation_space
 
@@ -54,8 +67,8 @@ class PypownetSimulation(Simulation):
         self.substation_to_node_mapping = {}
         self.internal_to_external_mapping = {}  # d[internal_id] = external_name_id
         self.external_to_internal_mapping = {}  # d[external_id] = internal_name_id
-        print("current chronic name = ", self.environment.game.get_current_chronic_name())
-        print(self.obs)
+        logger.info("current chronic name = %s", self.environment.game.get_current_chronic_name())
+        logger.debug("%s", self.obs)
         self.load()
 
     def compute_layout(self):
@@ -70,9 +83,27 @@ class PypownetSimulation(Simulation):
                     (438, 100), (326, 140), (200, 8), (79, 12), (-152, 170), (-70, 200), (222, 200)]
         return layout
 
+    def close(self):
+        """Releases the observations, dataframes, simulated states and environment held by the simulation. It cannot
+        be used for further analyses afterwards"""
+        super().close()
+        if self.simulation_pool is not None:
+            self.simulation_pool.shutdown()
+        self.simulation_pool = None
+        self.grid = None
+        self.environment = None
+        self.action_space = None
+
     def get_layout(self):
         return self.layout
 
+    def get_simulation_pool(self, n_workers):
+        """Pool of n_workers processes simulating actions, created on first use and kept until close so that workers
+        load the observation once"""
+        if self.simulation_pool is None:
+            self.simulation_pool = ProcessPoolExecutor(max_workers=n_workers)
+        return self.simulation_pool
+
     def get_substation_elements(self):
         return self.substations_elements
 
@@ -122,6 +153,14 @@ class PypownetSimulation(Simulation):
         g_over_detailed = self.build_detailed_graph_from_internal_structure(self.ltc)
         return self.plot_grid(g_over_detailed, name=name)
 
+    def plot_simulated_states(self):
+        """Plots the simulated states kept in save bag, their graphs being rendered concurrently by the printer"""
+        graphs = []
+        for name, obs in self.save_bag:
+            self.load_from_observation(obs, self.ltc)
+            graphs.append((name, self.build_detailed_graph_from_internal_structure(self.ltc)))
+        return self.printer.display_geo_all(graphs, self.get_layout())
+
     def plot_grid(self, g, name):
         # Use printer API to plot (graphviz/neato)
         self.printer.display_geo(g, self.get_layout(), name=name)
@@ -150,132 +189,124 @@ class PypownetSimulation(Simulation):
         """TODO"""
         return None
 
-    def compute_new_network_changes(self, ranked_combinations):
-        """this function takes a dataframe ranked_combinations,
-         for each combination it computes a simulation step in Pypownet with action:
-         change nodes topo(combination)"""
-
-        print("\n##############################################################################")
-        print("##########...........COMPUTE NEW NETWORK CHANGES..........####################")
-        print("##############################################################################")
-
-        # the function score creates a Dataframe with sorted score for each topo change.
-        # FINISHED
-        end_result_dataframe = self.create_end_result_empty_dataframe()
-        j = 0
-        for df in ranked_combinations:
-            ii = 0
-            if j == int(self.args_number_of_simulated_topos):
-                break
-            for i, row in df.iterrows():
-                if ii == int(self.args_inner_number_of_simulated_topos_per_node):
-                    break
-                saved_obs = self.obs
-                # target_node = row["node"] + 1
-                internal_target_node = row["node"]
-                target_node = self.internal_to_external_mapping[row["node"]]
-                # target_node = row["node"]
-                new_conf = row["topology"]
-                print("ROW KEYS = ", row.keys())
-                score_topo = i
-                print("#####################################################################################")
-                print("###########"" Compute new network changes on node [{}] with new topo [{}] ###########"
-                      .format(target_node, new_conf))
-                print("#####################################################################################")
-                current_conf, types = self.obs.get_nodes_of_substation(target_node)
-
-                # target configuration represents the action to be taken to get from curr_conf to ==> new_conf.
-                target_configuration = get_differencial_topology(new_conf, current_conf)
-
-                # load this topo to pypownet
-                action_space = self.environment.action_space
-                observation_space = self.environment.observation_space
-                # Create template of action with no switch activated (do-nothing action)
-                action = action_space.get_do_nothing_action(as_class_Action=True)
-                # This function fills the "action" with correct values.
-                action_space.set_substation_switches_in_action(action=action, substation_id=target_node,
-                                                               new_values=target_configuration)
-
-                # action_space.set_lines_status_switch_from_id(action=action, line_id=[9], new_switch_value=1)
-                # Run one step in the environment
-                raw_obs,action, reward, *_ = self.environment.simulate(action)
-
-                # if obs is None, error in the simulation of the next step
-                if raw_obs is None:
-                    print("Pypownet simulation returnt a None... Cannot process results...")
-                    continue
-
-                # transform raw_obs into Observation object. (Useful for prints, for debugging)
-                obs = observation_space.array_to_observation(raw_obs)
-                obs.get_lines_capacity_usage()
-                if self.debug:
-                    print(obs)
-
-                print("old obs addr = ", hex(id(saved_obs)))
-                print("new obs addr = ", hex(id(obs)))
-
-                # this is used to display graphs at the end. Check main.
-                name = "".join(str(e) for e in new_conf)
-                name = str(internal_target_node) + "_" + name
-
-                # for flow, origin, ext, in zip(obs.active_flows_origin, obs.lines_or_nodes, obs.lines_ex_nodes)
-
-                self.save_bag.append([name, obs])
-
-                delta_flow = saved_obs.active_flows_origin[self.ltc[0]] - \
-                             obs.active_flows_origin[self.ltc[0]]
-
-                print("self.lines to cut[0] = ", self.ltc[0])
-                print("self.obs.status line = ", self.obs.lines_status)
-                print(" simulated obs  = ", obs.lines_status)
-                print("saved flow = ", list(saved_obs.active_flows_origin.astype(int)))
-                print("current flow = ", list(obs.active_flows_origin.astype(int)))
-                print("deltaflows = ", (saved_obs.active_flows_origin - obs.active_flows_origin).astype(int))
-                print("final delta_flow = ", delta_flow)
-
-                # 1) having the new and old obs. Now how do we compare ?
-                simulated_score, worsened_line_ids, redistribution_prod, redistribution_load, efficacity = \
-                    self.observations_comparator(saved_obs, obs, score_topo, delta_flow)
-
-                if (self.isScoreFromBackend) and (simulated_score==4):
-                    # dans le cas ou on resoud bien les contraintes, on prend la reward L2RPN
-                    efficacity = reward
-
-                # The next three lines have to been done like this to properly have a python empty list if no lines
-                # are worsened. This is important to save, read back, and compare a DATAFRAME
-                worsened_line_ids = list(np.where(worsened_line_ids == 1))
-                worsened_line_ids = worsened_line_ids[0]
-
-                # further tricks to properly read back a saved dataframe
-                if worsened_line_ids.size == 0:
-                    worsened_line_ids = []
-                elif isinstance(worsened_line_ids, np.ndarray):
-                    worsened_line_ids = list(worsened_line_ids)
-
-
-                score_data = [self.ltc[0],
-                              saved_obs.active_flows_origin[self.ltc[0]],
-                              obs.active_flows_origin[self.ltc[0]],
-                              delta_flow,
-                              worsened_line_ids,
-                              redistribution_prod,
-                              redistribution_load,
-                              new_conf,
-                              new_conf,#the pypownet conf is the same as alphadeesp
-                              self.external_to_internal_mapping[target_node],
-                              1,  # category hubs?
-                              score_topo,
-                              simulated_score,
-                              efficacity]
-
-                max_index = end_result_dataframe.shape[0]  # rows
-                end_result_dataframe.loc[max_index] = score_data
-
-                end_result_dataframe.to_csv("./END_RESULT_DATAFRAME.csv", index=True)
-                ii += 1
-                j += 1
-
-        return end_result_dataframe
+    def get_candidate_action(self, node, topology):
+        """Pypownet actions are lists of (substation_id, switches), see simulate_switches"""
+        target_node = self.internal_to_external_mapping[node]
+        current_conf, types = self.obs.get_nodes_of_substation(target_node)
+        # target configuration represents the action to be taken to get from curr_conf to ==> new_conf.
+        return [(target_node, get_differencial_topology(topology, current_conf))], topology
+
+    def get_do_nothing_action(self):
+        return []
+
+    def simulate_batch(self, actions):
+        """Simulates actions, split between worker processes with simulationWorkers > 1 in alphadeesp parameters.
+        Full observations are always kept"""
+        simulations = []
+        observations = []
+        observation_space = self.environment.observation_space
+        for raw_obs, reward in self.simulate_switches(actions):
+            # if obs is None, error in the simulation of the next step
+            if raw_obs is None:
+                logger.warning("Pypownet simulation returnt a None... Cannot process results...")
+                simulations.append((None, reward, True, None))
+                observations.append(None)
+                continue
+            # transform raw_obs into Observation object. (Useful for prints, for debugging)
+            obs = observation_space.array_to_observation(raw_obs)
+            simulations.append((get_record(obs), reward, False, None))
+            observations.append(obs)
+        return create_simulation_batch(simulations, observations)
+
+    def score_simulations(self, results, changes):
+        """Simulated states are scored all at once, from their full observations"""
+        all_score_data = [None] * len(results)
+        simulated = np.flatnonzero(~results["done"])
+        if len(simulated) == 0:
+            return all_score_data
+        saved_obs = self.obs
+        observations = [results["observation"][i] for i in simulated]
+        delta_flows, simulated_scores, worsened_lines, redistribution_prods, redistribution_loads, efficacities = \
+            self.compare_observations(saved_obs, observations)
+
+        for k, i in enumerate(simulated):
+            node, new_conf, applied_topology, score_topo = changes[i]
+            obs = observations[k]
+            if self.debug:
+                logger.debug("%s", obs)
+
+            # this is used to display graphs at the end. Check main.
+            if isinstance(node, tuple):  # combined action on several substations
+                name = "+".join(str(n) + "_" + "".join(str(e) for e in topo) for n, topo in zip(node, new_conf))
+            else:
+                name = str(node) + "_" + "".join(str(e) for e in new_conf)
+
+            simulated_score = int(simulated_scores[k])
+            efficacity = efficacities[k]
+            if (self.isScoreFromBackend) and (simulated_score==4):
+                # dans le cas ou on resoud bien les contraintes, on prend la reward L2RPN
+                efficacity = results["reward"][i]
+            self.save_bag.add(name, obs, (simulated_score, -np.inf if efficacity != efficacity else efficacity))
+
+            # A python list, to properly save, read back, and compare a DATAFRAME
+            worsened_line_ids = [int(l) for l in np.flatnonzero(worsened_lines[k])]
+
+            all_score_data[i] = [self.ltc[0],
+                                 saved_obs.active_flows_origin[self.ltc[0]],
+                                 obs.active_flows_origin[self.ltc[0]],
+                                 delta_flows[k],
+                                 worsened_line_ids,
+                                 redistribution_prods[k],
+                                 redistribution_loads[k],
+                                 new_conf,
+                                 applied_topology,#the pypownet conf is the same as alphadeesp
+                                 node,
+                                 1,  # category hubs?
+                                 score_topo,
+                                 simulated_score,
+                                 efficacity]
+        return all_score_data
+
+    def simulate_switches(self, actions):
+        """Simulates each action, a list of (substation_id, switches) to apply together.
+        Returns the (raw observation, reward) of each simulation, in order. With simulationWorkers > 1 in alphadeesp
+        parameters and the loader_options of the observation, simulations are split between the worker processes of
+        the simulation pool"""
+        n_workers = int(self.param_options.get("simulationworkers", 1))
+        if n_workers > 1 and self.loader_options is not None and len(actions) > 1:
+            chunks = [[actions[i] for i in chunk] for chunk in np.array_split(np.arange(len(actions)), n_workers)
+                      if len(chunk)]
+            results = self.get_simulation_pool(n_workers).map(simulate_switches_in_worker,
+                                                              [self.loader_options] * len(chunks), chunks)
+            return [result for chunk_results in results for result in chunk_results]
+        return [simulate_switches(self.environment, action) for action in actions]
+
+    def compare_observations(self, old_obs, new_observations):
+        """Vectorized observations_comparator over several simulated observations. Returns arrays with one element
+        per observation: delta flows on the line to cut, simulated scores, worsened lines (boolean, one row per
+        observation), prod and load redistributions and efficacities"""
+        new_rho = np.array([obs.get_lines_capacity_usage() for obs in new_observations])
+        new_flows = np.array([obs.active_flows_origin for obs in new_observations])
+        new_time_reco = np.array([obs.timesteps_before_lines_reconnectable for obs in new_observations])
+        new_prods = np.array([obs.active_productions for obs in new_observations])
+        new_loads = np.array([obs.active_loads for obs in new_observations])
+        old_rho = old_obs.get_lines_capacity_usage()
+        cooldown = self.environment.game.n_timesteps_actionned_line_reactionable
+
+        delta_flows = old_obs.active_flows_origin[self.ltc[0]] - new_flows[:, self.ltc[0]]
+        simulated_scores = score_changes(self.ltc, old_rho, new_rho, old_obs.timesteps_before_lines_reconnectable,
+                                         new_time_reco, old_obs.active_loads, new_loads, cooldown)
+        worsened_lines = get_worsened_lines(old_rho, new_rho, old_obs.timesteps_before_lines_reconnectable,
+                                            new_time_reco, cooldown)
+        redistribution_prods = np.sum(np.absolute(new_prods - old_obs.active_productions), axis=1)
+        redistribution_loads = np.sum(np.absolute(new_loads - old_obs.active_loads), axis=1)
+
+        if not np.isin(simulated_scores, [0, 1, 2, 3, 4]).all():
+            raise ValueError("Cannot compute efficacity, the score is wrong.")
+        efficacities = np.abs(delta_flows / new_rho[:, self.ltc[0]])
+        efficacities = np.where(simulated_scores >= 2, efficacities, -efficacities)  # success or failure
+
+        return delta_flows, simulated_scores, worsened_lines, redistribution_prods, redistribution_loads, efficacities
 
     def observations_comparator(self, old_obs, new_obs, score_topo, delta_flow):
         """This function takes two observations and extracts several information:
@@ -289,165 +320,29 @@ class PypownetSimulation(Simulation):
 
         it returns an array with all data for end_result_dataframe creation
         """
-        simulated_score = self.score_changes_between_two_observations(old_obs, new_obs,self.environment.game.n_timesteps_actionned_line_reactionable)
-
-        worsened_line_ids = self.create_boolean_array_of_worsened_line_ids(old_obs, new_obs)
-
-        redistribution_prod = np.sum(np.absolute(new_obs.active_productions - old_obs.active_productions))
-        redistribution_load = np.sum(np.absolute(new_obs.active_loads - old_obs.active_loads))
-
-        if simulated_score in [4, 3, 2]:  # success
-            efficacity = fabs(delta_flow / new_obs.get_lines_capacity_usage()[self.ltc[0]])
-            pass
-        elif simulated_score in [0, 1]:  # failure
-            efficacity = -fabs(delta_flow / new_obs.get_lines_capacity_usage()[self.ltc[0]])
-            pass
-        else:
-            raise ValueError("Cannot compute efficacity, the score is wrong.")
-
-        return simulated_score, worsened_line_ids, redistribution_prod, redistribution_load, efficacity
+        delta_flows, simulated_scores, worsened_lines, redistribution_prods, redistribution_loads, efficacities = \
+            self.compare_observations(old_obs, [new_obs])
+        return int(simulated_scores[0]), worsened_lines[0].astype(int), redistribution_prods[0], redistribution_loads[0], \
+            efficacities[0]
 
     def create_boolean_array_of_worsened_line_ids(self, old_obs, new_obs):
         """This function creates a boolean array of lines that got worse between two observations.
         @:return boolean numpy array [0..1]"""
-
-        res = []
-        n_lines=len(new_obs.get_lines_capacity_usage())
-        n_timesteps_actionned_line_reactionable=self.environment.game.n_timesteps_actionned_line_reactionable
-
-        old_rho=old_obs.get_lines_capacity_usage()
-        new_rho=new_obs.get_lines_capacity_usage()
-
-        old_time_reco=old_obs.timesteps_before_lines_reconnectable
-        new_time_reco=new_obs.timesteps_before_lines_reconnectable
-        #for old, new in zip(old_obs, new_obs):
-        for l in range(n_lines):
-            if fabs(new_rho[l]) > 1 and fabs(old_rho[l]) > 1 and fabs(new_rho[l]) > 1.05 * fabs(old_rho[l]):  # contrainte existante empiree
-                res.append(1)
-            elif fabs(new_rho[l]) > 1 > fabs(old_rho[l]):
-                res.append(1)
-            elif (new_time_reco[l] - old_time_reco[l]>n_timesteps_actionned_line_reactionable):
-                res.append(1)
-            else:
-                res.append(0)
-
-        return np.array(res)
+        worsened_lines = get_worsened_lines(old_obs.get_lines_capacity_usage(), new_obs.get_lines_capacity_usage(),
+                                            old_obs.timesteps_before_lines_reconnectable,
+                                            new_obs.timesteps_before_lines_reconnectable,
+                                            self.environment.game.n_timesteps_actionned_line_reactionable)
+        return worsened_lines.astype(int)
 
     def score_changes_between_two_observations(self, old_obs, new_obs,nb_timestep_cooldown_line_param=0):
         """This function takes two observations and computes a score to quantify the change between old_obs and new_obs.
-        @:return int between [0 and 4]
-        4: if every overload disappeared
-        3: if an overload disappeared without stressing the network
-        2: if at least 30% of an overload was relieved
-        1: if an overload was relieved but another appeared and got worse
-        0: if no overloads were alleviated or if it resulted in some load shedding or production distribution.
+        @:return int between [0 and 4], see score_changes
         """
-        old_number_of_overloads = 0
-        new_number_of_overloads = 0
-        boolean_overload_worsened = []
-        boolean_constraint_30percent_relieved = []
-        boolean_constraint_relieved = []
-        boolean_overload_created = []
-        boolean_line_cascading_disconnection = ((new_obs.timesteps_before_lines_reconnectable - old_obs.timesteps_before_lines_reconnectable) > nb_timestep_cooldown_line_param)
-
-        old_obs_lines_capacity_usage = old_obs.get_lines_capacity_usage()
-        new_obs_lines_capacity_usage = new_obs.get_lines_capacity_usage()
-        # ################################### PREPROCESSING #####################################
-        for elem in old_obs_lines_capacity_usage:
-            if elem > 1.0:
-                old_number_of_overloads += 1
-
-        for elem in new_obs_lines_capacity_usage:
-            if elem > 1.0:
-                new_number_of_overloads += 1
-
-        # preprocessing for score 3 and 2
-        line_id = 0
-        for old, new in zip(old_obs_lines_capacity_usage, new_obs_lines_capacity_usage):
-            # preprocessing for score 3
-            if (new > 1.05 * old) & (new > 1.0):  # if new > old > 1.0 it means it worsened an existing constraint
-                boolean_overload_worsened.append(1)
-            else:
-                boolean_overload_worsened.append(0)
-
-            # preprocessing for score 2
-            if (old > 1.0) & (line_id in self.ltc):  # if old was an overload:
-                surcharge = old - 1.0
-                diff = old - new
-                percentage_relieved = diff * 100 / surcharge
-                if percentage_relieved > 30.0:
-                    boolean_constraint_30percent_relieved.append(1)
-                else:
-                    boolean_constraint_30percent_relieved.append(0)
-            else:
-                boolean_constraint_30percent_relieved.append(0)
-
-            # preprocessing for score 1
-            if (old > 1.0 > new) & (line_id in self.ltc):
-                boolean_constraint_relieved.append(1)
-            else:
-                boolean_constraint_relieved.append(0)
-
-            if old < 1.0 < new:
-                boolean_overload_created.append(1)
-            else:
-                boolean_overload_created.append(0)
-
-            line_id += 1
-
-        boolean_overload_worsened = np.array(boolean_overload_worsened)
-        boolean_constraint_30percent_relieved = np.array(boolean_constraint_30percent_relieved)
-        boolean_constraint_relieved = np.array(boolean_constraint_relieved)
-        boolean_overload_created = np.array(boolean_overload_created)
-
-        redistribution_prod = np.sum(np.absolute(new_obs.active_productions - old_obs.active_productions))
-
-        cut_load_percent = np.sum(np.absolute(new_obs.active_loads - old_obs.active_loads))/np.sum(old_obs.active_loads)
-
-        # ################################ END OF PREPROCESSING #################################
-        # score 0 if no overloads were alleviated or if it resulted in some load shedding or production distribution.
-        if old_number_of_overloads == 0:
-            # print("return NaN: No overflow at initial state of grid")
-            return float('nan')
-        elif cut_load_percent > 0.01:  # (boolean_overload_relieved == 0).all()
-            # print("return 0: no overloads were alleviated or some load shedding occured.")
-            return 0
-
-        # score 1 if overload was relieved but another one appeared and got worse
-        elif (boolean_constraint_relieved == 1).any() and ((boolean_overload_created == 1).any() or
-                                                           (boolean_overload_worsened == 1).any() or (boolean_line_cascading_disconnection).any() ):
-            # print("return 1: our overload was relieved but another one appeared")
-            return 1
-
-        # 4: if every overload disappeared
-        elif old_number_of_overloads > 0 and new_number_of_overloads == 0:
-            # print("return 4: every overload disappeared")
-            return 4
-
-        # 3: if this overload disappeared without stressing the network, ie,
-        # if an overload disappeared
-        # and without worsening existing constraint
-        # and no Loads that get cut
-        elif (boolean_constraint_relieved == 1).any() and \
-                (boolean_overload_worsened == 0).all():
-            # and \ (new_obs.are_loads_cut == 0).all():
-            # print("return 3: our overload disappeared without stressing the network")
-            return 3
-
-        # 2: if at least 30% of this overload was relieved
-        elif (boolean_constraint_30percent_relieved == 1).any() and \
-                (boolean_overload_worsened == 0).all():
-            # print("return 2: at least 30% of our overload [{}] was relieved".format(
-            #     np.where(boolean_overload_30percent_relieved == 1)[0]))
-            return 2
-
-        # score 0
-        elif (boolean_constraint_30percent_relieved == 0).all() or \
-                (boolean_overload_worsened == 1).any():
-            return 0
-
-        else:
-            raise ValueError("Probleme with Scoring")
+        score = float(score_changes(self.ltc, old_obs.get_lines_capacity_usage(), new_obs.get_lines_capacity_usage(),
+                                    old_obs.timesteps_before_lines_reconnectable,
+                                    new_obs.timesteps_before_lines_reconnectable,
+                                    old_obs.active_loads, new_obs.active_loads, nb_timestep_cooldown_line_param))
+        return score if score != score else int(score)
 
     def create_and_fill_internal_structures(self, obs, df):
         """This function fills multiple structures:
@@ -475,10 +370,7 @@ class PypownetSimulation(Simulation):
             current_conf, types = obs.get_nodes_of_substation(external_substation_id)
 
             if self.debug:
-                print("--------------- substation_id {}", substation_id)
-                print(current_conf)
-                print(types)
-                print(types[0])
+                logger.debug("substation_id %s: current_conf %s, types %s", substation_id, current_conf, types)
 
             # here we create arrays of substations_ids indicating the destination for OriginLine
             indexes_tmp_or = np.where(obs.lines_or_substations_ids == external_substation_id)
@@ -578,8 +470,7 @@ class PypownetSimulation(Simulation):
         self.topo = d
         df = self.create_df(d, lines_to_cut)
         self.df = df
-        print("DF From load2")
-        print(df)
+        logger.debug("DF From load2\n%s", df)
         self.create_and_fill_internal_structures(observation, df)
 
     def build_graph_from_data_frame(self, lines_to_cut):
@@ -600,10 +491,11 @@ class PypownetSimulation(Simulation):
         """This function create a detailed graph from internal self structures as self.substations_elements..."""
         g = nx.MultiDiGraph()
         network = Network(self.substations_elements)
-        print("Network = ", network)
+        logger.debug("Network = %s", network)
         build_nodes_v2(g, network.nodes_prod_values)
         build_edges_v2(g, network.substation_id_busbar_id_node_id_mapping, self.substations_elements)
-        print("This graph is weakly connected : ", nx.is_weakly_connected(g))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("This graph is weakly connected : %s", nx.is_weakly_connected(g))
         return g
 
     def change_nodes_configurations(self, new_configuration, node_id):
@@ -682,14 +574,9 @@ class PypownetSimulation(Simulation):
         loads_values = obs.active_loads
         current_flows = obs.active_flows_origin
         if self.debug:
-            print("============================= FUNCTION build_powerflow_graph 2 =============================")
-            print("self.idx_or = ", idx_or)
-            print("self.idx_ex = ", idx_ex)
-            print("Nodes that are prods =", are_prods)
-            print("Nodes that are loads =", are_loads)
-            print("prods_values = ", prods_values)
-            print("loads_values = ", loads_values)
-            print("current_flows = ", current_flows)
+            logger.debug("build_powerflow_graph: idx_or = %s, idx_ex = %s, nodes that are prods = %s, nodes that are "
+                         "loads = %s, prods_values = %s, loads_values = %s, current_flows = %s", idx_or, idx_ex,
+                         are_prods, are_loads, prods_values, loads_values, current_flows)
         # =========================================== NODE PART ===========================================
         build_nodes(g, are_prods, are_loads, prods_values, loads_values, debug=self.debug)
         # =========================================== EDGE PART ===========================================
@@ -704,6 +591,7 @@ class PypownetSimulation(Simulation):
         for line_id in ids:
             action_space.set_lines_status_switch_from_id(action=action, line_id=line_id, new_switch_value=1)
         raw_simulated_obs = self.environment.simulate(action)
+        self.line_cut_powerflows += 1
         if raw_simulated_obs[0] is None:
             raise ValueError("The simulation step of Pypownet returnt a None... Something")
         obs = self.environment.observation_space.array_to_observation(raw_simulated_obs[0])
@@ -736,7 +624,7 @@ class PypownetSimulation(Simulation):
 
 def build_nodes(g, are_prods, are_loads, prods_values, loads_values, debug=False):
     # =========================================== NODE PART ===========================================
-    print(f"There are {len(are_loads)} nodes")
+    logger.debug("There are %s nodes", len(are_loads))
     prods_iter, loads_iter = iter(prods_values), iter(loads_values)
     i = 0
     # We color the nodes depending if they are production or consumption
@@ -745,7 +633,7 @@ def build_nodes(g, are_prods, are_loads, prods_values, loads_values, debug=False
         load = next(loads_iter) if is_load else 0.
         prod_minus_load = prod - load
         if debug:
-            print(f"Node n°[{i}] : Production value: [{prod}] - Load value: [{load}] ")
+            logger.debug("Node n°[%s] : Production value: [%s] - Load value: [%s]", i, prod, load)
         if prod_minus_load > 0:  # PROD
             g.add_node(i, pin=True, prod_or_load="prod", value=str(prod_minus_load), style="filled",
                        fillcolor="#f30000")  # red color
@@ -763,15 +651,13 @@ def build_nodes_v2(g, nodes_prod_values: list):
         prod_cons_total_value is a float.
         If the value is positive then it is a Production, if negative it is a Consumption
     """
-    print("IN FUNCTION BUILD NODES V2222222222", nodes_prod_values)
+    logger.debug("build_nodes_v2 %s", nodes_prod_values)
     for data in nodes_prod_values:
-        print("data = ", data)
         i = int(data[0])
         if data[1] is None or data[1] == "XXX":
             prod_minus_load = 0.0  # It will end up as a white node
         else:
             prod_minus_load = data[1]
-        print("prod_minus_load = ", prod_minus_load)
         if prod_minus_load > 0:  # PROD
             g.add_node(i, pin=True, prod_or_load="prod", value=str(prod_minus_load), style="filled",
                        fillcolor="#f30000")  # red color
@@ -785,13 +671,11 @@ def build_nodes_v2(g, nodes_prod_values: list):
 
 
 def build_edges_v2(g, substation_id_busbar_id_node_id_mapping, substations_elements):
-    print("\nWE ARE IN BUILD EDGES V2")
     substation_ids = sorted(list(substations_elements.keys()))
     # loops through each substation, and creates an edge from (
     for substation_id in substation_ids:
-        print("\nSUBSTATION ID = ", substation_id)
+        logger.debug("SUBSTATION ID = %s", substation_id)
         for element in substations_elements[substation_id]:
-            print(element)
             origin = None
             extremity = None
             if isinstance(element, OriginLine):
@@ -800,7 +684,6 @@ def build_edges_v2(g, substation_id_busbar_id_node_id_mapping, substations_eleme
                 extremity = int(element.end_substation_id)
                 # check if extremity on busbar1, if it is,
                 # check with the substation substation_id_busbar_id_node_id_mapping dic what "graphical" node it is
-                print("substations_elements[extremity] = ", substations_elements[extremity])
                 for elem in substations_elements[extremity]:
                     # if this true, we are talking about correct edge
                     if isinstance(elem, ExtremityLine) and elem.flow_value == element.flow_value:
@@ -812,14 +695,11 @@ def build_edges_v2(g, substation_id_busbar_id_node_id_mapping, substations_eleme
             # in case we get on an element that is Production or Consumption
             else:
                 continue
-            print("origin = ", origin)
-            print("extremity = ", extremity)
-            print("reported_flow = ", reported_flow)
             pen_width = fabs(reported_flow[0]) / 10.0
             if pen_width < 0.01:
                 pen_width = 0.1
-            print(f"#################### Edge created : ({origin}, {extremity}), with flow = {reported_flow},"
-                  f" pen_width = {pen_width} >>>")
+            logger.debug("Edge created : (%s, %s), with flow = %s, pen_width = %s", origin, extremity, reported_flow,
+                         pen_width)
             if reported_flow[0] > 0:  # RED
                 g.add_edge(origin, extremity, capacity=float(reported_flow[0]), xlabel=reported_flow[0], color="red",
                            penwidth="%.2f" % pen_width)
@@ -893,3 +773,35 @@ def get_differencial_topology(new_conf, old_conf):
         else:
             res.append(int(r))
     return res
+
+
+def get_record(obs):
+    """SimulationRecord of a pypownet Observation"""
+    return SimulationRecord(obs.get_lines_capacity_usage(), obs.active_flows_origin, obs.active_flows_extremity,
+                            obs.active_productions, obs.active_loads, obs.lines_status,
+                            obs.timesteps_before_lines_reconnectable)
+
+
+def simulate_switches(env, substation_switches):
+    """Simulates in env the action applying the switches of each (substation_id, switches) of substation_switches.
+    Returns (raw observation, reward), the raw observation being None if the simulation failed"""
+    action_space = env.action_space
+    # Create template of action with no switch activated (do-nothing action)
+    action = action_space.get_do_nothing_action(as_class_Action=True)
+    for substation_id, switches in substation_switches:
+        # This function fills the "action" with correct values.
+        action_space.set_substation_switches_in_action(action=action, substation_id=substation_id,
+                                                       new_values=switches)
+    raw_obs, action, reward, *_ = env.simulate(action)
+    return raw_obs, reward
+
+
+def simulate_switches_in_worker(loader_options, switches):
+    """simulate_switches for each element of switches in a worker process, on the environment rebuilt from
+    loader_options: (parameters_folder, timestep)"""
+    from alphaDeesp.core.pypownet.PypownetObservationLoader import get_cached_loader
+
+    parameters_folder, timestep = loader_options
+    loader = get_cached_loader(parameters_folder)
+    env, obs, action_space = loader.get_observation(timestep)
+    return [simulate_switches(env, substation_switches) for substation_switches in switches]
@@ -0,0 +1,141 @@
+"""Compact records of simulated grid states, kept in place of full simulator observations, and retention policies of
+the kept states"""
+
+import heapq
+
+import numpy as np
+
+
+class SimulationRecord:
+    """Arrays of a simulated grid state needed to score and compare actions. Float arrays are float32, and are views
+    of the given arrays when they already are float32 (as Grid2op observation arrays are)"""
+    __slots__ = ["rho", "p_or", "p_ex", "prod_p", "load_p", "line_status", "time_before_cooldown_line"]
+
+    def __init__(self, rho, p_or, p_ex, prod_p, load_p, line_status, time_before_cooldown_line):
+        self.rho = np.asarray(rho, dtype=np.float32)
+        self.p_or = np.asarray(p_or, dtype=np.float32)
+        self.p_ex = np.asarray(p_ex, dtype=np.float32)
+        self.prod_p = np.asarray(prod_p, dtype=np.float32)
+        self.load_p = np.asarray(load_p, dtype=np.float32)
+        self.line_status = np.asarray(line_status, dtype=bool)
+        self.time_before_cooldown_line = np.asarray(time_before_cooldown_line, dtype=np.int32)
+
+    @classmethod
+    def from_observation(cls, obs, copy=False):
+        """Record of a Grid2op Observation (or of any object with the same attributes). With copy, the arrays are
+        copied, so that the record does not keep the observation or simulation batch it comes from alive"""
+        arrays = [getattr(obs, name) for name in cls.__slots__]
+        if copy:
+            arrays = [np.array(array) for array in arrays]
+        return cls(*arrays)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+
+def get_simulation_batch_dtype(n_line, n_gen, n_load):
+    """NumPy structured dtype of the results of simulate_batch: done (game over), reward, iterations (powerflow
+    iterations, -1 if not reported by the simulator), the SimulationRecord arrays, disc_lines (lines disconnected
+    during the simulation, as reported by the simulator) and observation (the full simulator observation when kept,
+    else None)"""
+    return np.dtype([("done", bool), ("reward", np.float64), ("iterations", np.int32),
+                     ("rho", np.float32, (n_line,)), ("p_or", np.float32, (n_line,)),
+                     ("p_ex", np.float32, (n_line,)), ("prod_p", np.float32, (n_gen,)),
+                     ("load_p", np.float32, (n_load,)), ("line_status", bool, (n_line,)),
+                     ("time_before_cooldown_line", np.int32, (n_line,)), ("disc_lines", np.int32, (n_line,)),
+                     ("observation", object)])
+
+
+def create_simulation_batch(simulations, observations=None):
+    """Structured array with one element per simulation (obs, reward, done, info), obs being a SimulationRecord or
+    having the same attributes (None if the simulation failed, its arrays being zeros). observations are the full
+    observations to keep, one per simulation"""
+    records = [obs if obs is None or isinstance(obs, SimulationRecord) else SimulationRecord.from_observation(obs)
+               for obs, reward, done, info in simulations]
+    shapes = next(((len(record.rho), len(record.prod_p), len(record.load_p)) for record in records
+                   if record is not None), (0, 0, 0))
+    results = np.zeros(len(simulations), dtype=get_simulation_batch_dtype(*shapes))
+
+    for i, (record, (obs, reward, done, info)) in enumerate(zip(records, simulations)):
+        results["done"][i] = done or record is None
+        results["reward"][i] = float("nan") if reward is None else reward
+        iterations = info.get("iterations") if info is not None else None
+        results["iterations"][i] = -1 if iterations is None else iterations
+        if record is not None:
+            for name in SimulationRecord.__slots__:
+                results[name][i] = getattr(record, name)
+        if info is not None and info.get("disc_lines") is not None:
+            results["disc_lines"][i] = info["disc_lines"]
+        if observations is not None:
+            results["observation"][i] = observations[i]
+    return results
+
+
+def get_batch_record(result):
+    """SimulationRecord of an element of a simulation batch, its arrays being views of the batch"""
+    return SimulationRecord(*[result[name] for name in SimulationRecord.__slots__])
+
+
+def get_retention_policy(policy):
+    """Number of items kept by a retention policy: None for "all", 0 for "none", n for an integer n (the n best)"""
+    if policy is None or str(policy).strip().lower() == "all":
+        return None
+    if str(policy).strip().lower() == "none":
+        return 0
+    try:
+        n = int(policy)
+    except ValueError:
+        raise ValueError("Retention policy should be all, none or a number of items, got {}".format(policy))
+    if n < 0:
+        raise ValueError("Retention policy should be all, none or a number of items, got {}".format(policy))
+    return n
+
+
+class RetentionBag:
+    """[name, item] pairs kept following a retention policy: "all" keeps every item, "none" keeps none, and an integer
+    n keeps the n best items by score, ties going to the first added ones. Items added without a score rank below the
+    scored ones. Iterates over the kept pairs in adding order, or best first with a bounded policy"""
+
+    def __init__(self, policy="all"):
+        self.policy = policy
+        self.max_items = get_retention_policy(policy)
+        self.n_added = 0
+        self._items = []  # [name, item] pairs, or heap of (key, name, item) with a bounded policy
+
+    def add(self, name, item, score=None):
+        """Adds item, keeping it if the retention policy allows. score is a number or a tuple of numbers, compared
+        with the scores of the other items of the bag"""
+        self.n_added += 1
+        if self.max_items is None:
+            self._items.append([name, item])
+            return
+        if self.max_items == 0:
+            return
+        key = (score is not None, score if score is not None else 0, -self.n_added)
+        if len(self._items) < self.max_items:
+            heapq.heappush(self._items, (key, name, item))
+        elif key > self._items[0][0]:
+            heapq.heapreplace(self._items, (key, name, item))
+
+    def get(self, name, default=None):
+        """Kept item added as name, the first one in iteration order if several were"""
+        for item_name, item in self:
+            if item_name == name:
+                return item
+        return default
+
+    def clear(self):
+        self._items = []
+        self.n_added = 0
+
+    def __iter__(self):
+        if self.max_items is None:
+            return iter(self._items)
+        return iter([[name, item] for key, name, item in sorted(self._items, key=lambda e: e[0], reverse=True)])
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return len(self._items) > 0
@@ -0,0 +1,507 @@
+"""Columnar files of end result dataframes: Parquet (with pyarrow) or compressed NumPy npz, besides CSV.
+Topology vectors and line lists are stored as list columns (flat values and offsets), and the run metadata (grid,
+lines to cut, parameters...) in the file itself.
+
+Sweeps record their analyses through results sinks (CSV, Parquet or npz parts, SQLite), which buffer them and write
+them by batches, without ever rewriting previous results. With a process pool, a single ResultsWriter process owns the
+sink and workers send it their results"""
+
+import datetime
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".npz": "npz", ".sqlite": "sqlite", ".db": "sqlite"}
+METADATA_KEY = "__metadata__"
+ANALYSES_FILE = "analyses.jsonl"
+DEFAULT_BATCH_SIZE = 1000
+
+
+def get_format(path, file_format=None):
+    """Format of a results file, from its extension unless given"""
+    if file_format is not None:
+        return file_format
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension not in FORMATS:
+        raise ValueError("Unknown results format for {}, extension should be one of {}".format(path, list(FORMATS)))
+    return FORMATS[extension]
+
+
+def write_results(results, path, metadata=None, append=False, file_format=None):
+    """Writes the end result dataframe results to path, in the format of its extension (csv, parquet or npz) unless
+    file_format is given. metadata (JSON serializable dict) is stored with the columns in parquet and npz files.
+    With append, results are added to the ones already written: rows are appended to a CSV file, and for parquet and
+    npz, path is a folder to which a part file is added, so that sweeps never rewrite previous results.
+    SQLite databases are written through a SqliteSink. Returns the written file"""
+    if append and file_format is None and not os.path.splitext(str(path))[1]:
+        file_format = get_folder_format(path)
+    file_format = get_format(path, file_format)
+    if file_format == "sqlite":
+        with SqliteSink(path, append=append) as sink:
+            sink.add(results, metadata)
+        return path
+    if file_format == "csv":
+        header = not (append and os.path.exists(path))
+        results.to_csv(path, index=True, mode="a" if append else "w", header=header)
+        return path
+
+    metadata = dict(metadata or {})
+    metadata.setdefault("written", datetime.datetime.now().isoformat(timespec="seconds"))
+    columns, kinds = to_columns(results)
+    metadata["columns"] = kinds
+    if append:
+        os.makedirs(path, exist_ok=True)
+        path = os.path.join(path, "part-{:05d}.{}".format(len(list_parts(path)), file_format))
+    if file_format == "npz":
+        arrays = {METADATA_KEY: np.array(json.dumps(metadata, default=to_jsonable))}
+        for name, column in columns.items():
+            if kinds[name] == "list":
+                arrays[name + ".values"], arrays[name + ".offsets"] = column
+            else:
+                arrays[name] = column
+        with open(path, "wb") as f:  # not to get .npz appended to the name
+            np.savez_compressed(f, **arrays)
+    else:
+        write_parquet(columns, kinds, metadata, path)
+    logger.info("End results written to %s", path)
+    return path
+
+
+def read_results(path, columns=None):
+    """Reads back results written by write_results, as a dataframe with the run metadata in its attrs["metadata"].
+    Only the given columns are read if any. For a folder of parts, results of all parts are concatenated, a run column
+    giving the part of each row, and attrs["metadata"] is the list of the metadata of the parts.
+    For results recorded by a sink, attrs["analyses"] is the list of the metadata of the analyses, the analysis column
+    of the results numbering them"""
+    if os.path.isdir(path):
+        analyses = read_analyses(os.path.join(path, ANALYSES_FILE))
+        if analyses and columns is not None and "analysis" not in columns:
+            columns = ["analysis"] + list(columns)
+        parts = [read_results(part, columns) for part in list_parts(path)]
+        for run, part in enumerate(parts):
+            part["run"] = run
+        results = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        results.attrs["metadata"] = [part.attrs["metadata"] for part in parts]
+        results.attrs["analyses"] = analyses
+        return results
+
+    file_format = get_format(path)
+    if file_format == "sqlite":
+        return read_sqlite(path, columns)
+    if file_format == "csv":
+        results = pd.read_csv(path, index_col=0)
+        if columns is not None:
+            results = results[[name for name in ["analysis"] if name in results] + list(columns)]
+        results.attrs["metadata"] = {}
+        results.attrs["analyses"] = read_analyses(path + "." + ANALYSES_FILE)
+        return results
+    if file_format == "npz":
+        # arrays of an npz file are only decompressed when accessed
+        with np.load(path, allow_pickle=False) as arrays:
+            metadata = json.loads(str(arrays[METADATA_KEY]))
+            kinds = metadata["columns"]
+            data = {}
+            for name in (kinds if columns is None else columns):
+                if kinds[name] == "list":
+                    data[name] = from_list_column(arrays[name + ".values"], arrays[name + ".offsets"])
+                else:
+                    data[name] = arrays[name]
+    else:
+        data, metadata = read_parquet(path, columns)
+        kinds = metadata["columns"]
+    for name in data:
+        if kinds[name] == "json":
+            data[name] = [json.loads(value) for value in data[name]]
+    results = pd.DataFrame(data)
+    results.attrs["metadata"] = metadata
+    return results
+
+
+def list_parts(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if os.path.splitext(name)[1] in (".parquet", ".npz")) if os.path.isdir(folder) else []
+
+
+def get_folder_format(folder):
+    """Format of the parts of a results folder: the one of its parts, else parquet if pyarrow is installed, else npz"""
+    parts = list_parts(folder)
+    if parts:
+        return get_format(parts[0])
+    return "parquet" if importlib.util.find_spec("pyarrow") is not None else "npz"
+
+
+def to_columns(results):
+    """Columns of results as NumPy arrays, and their kinds: "scalar" (numbers or strings), "list" ((values, offsets)
+    of flat lists of numbers, values having the smallest dtype holding them) or "json" (JSON texts of other values,
+    e.g. topologies of combined actions)"""
+    columns = {}
+    kinds = {}
+    for name in results.columns:
+        values = list(results[name])
+        if all(is_number(value) for value in values):
+            columns[name], kinds[name] = np.array(values, dtype=get_dtype(values)), "scalar"
+        elif all(isinstance(value, str) for value in values):
+            columns[name], kinds[name] = np.array(values, dtype=str), "scalar"
+        elif all(is_number(value) or is_flat_list(value) for value in values):
+            lists = [list(value) if is_flat_list(value) else [value] for value in values]
+            flat = [element for elements in lists for element in elements]
+            offsets = np.cumsum([0] + [len(elements) for elements in lists], dtype=np.int64)
+            columns[name], kinds[name] = (np.array(flat, dtype=get_dtype(flat)), offsets), "list"
+        else:
+            columns[name] = np.array([json.dumps(value, default=to_jsonable) for value in values], dtype=str)
+            kinds[name] = "json"
+    return columns, kinds
+
+
+def from_list_column(values, offsets):
+    return [values[start:end].tolist() for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def is_number(value):
+    return isinstance(value, (bool, int, float, np.bool_, np.integer, np.floating))
+
+
+def is_flat_list(value):
+    return isinstance(value, (list, tuple, np.ndarray)) and all(is_number(element) for element in value)
+
+
+def get_dtype(values):
+    """Smallest signed integer dtype holding integer values, bool for booleans, float64 otherwise"""
+    if len(values) and all(isinstance(value, (bool, np.bool_)) for value in values):
+        return bool
+    if len(values) and all(isinstance(value, (int, np.integer)) for value in values):
+        for dtype in (np.int8, np.int16, np.int32):
+            if np.iinfo(dtype).min <= min(values) and max(values) <= np.iinfo(dtype).max:
+                return dtype
+        return np.int64
+    return np.float64
+
+
+def to_jsonable(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+def write_parquet(columns, kinds, metadata, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet results need pyarrow (pip install pyarrow), npz results do not")
+    arrays = {}
+    for name, column in columns.items():
+        if kinds[name] == "list":
+            values, offsets = column
+            arrays[name] = pa.ListArray.from_arrays(pa.array(offsets, type=pa.int32()), pa.array(values))
+        else:
+            arrays[name] = pa.array(column)
+    table = pa.table(arrays).replace_schema_metadata(
+        {METADATA_KEY: json.dumps(metadata, default=to_jsonable)})
+    pq.write_table(table, path, compression="zstd")
+
+
+def read_parquet(path, columns=None):
+    import pyarrow.parquet as pq
+    table = pq.read_table(path, columns=columns)
+    metadata = json.loads(table.schema.metadata[METADATA_KEY.encode()])
+    data = {}
+    for name in table.column_names:
+        column = table.column(name)
+        data[name] = column.to_pylist() if metadata["columns"][name] == "list" else column.to_numpy()
+    return data, metadata
+
+
+def read_analyses(path):
+    """Metadata of the analyses recorded in the analyses.jsonl file of a sink, empty if there is none"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ResultsSink(ABC):
+    """Append-only destination of the end results of analyses. Results added are buffered and written by batches of
+    about batch_size rows (and on flush and close), so that a sweep does few writes and never rewrites previous
+    results. Analyses are numbered by the sink: the analysis column of the written results refers to their metadata"""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.buffer = []
+        self.n_buffered_rows = 0
+        self.n_analyses = 0
+        self.n_writes = 0
+
+    def add(self, results, metadata=None):
+        """Adds the end result dataframe of an analysis, with its metadata (JSON serializable dict)"""
+        metadata = dict(metadata or {})
+        metadata.setdefault("written", datetime.datetime.now().isoformat(timespec="seconds"))
+        self.buffer.append((results, metadata))
+        self.n_buffered_rows += len(results)
+        if self.n_buffered_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.write_batch(self.buffer)
+        self.n_writes += 1
+        self.buffer = []
+        self.n_buffered_rows = 0
+
+    @abstractmethod
+    def write_batch(self, batch):
+        """Writes a list of (results, metadata) of analyses"""
+
+    def number_batch(self, batch):
+        """Numbers the analyses of a batch. Returns their results in one dataframe, with an analysis column first, and
+        their metadata, with their analysis number"""
+        frames = []
+        analyses = []
+        for results, metadata in batch:
+            if len(results):
+                frame = results.copy()
+                frame.insert(0, "analysis", self.n_analyses)
+                frames.append(frame)
+            analyses.append(dict(metadata, analysis=self.n_analyses))
+            self.n_analyses += 1
+        return (pd.concat(frames) if frames else None), analyses
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvSink(ResultsSink):
+    """Appends rows to a CSV file, and the metadata of the analyses to <path>.analyses.jsonl"""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, append=True):
+        super().__init__(path, batch_size)
+        self.analyses_file = path + "." + ANALYSES_FILE
+        if not append:
+            for name in (path, self.analyses_file):
+                if os.path.exists(name):
+                    os.remove(name)
+        self.n_analyses = len(read_analyses(self.analyses_file))
+
+    def write_batch(self, batch):
+        results, analyses = self.number_batch(batch)
+        if results is not None:
+            header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", newline="") as f:
+                results.to_csv(f, index=True, header=header)
+                sync(f)
+        write_analyses(self.analyses_file, analyses)
+
+
+class PartsSink(ResultsSink):
+    """Adds a Parquet or npz part file to the path folder per batch, and the metadata of the analyses to its
+    analyses.jsonl file"""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, append=True, file_format=None):
+        super().__init__(path, batch_size)
+        self.file_format = file_format or (get_folder_format(path) if not os.path.splitext(str(path))[1]
+                                           else get_format(path))
+        self.analyses_file = os.path.join(path, ANALYSES_FILE)
+        if not append:
+            for name in list_parts(path) + [self.analyses_file]:
+                if os.path.exists(name):
+                    os.remove(name)
+        os.makedirs(path, exist_ok=True)
+        self.n_analyses = len(read_analyses(self.analyses_file))
+
+    def write_batch(self, batch):
+        results, analyses = self.number_batch(batch)
+        if results is not None:
+            write_results(results, self.path, append=True, file_format=self.file_format)
+        write_analyses(self.analyses_file, analyses)
+
+
+class SqliteSink(ResultsSink):
+    """Inserts the results in the results table of an SQLite database, and the metadata of the analyses in its
+    analyses table, in one transaction per batch. Numbers are stored as is, other values (topologies, lines...) as
+    JSON texts"""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, append=True):
+        super().__init__(path, batch_size)
+        if not append and os.path.exists(path):
+            os.remove(path)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS analyses (analysis INTEGER PRIMARY KEY, metadata TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS columns (position INTEGER PRIMARY KEY, name TEXT, "
+                                    "kind TEXT)")
+        self.kinds = get_sqlite_kinds(self.connection)
+        self.n_analyses = self.connection.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def write_batch(self, batch):
+        results, analyses = self.number_batch(batch)
+        with self.connection:
+            self.connection.executemany("INSERT INTO analyses VALUES (?, ?)", [
+                (analysis["analysis"], json.dumps(analysis, default=to_jsonable)) for analysis in analyses])
+            if results is not None:
+                self.insert(results)
+
+    def insert(self, results):
+        names = [name for name in results.columns if name != "analysis"]
+        if not self.kinds:
+            self.connection.execute("CREATE TABLE results (analysis INTEGER)")
+        for name in names:
+            kind = "scalar" if all(is_number(value) for value in results[name]) else "json"
+            if name not in self.kinds:
+                self.connection.execute("ALTER TABLE results ADD COLUMN {}".format(quote(name)))
+                self.connection.execute("INSERT INTO columns (name, kind) VALUES (?, ?)", (name, kind))
+                self.kinds[name] = kind
+            elif kind == "json" and self.kinds[name] == "scalar":
+                self.connection.execute("UPDATE columns SET kind = 'json' WHERE name = ?", (name,))
+                self.kinds[name] = kind
+        columns = [list(map(to_sqlite, results[name])) for name in ["analysis"] + names]
+        self.connection.executemany(
+            "INSERT INTO results ({}) VALUES ({})".format(", ".join(map(quote, ["analysis"] + names)),
+                                                          ", ".join("?" * len(columns))),
+            zip(*columns))
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.connection.close()
+
+
+class QueueSink(ResultsSink):
+    """Sink of a worker process, sending batches of results to the ResultsWriter process through its queue"""
+
+    def __init__(self, queue, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(None, batch_size)
+        self.queue = queue
+
+    def write_batch(self, batch):
+        self.queue.put(batch)
+
+    def __getstate__(self):
+        # buffered results stay in the process they were added in
+        return dict(self.__dict__, buffer=[], n_buffered_rows=0)
+
+
+class ResultsWriter:
+    """Single process writing the results of analyses run in other processes (e.g. workers of a process pool) to the
+    sink of path, so that they never write the same files. Workers add their results to the sinks given by get_sink,
+    and close them once done"""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, append=True, manager=None):
+        self.path = path
+        self.owns_manager = manager is None
+        self.manager = multiprocessing.Manager() if manager is None else manager
+        self.queue = self.manager.Queue()
+        self.process = multiprocessing.Process(target=run_results_writer, args=(self.queue, path, batch_size, append),
+                                               name="results-writer", daemon=True)
+        self.process.start()
+
+    def get_sink(self, batch_size=DEFAULT_BATCH_SIZE):
+        return QueueSink(self.queue, batch_size)
+
+    def close(self):
+        """Waits for the writer process to write the results sent so far"""
+        if self.process is None:
+            return
+        self.queue.put(None)
+        self.process.join()
+        exitcode = self.process.exitcode
+        self.process = None
+        if self.owns_manager:
+            self.manager.shutdown()
+        if exitcode != 0:
+            raise RuntimeError("The results writer of {} failed with exit code {}".format(self.path, exitcode))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def run_results_writer(queue, path, batch_size, append):
+    with open_results_sink(path, batch_size, append) as sink:
+        for batch in iter(queue.get, None):
+            for results, metadata in batch:
+                sink.add(results, metadata)
+    logger.info("%d analyses written to %s", sink.n_analyses, path)
+
+
+def open_results_sink(path, batch_size=DEFAULT_BATCH_SIZE, append=True, file_format=None):
+    """Results sink of path, following its extension: a CSV file, an SQLite database (.sqlite, .db), or a folder of
+    Parquet or npz parts (a path without extension, or with a .parquet or .npz one)"""
+    if file_format is None and not os.path.splitext(str(path))[1]:
+        file_format = get_folder_format(path)
+    file_format = get_format(path, file_format)
+    if file_format == "csv":
+        return CsvSink(path, batch_size, append)
+    if file_format == "sqlite":
+        return SqliteSink(path, batch_size, append)
+    return PartsSink(path, batch_size, append, file_format)
+
+
+def write_analyses(path, analyses):
+    with open(path, "a") as f:
+        for analysis in analyses:
+            f.write(json.dumps(analysis, default=to_jsonable) + "\n")
+        sync(f)
+
+
+def sync(f):
+    """Makes sure a batch is on disk before the next one is buffered"""
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def to_sqlite(value):
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    if is_number(value):
+        return value.item() if isinstance(value, np.generic) else value
+    return json.dumps(value, default=to_jsonable)
+
+
+def get_sqlite_kinds(connection):
+    return dict(connection.execute("SELECT name, kind FROM columns ORDER BY position").fetchall())
+
+
+def read_sqlite(path, columns=None):
+    connection = sqlite3.connect(path)
+    try:
+        kinds = get_sqlite_kinds(connection)
+        names = ["analysis"] + [name for name in (kinds if columns is None else columns)]
+        rows = connection.execute("SELECT {} FROM results".format(", ".join(map(quote, names)))).fetchall() \
+            if kinds else []
+        analyses = [json.loads(metadata) for metadata, in
+                    connection.execute("SELECT metadata FROM analyses ORDER BY analysis")]
+    finally:
+        connection.close()
+    results = pd.DataFrame(rows, columns=names)
+    for name in names[1:]:
+        if kinds.get(name) == "json":
+            results[name] = [json.loads(value) if isinstance(value, str) else value for value in results[name]]
+    results.attrs["metadata"] = {}
+    results.attrs["analyses"] = analyses
+    return results
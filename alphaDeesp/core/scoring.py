@@ -0,0 +1,51 @@
+"""Simulator independent scoring of simulated grid states, vectorized over several simulations"""
+
+import numpy as np
+
+
+def get_worsened_lines(old_rho, new_rho, old_time_reco, new_time_reco, nb_timestep_cooldown_line_param=0):
+    """Boolean array of the lines that got worse between an old grid state and new ones: existing overload worsened,
+    new overload, or line disconnected in cascade. new_* arrays can have one row per new state"""
+    old_rho, new_rho = np.abs(old_rho), np.abs(new_rho)
+    overload_worsened = (new_rho > 1) & (old_rho > 1) & (new_rho > 1.05 * old_rho)  # contrainte existante empiree
+    overload_created = (new_rho > 1) & (old_rho < 1)
+    cascading_disconnection = (np.asarray(new_time_reco) - old_time_reco) > nb_timestep_cooldown_line_param
+    return overload_worsened | overload_created | cascading_disconnection
+
+
+def score_changes(ltc, old_rho, new_rho, old_time_reco, new_time_reco, old_loads, new_loads,
+                  nb_timestep_cooldown_line_param=0):
+    """Computes a score to quantify the change between an old grid state and new ones, given their lines capacity
+    usage, timesteps before lines are reconnectable and loads. new_* arrays can have one row per new state.
+    @:return float array of scores between [0 and 4], NaN if there is no overload in the old state
+    4: if every overload disappeared
+    3: if an overload disappeared without stressing the network
+    2: if at least 30% of an overload was relieved
+    1: if an overload was relieved but another appeared and got worse
+    0: if no overloads were alleviated or if it resulted in some load shedding or production distribution.
+    """
+    old_rho, new_rho = np.asarray(old_rho), np.asarray(new_rho)
+    is_ltc = np.isin(np.arange(old_rho.shape[-1]), ltc)
+    old_overloads = old_rho > 1.0
+
+    overload_worsened = ((new_rho > 1.05 * old_rho) & (new_rho > 1.0)).any(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentage_relieved = (old_rho - new_rho) * 100 / (old_rho - 1.0)
+    constraint_30percent_relieved = (old_overloads & is_ltc & (percentage_relieved > 30.0)).any(axis=-1)
+    constraint_relieved = (old_overloads & (new_rho < 1.0) & is_ltc).any(axis=-1)
+    overload_created = ((old_rho < 1.0) & (new_rho > 1.0)).any(axis=-1)
+    line_cascading_disconnection = \
+        ((np.asarray(new_time_reco) - old_time_reco) > nb_timestep_cooldown_line_param).any(axis=-1)
+    overloads_remaining = (new_rho > 1.0).any(axis=-1)
+    cut_load_percent = np.sum(np.absolute(np.asarray(new_loads) - old_loads), axis=-1) / np.sum(old_loads)
+
+    # first matching condition gives the score
+    scores = np.select([cut_load_percent > 0.01,
+                        constraint_relieved & (overload_created | overload_worsened | line_cascading_disconnection),
+                        ~overloads_remaining,
+                        constraint_relieved & ~overload_worsened,
+                        constraint_30percent_relieved & ~overload_worsened],
+                       [0, 1, 4, 3, 2], default=0).astype(float)
+    if not old_overloads.any():
+        scores[...] = float('nan')
+    return scores
@@ -1,17 +1,72 @@
 from abc import ABC, abstractmethod
 from math import fabs
+import asyncio
+import logging
+import threading
 import numpy as np
 
 import pandas as pd
 
 from alphaDeesp.core.elements import ExtremityLine, OriginLine
+from alphaDeesp.core.profiler import Profiler
+from alphaDeesp.core.records import RetentionBag, create_simulation_batch
+from alphaDeesp.core.results import open_results_sink, write_results
+
+logger = logging.getLogger(__name__)
 
 
 class Simulation(ABC):
     """Abstract Class Simulation"""
 
+    # Whether simulate_batch keeps the full simulator observations, e.g. for plots
+    keep_observations = False
+    # Records the stages of the simulations and their counters, disabled unless set by expert_operator
+    profiler = Profiler(enabled=False)
+    # Results sink the end results of the analyses are added to instead of resultsFile, e.g. for sweeps
+    results_sink = None
+
     def __init__(self):
         super().__init__()
+        # simulated states of the analysis, bounded by create_save_bag once alphadeesp parameters are known
+        self.save_bag = RetentionBag()
+        # stored with the end results, e.g. chronic scenario and timestep of the analysed state
+        self.run_metadata = {}
+        # powerflows run by cut_lines_and_recomputes_flows, usually when the simulation is built, so before a profiler
+        # is attached: expert_operator adds them to its powerflows counter
+        self.line_cut_powerflows = 0
+
+    def create_save_bag(self):
+        """Bag of the simulated states of the analysis, kept following simulationRetention in alphadeesp parameters:
+        all, none, or the number of best simulations to keep"""
+        return RetentionBag(self.param_options.get("simulationretention", "all"))
+
+    def clear_simulated_states(self):
+        """Forgets the simulated states kept from a previous analysis"""
+        self.save_bag.clear()
+
+    def close(self):
+        """Releases the observations, dataframes and simulated states held by the simulation. It cannot be used for
+        further analyses afterwards"""
+        self.clear_simulated_states()
+        self.obs = None
+        self.obs_linecut = None
+        self.topo = None
+        self.topo_linecut = None
+        self.df = None
+        self.substations_elements = {}
+        self.internal_to_external_mapping = {}
+        self.external_to_internal_mapping = {}
+
+    def plot_simulated_states(self):
+        """Plots the simulated states kept in save bag, one after the other"""
+        for name, simulated_obs in self.save_bag:
+            self.plot_grid_from_obs(simulated_obs, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
     @abstractmethod
@@ -73,6 +128,286 @@ class Simulation(ABC):
     def build_powerflow_graph_aftercut(self):
         """TODO"""
 
+    def get_candidates_to_simulate(self, ranked_combinations, pool_factor=1):
+        """Yields (score_topo, node, topology) of the ranked combinations to simulate, following the number of
+        simulated topologies (in total and per node) given in alphadeesp parameters. With pool_factor, up to
+        pool_factor times these numbers are yielded, as a pool of candidates to prescreen.
+        A topology ranked several times (e.g. once per overload) is only simulated once"""
+        j = 0
+        already_simulated = set()
+        for df in ranked_combinations:
+            ii = 0
+            if j == int(self.args_number_of_simulated_topos) * pool_factor:
+                break
+            for i, row in df.iterrows():
+                if ii == int(self.args_inner_number_of_simulated_topos_per_node) * pool_factor:
+                    break
+                key = (row["node"], tuple(row["topology"]))
+                if key in already_simulated:
+                    continue
+                already_simulated.add(key)
+                yield i, row["node"], row["topology"]
+                ii += 1
+                j += 1
+
+    def apply_simulation_budget(self, candidates):
+        """First candidates (score_topo, node, topology), in the given order, within the number of simulated
+        topologies (in total and per node) given in alphadeesp parameters"""
+        n_total = int(self.args_number_of_simulated_topos)
+        n_per_node = int(self.args_inner_number_of_simulated_topos_per_node)
+        kept = []
+        n_kept_per_node = {}
+        for candidate in candidates:
+            if len(kept) == n_total:
+                break
+            node = candidate[1]
+            if n_kept_per_node.get(node, 0) < n_per_node:
+                n_kept_per_node[node] = n_kept_per_node.get(node, 0) + 1
+                kept.append(candidate)
+        return kept
+
+    def prescreen_candidates(self, candidates):
+        """DC pre-screening of the candidates (score_topo, node, topology) to simulate, following dcPrescreening in
+        alphadeesp parameters: 0 keeps them as ranked, 1 reorders them by estimated relief of the overloads (the ones
+        estimated to create new overloads coming last), 2 also drops the ones estimated not to relieve the overloads.
+        Candidates whose effect cannot be estimated are kept, after the others"""
+        mode = int(self.param_options.get("dcprescreening", 0))
+        if mode == 0:
+            return candidates
+
+        estimated = []
+        not_estimated = []
+        for candidate in candidates:
+            estimation = self.estimate_candidate_relief(candidate[1], candidate[2])
+            if estimation is None:
+                not_estimated.append(candidate)
+                continue
+            relief, n_new_overloads = estimation
+            if mode == 2 and relief <= 0:
+                continue
+            estimated.append((n_new_overloads > 0, -relief, candidate))
+        estimated.sort(key=lambda estimation: estimation[:2])
+        screened_candidates = [estimation[2] for estimation in estimated] + not_estimated
+        logger.info("DC prescreening: %s candidates kept for simulation out of %s", len(screened_candidates),
+                    len(candidates))
+        return screened_candidates
+
+    def estimate_candidate_relief(self, node, topology):
+        """Returns (estimated relief of the overloads, estimated number of new overloads) for a candidate topology at
+        node, without running a powerflow. None if this simulator cannot estimate it"""
+        return None
+
+    def get_pairs_to_simulate(self, single_results):
+        """Pair search: combines the best simulated single topologies of two distinct substations.
+        single_results is a list of (score_row, action). The effect of a pair on the overloaded lines is estimated by
+        superposition of the delta flows of its two single topologies, and only the most promising pairs are
+        returned, as a list of (estimated relief, (score_row1, action1), (score_row2, action2)).
+        Number of candidates per node and of simulated pairs are given in alphadeesp parameters"""
+        n_pairs = int(self.param_options.get("totalnumberofsimulatedpairs", 0))
+        n_candidates_per_node = int(self.param_options.get("numberofcandidatespernodeforpairs", 2))
+        if n_pairs <= 0:
+            return []
+        # no need for combined actions if one single topology already solves all overloads
+        if any(score_row["Topology simulated score"] == 4 for score_row, action in single_results):
+            return []
+
+        candidates_per_node = {}
+        for score_row, action in single_results:
+            if score_row["Efficacity"] != score_row["Efficacity"]:  # game over, NaN efficacity
+                continue
+            relief = self.get_estimated_relief(score_row["Flows before"], score_row["Delta flows"])
+            if relief > 0:
+                candidates_per_node.setdefault(score_row["Substation ID"], []).append((relief, score_row, action))
+
+        candidates = []
+        for node_candidates in candidates_per_node.values():
+            node_candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            candidates += node_candidates[:n_candidates_per_node]
+
+        pairs = []
+        for i in range(len(candidates)):
+            for j in range(i + 1, len(candidates)):
+                relief1, score_row1, action1 = candidates[i]
+                relief2, score_row2, action2 = candidates[j]
+                if score_row1["Substation ID"] == score_row2["Substation ID"]:
+                    continue
+                delta_flows = np.atleast_1d(score_row1["Delta flows"]) + np.atleast_1d(score_row2["Delta flows"])
+                relief = self.get_estimated_relief(score_row1["Flows before"], delta_flows)
+                pairs.append((relief, (score_row1, action1), (score_row2, action2)))
+
+        pairs.sort(key=lambda pair: pair[0], reverse=True)
+        return pairs[:n_pairs]
+
+    @staticmethod
+    def get_estimated_relief(flows_before, delta_flows):
+        """Decrease of the flows (in absolute value) on the overloaded lines, summed up over these lines"""
+        flows_before = np.atleast_1d(np.array(flows_before, dtype=float))
+        flows_after = flows_before - np.atleast_1d(np.array(delta_flows, dtype=float))
+        return float(np.sum(np.abs(flows_before) - np.abs(flows_after)))
+
+    def get_candidate_action(self, node, topology):
+        """Returns (action, applied_topology): the simulator action applying topology (alphaDeesp internal format) at
+        node, and this topology as described by the simulator"""
+        raise NotImplementedError("Candidate actions are not available for this simulator")
+
+    def get_do_nothing_action(self):
+        """Simulator action changing nothing"""
+        raise NotImplementedError("Do nothing action is not available for this simulator")
+
+    def simulate(self, action):
+        """Simulates action, returns (observation, reward, done, info) as Grid2op obs.simulate"""
+        raise NotImplementedError("Simulation is not available for this simulator")
+
+    def simulate_batch(self, actions):
+        """Simulates several actions and returns their results as a NumPy structured array with one element per action
+        (see records.get_simulation_batch_dtype). Simulators can override it to simulate them concurrently, this
+        default implementation simulates them one after the other with simulate"""
+        simulations = [self.simulate(action) for action in actions]
+        observations = [obs for obs, reward, done, info in simulations] if self.keep_observations else None
+        return create_simulation_batch(simulations, observations)
+
+    def score_simulations(self, results, changes):
+        """Returns the score_data (end result dataframe row) of each simulation result of a batch, None to leave it out.
+        changes gives the (node, internal_topology, applied_topology, score_topo) simulated in each of them"""
+        raise NotImplementedError("Scoring of simulations is not available for this simulator")
+
+    def compute_new_network_changes(self, ranked_combinations):
+        """
+        This function takes a dataframe ranked_combinations,
+        For each combination it computes a simulation step by following the given combinations, all of them being
+        simulated at once with simulate_batch
+        Number of tested combinations and topo per node is given in alphadeesp parameters
+        :returns pandas.DataFrame with results of simulations, and the simulated actions
+        """
+        logger.info("Compute new network changes")
+        end_result_dataframe = self.create_end_result_empty_dataframe()
+        actions = []
+        for score_row, action in self.iter_new_network_changes(ranked_combinations, batch_size=None):
+            actions.append(action)
+            max_index = end_result_dataframe.shape[0]  # rows
+            end_result_dataframe.loc[max_index] = score_row
+
+        self.write_results(end_result_dataframe)
+
+        # Case there are no hubs --> action do nothing
+        if len(actions) == 0:
+            actions = [self.get_do_nothing_action()]
+        return end_result_dataframe, actions
+
+    def write_results(self, end_result_dataframe):
+        """Writes the end result dataframe to resultsFile in alphadeesp parameters (./END_RESULT_DATAFRAME.csv by
+        default), as CSV, Parquet or compressed npz following its extension. With appendResults, the results of each
+        analysis are added to the ones already written through a results sink, see alphaDeesp.core.results.
+        If results_sink is set, the results are added to it instead"""
+        if self.results_sink is not None:
+            self.results_sink.add(end_result_dataframe, self.get_run_metadata())
+            return self.results_sink.path
+        path = self.param_options.get("resultsfile", "./END_RESULT_DATAFRAME.csv")
+        if bool(int(self.param_options.get("appendresults", 0))):
+            with open_results_sink(path) as sink:
+                sink.add(end_result_dataframe, self.get_run_metadata())
+            return path
+        return write_results(end_result_dataframe, path, metadata=self.get_run_metadata())
+
+    def get_run_metadata(self):
+        """Metadata of the analysis stored with its end results: simulator, grid, lines to cut, alphadeesp parameters
+        and run_metadata"""
+        metadata = {"simulator": type(self).__name__,
+                    "ltc": [int(line) for line in getattr(self, "ltc", [])],
+                    "grid": self.param_options.get("gridpath"),
+                    "parameters": dict(self.param_options)}
+        metadata.update(self.run_metadata)
+        return metadata
+
+    def iter_new_network_changes(self, ranked_combinations, stop_event=None, batch_size=1):
+        """
+        Streaming version of compute_new_network_changes: yields (score_row, action) as soon as the simulation of each
+        combination is done, score_row being a pandas.Series with the end result dataframe columns.
+        Combinations are simulated by batches of batch_size (all at once if None). With the default of 1, results
+        come as soon as possible but simulate_batch gets one action at a time, without parallel simulations.
+        Simulations stop when the generator is closed or when stop_event (threading.Event like) is set.
+        Once single topologies are simulated, the most promising pairs of them are simulated as combined actions.
+        The simulated states of a previous analysis are forgotten
+        """
+        self.clear_simulated_states()
+        # with DC prescreening, a larger pool of ranked candidates is screened before applying the simulation budget,
+        # so that candidates ranked just below it can be simulated
+        pool_factor = 1
+        if int(self.param_options.get("dcprescreening", 0)):
+            pool_factor = max(1, int(self.param_options.get("dcprescreeningpool", 4)))
+        with self.profiler.stage("candidate selection"):
+            candidates = list(self.get_candidates_to_simulate(ranked_combinations, pool_factor))
+        self.profiler.count("candidates selected", len(candidates))
+        with self.profiler.stage("dc prescreening"):
+            candidates = self.prescreen_candidates(candidates)
+            if pool_factor > 1:
+                candidates = self.apply_simulation_budget(candidates)
+
+        changes = []
+        with self.profiler.stage("candidate actions"):
+            for score_topo, node, topology in candidates:
+                logger.debug("Compute new network changes on node [%s] with new topo [%s]", node, topology)
+                action, applied_topology = self.get_candidate_action(node, topology)
+                changes.append((action, node, topology, applied_topology, score_topo))
+
+        single_results = []
+        for score_row, action in self.iter_changes_results(changes, stop_event, batch_size):
+            single_results.append((score_row, action))
+            yield score_row, action
+
+        pair_changes = []
+        with self.profiler.stage("pair search"):
+            pairs = self.get_pairs_to_simulate(single_results)
+        for relief, (score_row1, action1), (score_row2, action2) in pairs:
+            logger.debug("Compute new network changes on nodes [%s] and [%s] combined, estimated relief %s",
+                         score_row1["Substation ID"], score_row2["Substation ID"], relief)
+            pair_changes.append((action1 + action2,
+                                 (score_row1["Substation ID"], score_row2["Substation ID"]),
+                                 (score_row1["Internal Topology applied "], score_row2["Internal Topology applied "]),
+                                 (score_row1["Topology applied"], score_row2["Topology applied"]),
+                                 (score_row1["Topology score"], score_row2["Topology score"])))
+        yield from self.iter_changes_results(pair_changes, stop_event, batch_size)
+
+    def iter_changes_results(self, changes, stop_event=None, batch_size=1):
+        """Simulates changes (action, node, internal_topology, applied_topology, score_topo) by batches with
+        simulate_batch, and yields (score_row, action) of each of them"""
+        if batch_size is None:
+            batch_size = max(len(changes), 1)
+        for start in range(0, len(changes), batch_size):
+            if stop_event is not None and stop_event.is_set():
+                break
+            batch = changes[start:start + batch_size]
+            with self.profiler.stage("simulation"):
+                results = self.simulate_batch([action for action, *change in batch])
+            # one powerflow per simulated action
+            self.profiler.count("candidates simulated", len(batch))
+            self.profiler.count("powerflows", len(batch))
+            with self.profiler.stage("result scoring"):
+                all_score_data = self.score_simulations(results, [tuple(change) for action, *change in batch])
+            for (action, *change), score_data in zip(batch, all_score_data):
+                if score_data is not None:
+                    yield self.create_end_result_row(score_data), action
+
+    async def aiter_new_network_changes(self, ranked_combinations, batch_size=1):
+        """Asynchronous iterator over iter_new_network_changes. Simulations are run in a thread so that the event loop
+        is not blocked. Leaving the iteration (break, cancellation) stops the remaining simulations"""
+        loop = asyncio.get_event_loop()
+        stop_event = threading.Event()
+        generator = self.iter_new_network_changes(ranked_combinations, stop_event=stop_event, batch_size=batch_size)
+        end = object()
+        try:
+            while True:
+                item = await loop.run_in_executor(None, next, generator, end)
+                if item is end:
+                    break
+                yield item
+        finally:
+            stop_event.set()
+
+    def create_end_result_row(self, score_data):
+        """Returns score_data as a pandas.Series indexed by the end result dataframe columns"""
+        return pd.Series(score_data, index=self.create_end_result_empty_dataframe().columns, dtype=object)
+
     @staticmethod
     def create_end_result_empty_dataframe():
         """This function creates initial structure for the dataframe"""
@@ -167,7 +502,9 @@ class Simulation(ABC):
 
         # now we identify gray edges
         gray_edges = []
-        ltc_report = df["delta_flows"].abs()[line_to_cut[0]]#pd.DataFrame.max(df["delta_flows"].abs())
+        # with several overloaded lines, the threshold is relative to the largest report. Lines to cut that are not
+        # overloads of interest (other_ltc) are left aside as before
+        ltc_report = df["delta_flows"].abs()[list(self.ltc)].max()#pd.DataFrame.max(df["delta_flows"].abs())
         # print("max = ", max_report)
         max_overload = ltc_report * float(self.param_options["ThresholdReportOfLine"])
         # print("max overload = ", max_overload)
@@ -181,7 +518,7 @@ class Simulation(ABC):
 
         # if self.debug:
         # print("==== After gray_edges added IN FUNCTION CREATE DF ====")
-        print(df)
+        logger.debug("Dataframe of the overflow graph:\n%s", df)
 
         return df
 
@@ -1,11 +1,61 @@
 #!/usr/bin/python3
 
+import logging
+
 from alphaDeesp.core.alphadeesp import AlphaDeesp
 from alphaDeesp.core.printer import Printer
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
+
+def expert_operator(sim, plot=False, debug=False, profiler=None):
+    """Runs the expert system on sim and returns (ranked_combinations, expert_system_results, actions).
+    If a Profiler is given, the stages and counters of the analysis are recorded in it, and its report is returned as
+    a fourth value. Its powerflows counter includes the line cut powerflows run when the simulation was built"""
+    previous_profiler = sim.profiler
+    if profiler is not None:
+        sim.profiler = profiler
+        profiler.count("powerflows", sim.line_cut_powerflows)
+    try:
+        with sim.profiler.stage("expert operator"):
+            ranked_combinations = compute_ranked_combinations(sim, plot=plot, debug=debug)
+
+            # Expert results --> end dataframe
+            with sim.profiler.stage("network changes"):
+                expert_system_results, actions = sim.compute_new_network_changes(ranked_combinations)
+            logger.info("END RESULT DATAFRAME\n%s", expert_system_results)
+
+            # Plot option
+            if plot:
+                with sim.profiler.stage("plots"):
+                    sim.plot_simulated_states()
+        # memory held at the end of the analysis, with trace_memory
+        sim.profiler.record_structures({"sim": sim})
+        sim.profiler.record_allocations()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            sim.profiler = previous_profiler
+
+    if profiler is not None:
+        return ranked_combinations, expert_system_results, actions, profiler.report()
+    return ranked_combinations, expert_system_results, actions
+
+
+def expert_operator_stream(sim, debug=False, stop_event=None, batch_size=1):
+    """Streaming version of expert_operator: yields (score_row, action) as soon as each ranked topology has been
+    simulated, so that the caller can stop (close the generator or set stop_event) once a satisfactory action arrived.
+    Topologies are simulated by batches of batch_size: the default of 1 gives the first results soonest, but each
+    simulate_batch call then has a single action, so that simulation sessions and workers are not used in parallel"""
+    ranked_combinations = compute_ranked_combinations(sim, debug=debug)
+    for score_row, action in sim.iter_new_network_changes(ranked_combinations, stop_event=stop_event,
+                                                          batch_size=batch_size):
+        yield score_row, action
 
-def expert_operator(sim, plot=False, debug=False):
+
+def compute_ranked_combinations(sim, plot=False, debug=False):
+    """Runs alphadeesp on the simulator data and returns the ranked combinations to simulate"""
     # ====================================================================
     # Load the simulator given desired environment and config.ini
 
@@ -20,9 +70,11 @@ def expert_operator(sim, plot=False, debug=False):
 
     # Get data representing the grid before and after line cutting, and topologies
     df_of_g = sim.get_dataframe()
-    g_over = sim.build_graph_from_data_frame(ltc)
-    g_pow = sim.build_powerflow_graph_beforecut()
-    g_pow_prime = sim.build_powerflow_graph_aftercut()
+    with sim.profiler.stage("overflow graph"):
+        g_over = sim.build_graph_from_data_frame(ltc)
+    with sim.profiler.stage("powerflow graphs"):
+        g_pow = sim.build_powerflow_graph_beforecut()
+        g_pow_prime = sim.build_powerflow_graph_aftercut()
     simulator_data = {"substations_elements": sim.get_substation_elements(),
                       "substation_to_node_mapping": sim.get_substation_to_node_mapping(),
                       "internal_to_external_mapping": sim.get_internal_to_external_mapping()}
@@ -37,12 +89,22 @@ def expert_operator(sim, plot=False, debug=False):
     isAntenna_Sub=sim.isAntenna()
     isDoubleLine = sim.isDoubleLine()
     if isDoubleLine is not None:
-        print("check")
+        logger.debug("lines %s are parallel to the lines to cut", isDoubleLine)
 
     # Launch alphadeesp core
     if isAntenna_Sub is None:
-        alphadeesp = AlphaDeesp(g_over, df_of_g, custom_layout, printer, simulator_data,sim.substation_in_cooldown, debug = debug)
-        ranked_combinations = alphadeesp.get_ranked_combinations()
+        with sim.profiler.stage("alphadeesp"):
+            alphadeesp = AlphaDeesp(g_over, df_of_g, custom_layout, printer, simulator_data,sim.substation_in_cooldown, debug = debug,
+                                    graph_retention=sim.param_options.get("graphretention", "all"))
+            ranked_combinations = alphadeesp.get_ranked_combinations()
+        # graphs of alphadeesp are released once its results are recorded
+        with alphadeesp:
+            # stages of alphadeesp are timed by alphadeesp itself
+            for stage, duration in alphadeesp.timings.items():
+                sim.profiler.record("alphadeesp " + stage, duration)
+            for counter, n in alphadeesp.counters.items():
+                sim.profiler.count(counter, n)
+            sim.profiler.record_structures({"alphadeesp": alphadeesp})
     else:
         ranked_combinations = []
         ranked_combinations.append(pd.DataFrame({
@@ -51,21 +113,4 @@ def expert_operator(sim, plot=False, debug=False):
             "node": isAntenna_Sub
         }))
 
-
-    # Expert results --> end dataframe
-    expert_system_results, actions = sim.compute_new_network_changes(ranked_combinations)
-    print("--------------------------------------------------------------------------------------------")
-    print("----------------------------------- END RESULT DATAFRAME -----------------------------------")
-    print("--------------------------------------------------------------------------------------------")
-    print(expert_system_results)
-
-    # Plot option
-    if plot:
-        for elem in sim.save_bag:  # elem[0] = name, elem[1] = graph
-            name = elem[0]
-            simulated_obs = elem[1]
-            sim.plot_grid_from_obs(simulated_obs, name)
-
-    return ranked_combinations, expert_system_results, actions
-
-
+    return ranked_combinations
@@ -2,11 +2,11 @@
 __author__ = "MarcM, NMegel, mjothy"
 
 import os
+import logging
 import argparse
 import configparser
 
 from alphaDeesp.core.printer import shell_print_project_header
-from alphaDeesp.expert_operator import expert_operator
 
 def main():
     # ###############################################################################################################
@@ -27,11 +27,34 @@ def main():
                         help="List of integers representing the lines to cut", default = [9])
     parser.add_argument("-t", "--timestep", type=int,
                         help="ID of the timestep to use, starting from 0. Default is 0, i.e. the first time step will be considered", default = 0)
+    parser.add_argument("-n", "--screening", type=int,
+                        help="If > 0 (Grid2op only), screens all N-1 line outages first and analyses the grid state "
+                             "after each of the n worst contingencies at the same timestep, on the lines they overload. "
+                             "Needs --timestep >= 1, outages being applied by a step from the previous timestep. "
+                             "--ltc is then ignored",
+                        default=0)
+    parser.add_argument("--screeningmethod", choices=["lodf", "backend"],
+                        help="N-1 screening through the LODF of a DC approximation (default) or backend powerflows",
+                        default="lodf")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="Number of worker processes for backend N-1 screening. Default is 1", default=1)
     parser.add_argument("-c", "--chronicscenario",
                         help="Name or id of chronic scenario to consider, as stored in chronics folder. By default, the first available chronic scenario will be chosen",
                         default=None)
 
+    parser.add_argument("-r", "--report",
+                        help="File to write the per stage profiling report of the expert system to, as Prometheus "
+                             "text if it ends with .prom, as JSON otherwise", default=None)
+    parser.add_argument("-m", "--tracememory", type=int,
+                        help="If 1, the profiling report also gives the peak memory of each stage (slower)", default=0)
+    parser.add_argument("-p", "--profile", choices=["sampling", "cprofile"],
+                        help="Profiles the expert system call stacks with a sampling profiler or cProfile, and writes "
+                             "collapsed stacks (flame graph) and a hotspot summary in the output folder tree",
+                        default=None)
+
     args = parser.parse_args()
+    # Analysis progress at INFO level, per candidate details at DEBUG level with --debug 1
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format="%(message)s")
     config = configparser.ConfigParser()
     config.read("./alphaDeesp/config.ini")
     print("#### PARAMETERS #####")
@@ -39,9 +62,8 @@ def main():
         print("key: {} = {}".format(key, config['DEFAULT'][key]))
     print("#### ########## #####\n")
 
-    if args.ltc is None or len(args.ltc) != 1:
-        raise ValueError("Input arg error, --ltc, for the moment, we allow cutting only one line.\n\nPlease select"
-                         " one line to cut ex: python3 -m alphaDeesp.main -l 9")
+    if not args.ltc:
+        raise ValueError("Input arg error, --ltc, please select at least one line to cut ex: python3 -m alphaDeesp.main -l 9")
 
     if args.snapshot > 1:
         raise ValueError("Input arg error, --snapshot, options are 0 or 1")
@@ -49,6 +71,9 @@ def main():
     if args.debug > 1:
         raise ValueError("Input arg error, --debug, options are 0 or 1")
 
+    if args.screening > 0 and args.timestep < 1:
+        raise ValueError("Input arg error, --screening needs --timestep >= 1")
+
 
     print("-------------------------------------")
     print(f"Working on lines: {args.ltc} ")
@@ -71,7 +96,7 @@ def main():
         loader = PypownetObservationLoader(parameters_folder)
         env, obs, action_space = loader.get_observation(args.timestep)
         sim = PypownetSimulation(env, obs, action_space, param_options=config["DEFAULT"], debug=args.debug,
-                                 ltc=args.ltc)
+                                 ltc=args.ltc, loader_options=(parameters_folder, args.timestep))
     elif config["DEFAULT"]["simulatorType"] == "Grid2OP":
         print("We init Grid2OP Simulation")
         from alphaDeesp.core.grid2op.Grid2opSimulation import Grid2opSimulation
@@ -91,6 +116,9 @@ def main():
         if args.chronicscenario is None:
             args.chronicscenario = loader.search_chronic_name_from_num(0)
 
+        if args.screening > 0:
+            return run_screening(args, config, loader, obs, action_space, difficulty)
+
         # Create plot folders locally
         if args.snapshot:
             plot_base_folder = "alphaDeesp/ressources/output"
@@ -101,6 +129,22 @@ def main():
         sim = Grid2opSimulation(obs, action_space, observation_space, param_options=config["DEFAULT"], debug=args.debug,
                                  ltc=args.ltc, plot=args.snapshot, plot_folder = plot_folder)
 
+    elif config["DEFAULT"]["simulatorType"] == "DC":
+        print("We init DC Simulation")
+        from alphaDeesp.core.dc.DCSimulation import DCSimulation
+        from alphaDeesp.core.dc.DCObservationLoader import DCObservationLoader
+
+        loader = DCObservationLoader(config["DEFAULT"]["gridPath"])
+        obs = loader.get_observation(chronic_scenario=args.chronicscenario, timestep=args.timestep)
+        if args.chronicscenario is None and loader.chronics:
+            args.chronicscenario = loader.search_chronic_name_from_num(0)
+
+        plot_folder = None
+        if args.snapshot:
+            plot_folder = generate_plot_folders("alphaDeesp/ressources/output", args, config)
+        sim = DCSimulation(obs, param_options=config["DEFAULT"], debug=args.debug, ltc=args.ltc, plot=args.snapshot,
+                           plot_folder=plot_folder)
+
     elif config["DEFAULT"]["simulatorType"] == "RTE":
         print("We init RTE Simulation")
         # sim = RTESimulation()
@@ -110,17 +154,106 @@ def main():
 
     # ###############################################################################################################
     # Call agent mode with possible plot and debug fonctionalities
-    ranked_combinations, expert_system_results, action = expert_operator(sim, plot=args.snapshot)
+    # The expert core (networkx, pandas) is only imported by run_expert_operator, once arguments are validated
+    sim.run_metadata.update(chronic_scenario=args.chronicscenario, timestep=args.timestep)
+    (ranked_combinations, expert_system_results, action), report = run_expert_operator(sim, args, config)
+    if args.report:
+        write_reports(args.report, [({}, report)])
 
     return ranked_combinations, expert_system_results, action
 
 
+def run_expert_operator(sim, args, config):
+    """Runs expert_operator on sim, with the per stage profiling report (--report) and the call stack profile
+    (--profile) asked for. Returns (expert_operator results, profiling report or None)"""
+    from alphaDeesp.expert_operator import expert_operator
+    from alphaDeesp.core.profiler import Profiler, profile_call
+
+    kwargs = {"plot": args.snapshot}
+    if args.report:
+        kwargs["profiler"] = Profiler(trace_memory=bool(args.tracememory))
+    if args.profile:
+        profile_folder = generate_plot_folders("alphaDeesp/ressources/output", args, config)
+        results, paths = profile_call(expert_operator, sim, output_folder=profile_folder, method=args.profile,
+                                      name="expert_operator", **kwargs)
+        print("Profile of the expert system written to {}".format(", ".join(paths)))
+    else:
+        results = expert_operator(sim, **kwargs)
+    if args.report:
+        return results[:3], results[3]
+    return results, None
+
+
+def write_reports(path, labelled_reports):
+    """Writes profiling reports, given as a list of (labels, report), as Prometheus text if path ends with .prom, as a
+    JSON list of {"labels": labels, "report": report} otherwise"""
+    from alphaDeesp.core.profiler import report_to_json, report_to_prometheus
+    with open(path, "w") as f:
+        if path.endswith(".prom"):
+            f.write("".join(report_to_prometheus(report, labels=labels) for labels, report in labelled_reports))
+        else:
+            f.write(report_to_json([{"labels": labels, "report": report} for labels, report in labelled_reports],
+                                   indent=2))
+    print("Profiling report written to {}".format(path))
+
+
+def run_screening(args, config, loader, obs, action_space, difficulty):
+    """Screens the N-1 contingencies of the loaded Grid2op state, then runs the expert system on the grid state after
+    each of the args.screening worst contingencies, on the lines it overloads. The end results of all the analyses are
+    recorded in resultsFile, through one results sink.
+    Returns a list of (contingency, expert_operator results)"""
+    from alphaDeesp.core.grid2op.Grid2opContingencyScreening import screen_contingencies, apply_contingency
+    from alphaDeesp.core.grid2op.Grid2opSimulation import Grid2opSimulation
+    from alphaDeesp.core.results import open_results_sink
+
+    loader_options = (config["DEFAULT"]["gridPath"], difficulty, args.chronicscenario, args.timestep)
+    contingencies, timings = screen_contingencies(obs, action_space, method=args.screeningmethod,
+                                                  n_workers=args.workers, loader_options=loader_options)
+    print(contingencies)
+
+    results = []
+    reports = []
+    parameters = config["DEFAULT"]
+    results_sink = open_results_sink(parameters.get("resultsfile", "./END_RESULT_DATAFRAME.csv"),
+                                     batch_size=int(parameters.get("resultsbatchsize", 1000)),
+                                     append=bool(int(parameters.get("appendresults", 0))))
+    with results_sink:
+        for contingency in contingencies["Contingency"][:args.screening]:
+            env, obs, action_space = apply_contingency(loader, contingency, chronic_scenario=args.chronicscenario,
+                                                       timestep=args.timestep)
+            args.ltc = [line for line in range(obs.n_line) if obs.rho[line] > 1]
+            if not args.ltc:
+                print("No overload after the outage of line {}, nothing to analyse".format(contingency))
+                continue
+            print("-------------------------------------")
+            print(f"Working on lines: {args.ltc} after the outage of line {contingency}")
+            print("-------------------------------------\n")
+
+            plot_folder = None
+            if args.snapshot:
+                plot_folder = generate_plot_folders("alphaDeesp/ressources/output", args, config)
+            with Grid2opSimulation(obs, action_space, env.observation_space, param_options=parameters,
+                                   debug=args.debug, ltc=args.ltc, plot=args.snapshot, plot_folder=plot_folder) as sim:
+                sim.run_metadata.update(chronic_scenario=args.chronicscenario, timestep=args.timestep,
+                                        contingency=int(contingency))
+                sim.results_sink = results_sink
+                result, report = run_expert_operator(sim, args, config)
+            if args.report:
+                reports.append(({"contingency": int(contingency)}, report))
+                print("Expert system on the outage of line {} took {:.2f}s".format(
+                    contingency, report["stages"]["expert operator"]["wall_time"]))
+            results.append((contingency, result))
+    if args.report:
+        write_reports(args.report, reports)
+    return results
+
+
 def generate_plot_folders(plot_folder, args, config):
     os.makedirs(plot_folder, exist_ok=True)
     gridName = config['DEFAULT']['gridPath'].split('/')[-1]
     plot_folder = os.path.join(plot_folder, gridName)
     os.makedirs(plot_folder, exist_ok=True)
-    lineName = 'linetocut_' + str(args.ltc[0])
+    lineName = 'linetocut_' + '_'.join(str(line) for line in args.ltc)
     plot_folder = os.path.join(plot_folder, lineName)
     os.makedirs(plot_folder, exist_ok=True)
     scenarioName = 'Scenario_' + str(args.chronicscenario)
@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+"""Resident expert system service.
+
+Grid2op environments are created once per worker process and kept warm between requests.
+Requests are received over a local TCP socket, one JSON object per line:
+
+    {"id": "req-1", "ltc": [9], "chronic_scenario": 0, "timestep": 0, "parameters": {"totalNumberOfSimulatedTopos": 10}}
+
+The grid state is the one of the chronic scenario at the timestep: "observation" vectors are rejected, as the
+simulations would still run on the chronic scenario state.
+For each request, ranked actions are streamed back as JSON lines of type "action" as soon as they are simulated,
+followed by a line of type "done" (or "error").
+With --results, the end results of all the analyses are also recorded in a results file (CSV, SQLite database, or
+folder of Parquet or npz parts), written by a single writer process.
+With "profile": true (or "sampling", "cprofile"), the call stacks of the analysis are profiled, and the flame graph
+and hotspots files are written to its plot folder, as with main --profile. Their paths are given in the "done" line.
+"""
+
+import os
+import json
+import time
+import queue
+import asyncio
+import argparse
+import functools
+import configparser
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+DEFAULT_CONFIG_FILE = "./alphaDeesp/config.ini"
+# Seconds waited for a result before checking whether the analysis failed without sending its end
+QUEUE_POLL_TIMEOUT = 0.5
+DEFAULT_OUTPUT_FOLDER = "alphaDeesp/ressources/output"
+PROFILE_METHODS = {True: "sampling", "sampling": "sampling", "cprofile": "cprofile"}
+
+
+def read_config(config_file, overrides=None):
+    """Reads config.ini and applies the parameters overrides of a request"""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    if overrides:
+        for key, value in overrides.items():
+            config["DEFAULT"][key] = str(value)
+    return config
+
+
+def to_jsonable(obj):
+    """Converts numpy and pandas values of the end result dataframe into JSON serializable objects"""
+    import numpy as np
+
+    if isinstance(obj, dict):
+        return {str(key): to_jsonable(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(value) for value in obj]
+    if isinstance(obj, np.ndarray):
+        return to_jsonable(obj.tolist())
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and obj != obj:  # NaN is not valid JSON
+        return None
+    return obj
+
+
+def init_worker(config_file):
+    """Warms up the worker process with the environment of the configured grid"""
+    from alphaDeesp.core.grid2op.Grid2opObservationLoader import get_cached_loader
+
+    config = read_config(config_file)
+    get_cached_loader(config["DEFAULT"]["gridPath"], difficulty=get_difficulty(config))
+
+
+def get_difficulty(config):
+    try:
+        return str(config["DEFAULT"]["grid2opDifficulty"])
+    except KeyError:
+        return None
+
+
+def run_analysis(request, config_file, results_queue, results_sink=None, stop_event=None):
+    """Runs one expert analysis in a worker process. Ranked actions are put in results_queue as serializable dicts as
+    soon as they are simulated, and None is put once the analysis is over. Simulations stop once stop_event is set.
+    The end results are also added to results_sink if any"""
+    try:
+        import pandas as pd
+        from alphaDeesp.core.grid2op.Grid2opObservationLoader import get_cached_loader
+        from alphaDeesp.core.grid2op.Grid2opSimulation import Grid2opSimulation
+        from alphaDeesp.expert_operator import expert_operator_stream
+
+        config = read_config(config_file, request.get("parameters"))
+        if config["DEFAULT"]["simulatorType"] != "Grid2OP":
+            raise ValueError("The expert system service only handles the Grid2OP simulator")
+
+        loader = get_cached_loader(config["DEFAULT"]["gridPath"], difficulty=get_difficulty(config))
+        # A chronic scenario is always given to the loader, so that the warm environment is reset before moving
+        # to the timestep
+        env, obs, action_space = loader.get_observation(chronic_scenario=request.get("chronic_scenario", 0),
+                                                        timestep=int(request.get("timestep", 0)))
+
+        # the simulation is closed once the analysis is over, not to keep its states in the warm worker
+        with Grid2opSimulation(obs, action_space, env.observation_space, param_options=config["DEFAULT"],
+                               ltc=list(request["ltc"])) as sim:
+            sim.run_metadata.update(request=request.get("id"), chronic_scenario=request.get("chronic_scenario", 0),
+                                    timestep=int(request.get("timestep", 0)))
+            score_rows = []
+            batch_size = int(config["DEFAULT"].get("streamingBatchSize", 1))
+            for score_row, action in expert_operator_stream(sim, stop_event=stop_event, batch_size=batch_size):
+                results_queue.put({"result": to_jsonable(score_row.to_dict()),
+                                   "action": to_jsonable(action.as_dict())})
+                score_rows.append(score_row)
+            if results_sink is not None:
+                with results_sink:
+                    results_sink.add(pd.DataFrame(score_rows), sim.get_run_metadata())
+    finally:
+        results_queue.put(None)
+
+
+def get_plot_folder(request, config, output_folder=DEFAULT_OUTPUT_FOLDER):
+    """Plot folder of the grid state of a request, in the output folder tree of main (grid, lines, scenario, timestep)"""
+    from alphaDeesp.main import generate_plot_folders
+
+    args = argparse.Namespace(ltc=request["ltc"], chronicscenario=request.get("chronic_scenario", 0),
+                              timestep=int(request.get("timestep", 0)))
+    return generate_plot_folders(output_folder, args, config)
+
+
+class ExpertSystemService:
+    """asyncio front end dispatching analysis requests to a pool of warm worker processes"""
+
+    def __init__(self, config_file=DEFAULT_CONFIG_FILE, n_workers=1, results_file=None,
+                 output_folder=DEFAULT_OUTPUT_FOLDER):
+        self.config_file = config_file
+        self.n_workers = n_workers
+        # root of the plot folders, profiles of the requests are written to
+        self.output_folder = output_folder
+        self.pool = self.create_pool()
+        # Queues shared with the worker processes to stream results back
+        self.manager = multiprocessing.Manager()
+        self.results_writer = None
+        if results_file is not None:
+            from alphaDeesp.core.results import ResultsWriter
+
+            parameters = read_config(config_file)["DEFAULT"]
+            self.results_writer = ResultsWriter(results_file, batch_size=int(parameters.get("resultsbatchsize", 1000)),
+                                                manager=self.manager)
+
+    def create_pool(self):
+        return ProcessPoolExecutor(max_workers=self.n_workers, initializer=init_worker, initargs=(self.config_file,))
+
+    async def handle_client(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line.decode())
+            except ValueError as e:
+                await self.send(writer, {"type": "error", "message": "Invalid JSON request: " + str(e)})
+                continue
+            await self.handle_request(request, writer)
+            if writer.is_closing():
+                break
+        writer.close()
+
+    async def handle_request(self, request, writer):
+        request_id = request.get("id")
+        if not request.get("ltc"):
+            await self.send(writer, {"id": request_id, "type": "error", "message": "ltc is missing"})
+            return
+        if request.get("observation") is not None:
+            # obs.from_vect would only change the observation arrays, not the state its simulations start from
+            await self.send(writer, {"id": request_id, "type": "error",
+                                     "message": "observation vectors are not supported, give the chronic_scenario "
+                                                "and timestep of the grid state"})
+            return
+        profile = request.get("profile", False)
+        if profile and profile not in PROFILE_METHODS:
+            await self.send(writer, {"id": request_id, "type": "error",
+                                     "message": "profile should be true, sampling or cprofile, got {}".format(profile)})
+            return
+
+        start = time.time()
+        loop = asyncio.get_event_loop()
+        results_queue = self.manager.Queue()
+        # set when the client disconnects, to stop the simulations of the worker
+        stop_event = self.manager.Event()
+        results_sink = self.results_writer.get_sink() if self.results_writer is not None else None
+        analysis_function = run_analysis
+        if profile:
+            from alphaDeesp.core.profiler import profile_call
+
+            profile_folder = get_plot_folder(request, read_config(self.config_file, request.get("parameters")),
+                                             self.output_folder)
+            analysis_function = functools.partial(profile_call, run_analysis, output_folder=profile_folder,
+                                                  method=PROFILE_METHODS[profile], name="expert_operator")
+        analysis = loop.run_in_executor(self.pool, analysis_function, request, self.config_file, results_queue,
+                                        results_sink, stop_event)
+
+        rank = 0
+        get_result = functools.partial(results_queue.get, timeout=QUEUE_POLL_TIMEOUT)
+        while True:
+            try:
+                result = await loop.run_in_executor(None, get_result)
+            except queue.Empty:
+                # run_analysis always puts None last, unless the worker failed to start or died
+                if analysis.done():
+                    break
+                continue
+            if result is None:
+                break
+            if not stop_event.is_set():
+                try:
+                    await self.send(writer, dict(result, id=request_id, type="action", rank=rank))
+                except ConnectionError:
+                    stop_event.set()
+            rank += 1
+
+        try:
+            analysis_result = await analysis
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # a worker died or could not be initialized, the next requests get a new pool
+                self.pool.shutdown(wait=False)
+                self.pool = self.create_pool()
+            message = {"id": request_id, "type": "error", "message": repr(e)}
+        else:
+            message = {"id": request_id, "type": "done", "elapsed": time.time() - start}
+            if profile:
+                result, profile_paths = analysis_result
+                message["profile"] = profile_paths
+        if not stop_event.is_set():
+            await self.send(writer, message)
+
+    @staticmethod
+    async def send(writer, message):
+        if writer.is_closing():
+            raise ConnectionResetError("The client disconnected")
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print("Expert system service listening on {}:{}".format(host, port))
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown()
+        if self.results_writer is not None:
+            self.results_writer.close()
+        self.manager.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expert System service")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on. Default is local only")
+    parser.add_argument("-p", "--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument("-w", "--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Number of worker processes, each one keeping its own warm grid2op environments")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE, help="Path to config.ini")
+    parser.add_argument("--results", default=None,
+                        help="Records the end results of all the analyses in this file (.csv, .sqlite) or folder of "
+                             "Parquet or npz parts, appending to the ones already there")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_FOLDER,
+                        help="Root of the plot folder tree the profiles of the requests are written to")
+    args = parser.parse_args()
+
+    service = ExpertSystemService(args.config, n_workers=args.workers, results_file=args.results,
+                                  output_folder=args.output)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
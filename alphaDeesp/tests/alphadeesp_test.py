@@ -134,5 +134,89 @@ def test_get_constrained_path():
     graph_dot_file_path = ""
 
 
-# test_is_amont()
-# test_is_aval()
\ No newline at end of file
+
+def test_get_constrained_paths_with_several_overloads():
+    """With two constrained (black) edges, one constrained path per edge is returned"""
+    g = nx.MultiDiGraph()
+    g.add_edge(1, 2, color="blue")
+    g.add_edge(2, 3, color="black")
+    g.add_edge(3, 4, color="blue")
+    g.add_edge(4, 5, color="black")
+    g.add_edge(5, 6, color="blue")
+    alphadeesp = AlphaDeesp.__new__(AlphaDeesp)
+    alphadeesp.g_only_blue_components = g
+
+    c_paths = [ConstrainedPath(*path) for path in alphadeesp.get_constrained_paths()]
+    assert [c_path.constrained_edge for c_path in c_paths] == [(2, 3, 0), (4, 5, 0)]
+    assert c_paths[0].e_amont() == [(1, 2, 0)]
+    assert c_paths[0].e_aval() == [(3, 4, 0), (5, 6, 0)]
+    assert c_paths[1].e_amont() == [(3, 4, 0), (1, 2, 0)]
+    assert c_paths[1].e_aval() == [(5, 6, 0)]
+    # the single constrained path is the last one, as before
+    assert alphadeesp.get_constrained_path() == alphadeesp.get_constrained_paths()[-1]
+
+
+
+def test_rank_topologies_with_several_overloads():
+    """Nodes are scored on their own constrained path, and on each of them when they belong to several"""
+    import configparser
+    from alphaDeesp.core.dc.DCObservationLoader import DCObservationLoader
+    from alphaDeesp.core.dc.DCSimulation import DCSimulation
+
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    obs = DCObservationLoader("./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9").get_observation()
+    with DCSimulation(obs, param_options=config["DEFAULT"], ltc=[9, 0]) as sim:
+        simulator_data = {"substations_elements": sim.get_substation_elements(),
+                          "substation_to_node_mapping": sim.get_substation_to_node_mapping(),
+                          "internal_to_external_mapping": sim.get_internal_to_external_mapping()}
+        g_over = sim.build_graph_from_data_frame([9, 0])
+        sim.build_powerflow_graph_beforecut()
+        sim.build_powerflow_graph_aftercut()
+        with AlphaDeesp(g_over, sim.get_dataframe(), None, None, simulator_data,
+                        sim.substation_in_cooldown) as alphadeesp:
+            first_path, last_path = alphadeesp.constrained_paths
+            assert first_path.constrained_edge[:2] == (0, 1) and last_path.constrained_edge[:2] == (4, 5)
+
+            # node 3 is only in aval of the overload of line 0, not on the path of the last overload
+            assert alphadeesp.is_in_aval(alphadeesp.g, 3, first_path)
+            assert not alphadeesp.is_in_aval(alphadeesp.g, 3, last_path)
+            assert alphadeesp.is_in_aval(alphadeesp.g, 3)
+            assert alphadeesp.rank_current_topo_at_node_x(alphadeesp.g, 3, False, [0, 0, 0, 0, 0, 1]) == 23.09
+
+            # node 4 is in aval of the first overload and in amont of the last one
+            assert alphadeesp.is_in_amont(alphadeesp.g, 4, last_path)
+            assert not alphadeesp.is_in_amont(alphadeesp.g, 4, first_path)
+            topology = [0, 1, 0, 1, 0]
+            scores = [alphadeesp.rank_current_topo_at_node_x_on_path(alphadeesp.g, 4, c_path, False, topology)
+                      for c_path in alphadeesp.constrained_paths]
+            assert alphadeesp.rank_current_topo_at_node_x(alphadeesp.g, 4, False, topology) == \
+                np.around(sum(scores), decimals=2)
+
+
+def test_bounded_bag_of_graphs():
+    import configparser
+    from alphaDeesp.core.dc.DCObservationLoader import DCObservationLoader
+    from alphaDeesp.core.dc.DCSimulation import DCSimulation
+
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    obs = DCObservationLoader("./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9").get_observation()
+    with DCSimulation(obs, param_options=config["DEFAULT"], ltc=[9]) as sim:
+        simulator_data = {"substations_elements": sim.get_substation_elements(),
+                          "substation_to_node_mapping": sim.get_substation_to_node_mapping(),
+                          "internal_to_external_mapping": sim.get_internal_to_external_mapping()}
+        g_over = sim.build_graph_from_data_frame([9])
+        sim.build_powerflow_graph_beforecut()
+        sim.build_powerflow_graph_aftercut()
+        with AlphaDeesp(g_over, sim.get_dataframe(), None, None, simulator_data, sim.substation_in_cooldown,
+                        graph_retention="2") as alphadeesp:
+            ranked = pd.concat(alphadeesp.get_ranked_combinations()).reset_index().sort_values("score")
+            scores = {}
+            for score, topology, node in ranked[["score", "topology", "node"]].itertuples(index=False):
+                alphadeesp.apply_new_topo_to_graph(alphadeesp.g.copy(), topology, node)
+                scores["{}_{}".format(node, "".join(str(e) for e in topology))] = score
+
+            # the graphs of the 2 best topologies by score are kept, not the first ones applied
+            assert len(alphadeesp.bag_of_graphs) == 2 and alphadeesp.bag_of_graphs.n_added == len(ranked)
+            assert [scores[name] for name, graph in alphadeesp.bag_of_graphs] == sorted(scores.values())[::-1][:2]
@@ -0,0 +1,29 @@
+import configparser
+import json
+
+from alphaDeesp.benchmark import STAGES, run_benchmarks, compare_results
+
+
+def test_benchmark_stages(tmp_path):
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    results = run_benchmarks(config["DEFAULT"], grids=["./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9"],
+                             synthetic_sizes=[50], repeat=2)
+
+    assert [case["name"] for case in results["cases"]][1] == "synthetic_50"
+    grid_case, synthetic_case = results["cases"]
+    assert (grid_case["n_sub"], grid_case["ltc"]) == (14, [9])
+    assert synthetic_case["n_sub"] == 50 and grid_case["n_candidates"] > 0
+    for case in results["cases"]:
+        assert list(case["stages"]) == STAGES
+        assert all(len(stage["runs"]) == 2 and stage["min"] <= stage["median"] for stage in case["stages"].values())
+
+    with open(tmp_path / "benchmark.json", "w") as f:
+        json.dump(results, f)
+    with open(tmp_path / "benchmark.json") as f:
+        previous = json.load(f)
+    assert compare_results(previous, results) == []
+    previous["cases"][1]["stages"]["simulation setup"]["median"] /= 2
+    assert compare_results(previous, results) == [("synthetic_50", "simulation setup",
+                                                   previous["cases"][1]["stages"]["simulation setup"]["median"],
+                                                   synthetic_case["stages"]["simulation setup"]["median"])]
@@ -0,0 +1,105 @@
+import configparser
+import logging
+
+import numpy as np
+
+from alphaDeesp.core.dc.DCGrid import DCGrid
+from alphaDeesp.core.dc.DCObservation import DCObservation
+from alphaDeesp.core.dc.DCObservationLoader import DCObservationLoader
+from alphaDeesp.core.dc.DCSimulation import DCSimulation
+from alphaDeesp.core.dcpowerflow import DCPowerFlow
+from alphaDeesp.expert_operator import expert_operator
+
+PARAM_FOLDER = "./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9"
+
+
+def make_grid():
+    # 4 substations loop with an antenna to substation 4. Generators at 0 (slack) and 2
+    return DCGrid(line_or_to_subid=[0, 1, 2, 3, 1], line_ex_to_subid=[1, 2, 3, 0, 4],
+                  susceptances=[10., 5., 8., 4., 6.], thermal_limits=[100.] * 5,
+                  gen_to_subid=[2, 0], load_to_subid=[1, 3, 4])
+
+
+def test_dc_observation_flows():
+    grid = make_grid()
+    obs = DCObservation(grid, prod_p=[50., 0.], load_p=[40., 30., 20.])
+    assert not obs.done
+    assert np.isclose(obs.prod_p[grid.slack_gen], 40.)
+    # same flows as the dense DC powerflow, the slack bus being the one of the slack generator
+    dense = DCPowerFlow(grid.line_or_to_subid, grid.line_ex_to_subid, grid.susceptances,
+                        [40., -40., 50., -30., -20.], slack_bus=0)
+    assert np.allclose(obs.p_or, dense.flows)
+    assert np.allclose(obs.rho, np.abs(obs.p_or) / 100.)
+
+
+def test_dc_observation_actions():
+    grid = make_grid()
+    obs = DCObservation(grid, prod_p=[50., 0.], load_p=[40., 30., 20.])
+
+    # loop opened: the flows follow the remaining path
+    new_obs, reward, done, info = obs.simulate([("set_line_status", 3, -1)])
+    assert not done and not new_obs.line_status[3]
+    assert np.isclose(new_obs.p_or[0], 40.) and np.isclose(new_obs.p_or[2], 30.)
+
+    # bus split of substation 1 (load, line 1 origin, line 4 origin, line 0 extremity): the antenna is fed through
+    # line 0 on bus 2, the load through line 1 on bus 1
+    assert list(obs.get_sub_conf(1)) == [1, 1, 1, 1]
+    new_obs, reward, done, info = obs.simulate([("set_bus", 1, [1, 1, 2, 2])])
+    assert np.allclose(new_obs.p_or[[0, 1, 4]], [20., -40., 20.])
+
+    # antenna cut: its load is lost
+    assert obs.simulate([("set_line_status", 4, -1)])[2]
+    # combined actions, the load being disconnected first
+    new_obs, reward, done, info = obs.simulate([("set_bus", 4, [-1, 0]), ("set_line_status", 4, -1)])
+    assert not done and new_obs.load_p[2] == 0. and np.isclose(new_obs.prod_p[grid.slack_gen], 20.)
+
+
+def test_dc_observation_loader():
+    loader = DCObservationLoader(PARAM_FOLDER)
+    grid = loader.grid
+    assert (grid.n_sub, grid.n_line, grid.n_gen, grid.n_load) == (14, 20, 5, 11)
+    # same names as Grid2op, the external grid being the last generator
+    assert list(grid.name_gen) == ["gen_1_0", "gen_2_1", "gen_5_2", "gen_7_3", "gen_0_4"]
+    assert grid.name_line[15] == "8_13_15"
+    # thermal limits of config.py, converted to MW
+    assert np.isclose(grid.thermal_limits[9], np.sqrt(3) * 100. * 230. / 1000.)
+
+    obs = loader.get_observation(chronic_scenario="b", timestep=3)
+    assert np.isclose(np.sum(obs.prod_p), np.sum(obs.load_p))
+    assert loader.get_observation(chronic_scenario=1, timestep=3).load_p.tolist() == obs.load_p.tolist()
+
+
+def test_expert_operator_on_dc_simulation(tmp_path, monkeypatch):
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    obs = DCObservationLoader(PARAM_FOLDER).get_observation()
+    assert obs.rho[9] > 1
+
+    monkeypatch.chdir(tmp_path)
+    sim = DCSimulation(obs, param_options=config["DEFAULT"], ltc=[9])
+    ranked_combinations, expert_system_results, actions = expert_operator(sim)
+
+    assert len(expert_system_results) == len(actions) > 0
+    # same substations ranked first as with Grid2op
+    assert list(expert_system_results["Substation ID"][:11].unique()) == [4, 5]
+    assert (expert_system_results["Topology simulated score"] == 4).any()
+    best = expert_system_results["Efficacity"].astype(float).idxmax()
+    assert obs.simulate(actions[best])[0].rho[9] < 1
+    assert len(sim.save_bag) == len(expert_system_results)
+
+
+def test_dc_simulation_logs(caplog):
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    obs = DCObservationLoader(PARAM_FOLDER).get_observation()
+
+    with caplog.at_level(logging.INFO, logger="alphaDeesp"):
+        DCSimulation(obs, param_options=config["DEFAULT"], ltc=[9])
+    assert "Number of powerline of the powergrid: 20" in caplog.messages
+    # the dataframe is only formatted at debug level
+    assert not any(record.levelno == logging.DEBUG for record in caplog.records)
+
+    caplog.clear()
+    with caplog.at_level(logging.DEBUG, logger="alphaDeesp"):
+        DCSimulation(obs, param_options=config["DEFAULT"], ltc=[9])
+    assert any(message.startswith("Dataframe of the overflow graph") for message in caplog.messages)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from alphaDeesp.core.dcpowerflow import DCPowerFlow
+
+# 5 buses meshed grid, bus 4 being connected by a single line
+#   0 --- 1 --- 4
+#   | \   |
+#   3 --- 2
+LINE_OR_BUS = [0, 0, 1, 2, 3, 1]
+LINE_EX_BUS = [1, 2, 2, 3, 0, 4]
+SUSCEPTANCES = [10., 5., 8., 4., 6., 3.]
+INJECTIONS = [150., -40., -30., -50., -30.]
+
+
+def make_dc_powerflow(line_or_bus=LINE_OR_BUS, line_ex_bus=LINE_EX_BUS, injections=INJECTIONS):
+    return DCPowerFlow(line_or_bus, line_ex_bus, SUSCEPTANCES, injections, slack_bus=0)
+
+
+def test_dc_flows_balance():
+    dc = make_dc_powerflow()
+    # flows leaving each bus match its injection
+    balance = dc.incidence.T @ dc.flows
+    assert np.allclose(balance[1:], INJECTIONS[1:])
+    # the antenna line carries the load of bus 4
+    assert np.isclose(dc.flows[5], 30.)
+    # the flow change of a line is the ptdf times the injection change
+    new_injections = np.array(INJECTIONS) + np.array([10., 0., -10., 0., 0.])
+    assert np.allclose(make_dc_powerflow(injections=new_injections).flows,
+                       dc.flows + dc.ptdf[:, 0] * 10. - dc.ptdf[:, 2] * 10.)
+
+
+@pytest.mark.parametrize("outaged_lines", [[0], [2], [0, 3], [1, 2]])
+def test_outage_flows_match_dc_powerflow(outaged_lines):
+    dc = make_dc_powerflow()
+    line_or_bus = np.array(LINE_OR_BUS)
+    line_or_bus[outaged_lines] = -1
+    expected = make_dc_powerflow(line_or_bus=line_or_bus).flows
+    assert np.allclose(dc.outage_flows(outaged_lines), expected)
+    if len(outaged_lines) == 1:
+        assert np.allclose(dc.n1_flows()[:, outaged_lines[0]], expected)
+
+
+def test_outage_islanding():
+    dc = make_dc_powerflow()
+    assert np.all(np.isnan(dc.lodf[:, 5][:5]))
+    with pytest.raises(ValueError):
+        dc.outage_flows([5])
+
+
+@pytest.mark.parametrize("bus, moved_lines_or, moved_lines_ex, moved_injection",
+                         [(1, [5], [0], -10.), (2, [3], [], -20.), (0, [1], [4], 100.)])
+def test_bus_split_flows(bus, moved_lines_or, moved_lines_ex, moved_injection):
+    dc = make_dc_powerflow()
+    expected = dc.bus_split_flows_by_solve(bus, moved_lines_or, moved_lines_ex, moved_injection)
+    assert np.all(np.isfinite(expected))
+    assert np.allclose(dc.bus_split_flows(bus, moved_lines_or, moved_lines_ex, moved_injection), expected)
+
+
+def test_bus_split_islanding():
+    dc = make_dc_powerflow()
+    with pytest.raises(ValueError):
+        dc.bus_split_flows(1, [], [], moved_injection=-10.)
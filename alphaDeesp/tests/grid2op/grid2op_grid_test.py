@@ -65,8 +65,13 @@ def test_overflow_grid():
 def test_new_flows_after_network_cut():
     """After closing one electric line, the flows should change on the network."""
     sim, env = build_sim()
+    line_cut_powerflows = sim.line_cut_powerflows
 
     new_flows = sim.cut_lines_and_recomputes_flows([9])
+    assert sim.line_cut_powerflows == line_cut_powerflows + 1
+    # no powerflow when the flows are approximated
+    sim.cut_lines_and_recomputes_flows([9], approximate=True)
+    assert sim.line_cut_powerflows == line_cut_powerflows + 1
 
     print("diff flows = ")
     print((new_flows - sim.obs.p_or).astype(int))
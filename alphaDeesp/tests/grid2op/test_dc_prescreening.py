@@ -0,0 +1,41 @@
+import configparser
+from types import SimpleNamespace
+
+import numpy as np
+
+from alphaDeesp.core.grid2op.Grid2opObservationLoader import Grid2opObservationLoader
+from alphaDeesp.core.grid2op.Grid2opSimulation import Grid2opSimulation, get_dc_buses
+
+
+def test_get_dc_buses():
+    # line 0 from substation 0 to 1, line 1 from substation 1 to 2, a generator at 0 and a load at 2
+    obs = SimpleNamespace(n_sub=3, line_or_pos_topo_vect=np.array([0, 3]), line_ex_pos_topo_vect=np.array([2, 5]),
+                          line_or_to_subid=np.array([0, 1]), line_ex_to_subid=np.array([1, 2]),
+                          gen_pos_topo_vect=np.array([1]), gen_to_subid=np.array([0]),
+                          load_pos_topo_vect=np.array([4]), load_to_subid=np.array([2]),
+                          prod_p=np.array([50.]), load_p=np.array([40.]))
+    line_or_bus, line_ex_bus, injections = get_dc_buses(obs, np.ones(6, dtype=int))
+    assert list(line_or_bus) == [0, 1] and list(line_ex_bus) == [1, 2]
+    assert list(injections) == [50., 0., -40., 0., 0., 0.]
+
+    # origin of line 1 on bus 2 of substation 1, load disconnected
+    line_or_bus, line_ex_bus, injections = get_dc_buses(obs, np.array([1, 1, 1, 2, -1, 1]))
+    assert list(line_or_bus) == [0, 4] and list(line_ex_bus) == [1, 2]
+    assert list(injections) == [50., 0., 0., 0., 0., 0.]
+
+
+def test_estimate_candidate_relief():
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    loader = Grid2opObservationLoader("./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9")
+    env, obs, action_space = loader.get_observation(timestep=0)
+    sim = Grid2opSimulation(obs, action_space, env.observation_space, param_options=config["DEFAULT"], ltc=[9])
+
+    # disconnecting the overloaded line relieves it of all its flow
+    relief, n_new_overloads = sim.estimate_candidate_relief(None, [9])
+    assert np.isclose(relief, abs(obs.p_or[9]), rtol=1e-4)
+    assert isinstance(n_new_overloads, int)
+
+    # all the elements of substation 4 on bus 1: no split, flows are unchanged
+    n_elements = int(obs.sub_info[4])
+    assert sim.estimate_candidate_relief(4, [0] * n_elements) == (0., 0)
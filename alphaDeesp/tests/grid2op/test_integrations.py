@@ -1,4 +1,5 @@
 import configparser
+import os
 
 from alphaDeesp.core.alphadeesp import AlphaDeesp
 import pandas as pd
@@ -424,3 +425,41 @@ def test_double_lines_wcci_2020():
 
     print("AlphaDeesp succeeded for an overflow graph with double lines")
 
+
+
+def test_bounded_retention_keeps_copied_records(tmp_path, monkeypatch):
+    """With a bounded simulationRetention, only copies of the best simulated states are kept, not the batches they
+    come from"""
+    from alphaDeesp.expert_operator import expert_operator
+
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    config["DEFAULT"]["simulationRetention"] = "2"
+    loader = Grid2opObservationLoader("./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9")
+    env, obs, action_space = loader.get_observation(timestep=0)
+    sim = Grid2opSimulation(obs, action_space, env.observation_space, param_options=config["DEFAULT"], ltc=[9])
+    monkeypatch.chdir(tmp_path)  # end result dataframe is saved in the working directory
+    ranked_combinations, expert_system_results, actions = expert_operator(sim)
+
+    assert len(sim.save_bag) == 2 < len(expert_system_results)
+    assert all(record.rho.base is None and record.p_or.base is None for name, record in sim.save_bag)
+
+
+def test_plot_simulated_states_on_workers(tmp_path, monkeypatch):
+    """Observations of the simulated topologies are drawn by the worker processes of the printer"""
+    from alphaDeesp.expert_operator import expert_operator
+
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    config["DEFAULT"]["gridPath"] = os.path.abspath("./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9")
+    config["DEFAULT"]["plotWorkers"] = "2"
+    loader = Grid2opObservationLoader(config["DEFAULT"]["gridPath"])
+    env, obs, action_space = loader.get_observation(timestep=0)
+    sim = Grid2opSimulation(obs, action_space, env.observation_space, param_options=config["DEFAULT"], ltc=[9],
+                            plot=True, plot_folder=str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    ranked_combinations, expert_system_results, actions = expert_operator(sim)
+
+    filenames = sim.plot_simulated_states()
+    assert len(filenames) == len(sim.save_bag) > 1
+    assert all(os.path.exists(filename) for filename in filenames)
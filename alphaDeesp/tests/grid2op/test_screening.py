@@ -0,0 +1,20 @@
+import numpy as np
+
+from alphaDeesp.core.grid2op.Grid2opObservationLoader import Grid2opObservationLoader
+from alphaDeesp.core.grid2op.Grid2opContingencyScreening import screen_contingencies
+
+
+def test_screen_contingencies_lodf_and_backend():
+    param_folder = "./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9"
+    loader = Grid2opObservationLoader(param_folder)
+    env, obs, action_space = loader.get_observation(timestep=0)
+
+    lodf_contingencies, lodf_timings = screen_contingencies(obs, method="lodf")
+    backend_contingencies, backend_timings = screen_contingencies(obs, action_space, method="backend")
+    assert set(lodf_timings) == {"dc model", "outage flows", "ranking"}
+    assert set(backend_timings) == {"outage simulations", "ranking"}
+
+    for contingencies in [lodf_contingencies, backend_contingencies]:
+        assert list(contingencies["Severity"]) == sorted(contingencies["Severity"], reverse=True)
+        assert all(contingency not in overloaded for contingency, overloaded in
+                   zip(contingencies["Contingency"], contingencies["Overloaded lines"]))
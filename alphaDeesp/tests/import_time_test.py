@@ -0,0 +1,39 @@
+"""Import-time budget of the command line entry point.
+Heavy dependencies (expert core, plotting, simulators) should only be loaded when the code path needs them."""
+
+import subprocess
+import sys
+
+# cumulative import time allowed for alphaDeesp.main, in microseconds
+IMPORT_TIME_BUDGET_US = 500000
+
+HEAVY_MODULES = ["networkx", "pandas", "matplotlib", "pydot", "grid2op", "pypownet"]
+
+
+def get_cumulative_import_time(module_name):
+    """Runs python -X importtime in a fresh interpreter and returns the cumulative import time of module_name"""
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module_name],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 0, process.stderr
+
+    for line in process.stderr.splitlines():
+        # format is "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if fields[2].strip() == module_name:
+            return int(fields[1])
+    raise ValueError("Module {} not found in importtime report".format(module_name))
+
+
+def test_main_import_time_budget():
+    elapsed = get_cumulative_import_time("alphaDeesp.main")
+    print("alphaDeesp.main imported in {} us".format(elapsed))
+    assert elapsed <= IMPORT_TIME_BUDGET_US
+
+
+def test_main_does_not_import_heavy_modules():
+    code = "import sys, alphaDeesp.main; print(','.join(m for m in {} if m in sys.modules))".format(HEAVY_MODULES)
+    process = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 0
+    assert process.stdout.strip() == ""
@@ -0,0 +1,95 @@
+import configparser
+import gc
+import tracemalloc
+
+import pytest
+
+from alphaDeesp.benchmark import run_case, load_synthetic_case
+from alphaDeesp.core.dc.DCSimulation import DCSimulation
+from alphaDeesp.core.dc.SyntheticGrid import generate_synthetic_observation
+from alphaDeesp.expert_operator import expert_operator
+
+MB = 1e6
+
+
+def read_config():
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    return config["DEFAULT"]
+
+
+def test_synthetic_grid_memory_bounds():
+    report, description = run_case(lambda: load_synthetic_case(100), read_config(), trace_memory=True)
+    stages = report["stages"]
+    # about 4 times the peaks measured when these bounds were set
+    assert stages["simulation setup"]["peak_memory"] < 2 * MB
+    assert stages["create_df"]["peak_memory"] < 1 * MB
+    assert stages["overflow graph"]["peak_memory"] + stages["powerflow graphs"]["peak_memory"] < 2 * MB
+    assert stages["alphadeesp"]["peak_memory"] < 4 * MB
+    assert stages["candidate simulation"]["peak_memory"] < 6 * MB
+    assert stages["result scoring"]["peak_memory"] < 2 * MB
+
+    structures = {structure["name"]: structure["size"] for structure in report["structures"]}
+    assert 0 < structures["sim.save_bag"] < 2 * MB
+    assert max(structures.values()) < 2 * MB
+
+
+@pytest.mark.slow
+def test_large_synthetic_grid_memory_bounds():
+    # memory must grow with the size of the grid, not with its square: 10 times the substations of the grid above
+    report, description = run_case(lambda: load_synthetic_case(1000), read_config(), trace_memory=True)
+    stages = report["stages"]
+    # about 4 times the peaks measured when these bounds were set
+    assert stages["simulation setup"]["peak_memory"] < 4 * MB
+    assert stages["create_df"]["peak_memory"] < 3 * MB
+    assert stages["overflow graph"]["peak_memory"] + stages["powerflow graphs"]["peak_memory"] < 14 * MB
+    assert stages["alphadeesp"]["peak_memory"] < 25 * MB
+    assert stages["candidate simulation"]["peak_memory"] < 32 * MB
+    assert stages["result scoring"]["peak_memory"] < 6 * MB
+
+    structures = {structure["name"]: structure["size"] for structure in report["structures"]}
+    assert 0 < structures["sim.save_bag"] < 6 * MB
+    assert max(structures.values()) < 8 * MB
+
+
+def test_no_memory_leak_between_analyses(tmp_path, monkeypatch):
+    config = read_config()
+    monkeypatch.chdir(tmp_path)
+    obs, ltc = generate_synthetic_observation(30)
+
+    tracemalloc.start()
+    try:
+        memory = []
+        for i in range(3):
+            sim = DCSimulation(obs, param_options=config, ltc=ltc)
+            expert_operator(sim)
+            del sim
+            gc.collect()
+            memory.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+    # first runs fill caches (imports, pandas, numpy), the following ones must not keep anything
+    assert memory[2] - memory[1] < 0.1 * MB
+
+
+def test_reused_simulation_memory_is_bounded(tmp_path, monkeypatch):
+    config = read_config()
+    config["simulationRetention"] = "2"
+    monkeypatch.chdir(tmp_path)
+    obs, ltc = generate_synthetic_observation(30)
+
+    tracemalloc.start()
+    try:
+        memory = []
+        with DCSimulation(obs, param_options=config, ltc=ltc) as sim:
+            for i in range(4):
+                ranked_combinations, expert_system_results, actions = expert_operator(sim)
+                # best simulated states of the last analysis only
+                assert len(sim.save_bag) == 2 < len(expert_system_results)
+                gc.collect()
+                memory.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+    assert memory[3] - memory[1] < 0.1 * MB
+    # closed when leaving the with block
+    assert len(sim.save_bag) == 0 and sim.obs is None and sim.df is None
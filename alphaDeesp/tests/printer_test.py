@@ -0,0 +1,70 @@
+import configparser
+import importlib.util
+import shutil
+
+import networkx as nx
+import pytest
+
+from alphaDeesp.core import printer
+from alphaDeesp.core.printer import GraphLayout, Printer
+from alphaDeesp.core.dc.DCObservationLoader import DCObservationLoader
+from alphaDeesp.core.dc.DCSimulation import DCSimulation
+from alphaDeesp.expert_operator import expert_operator
+
+PARAM_FOLDER = "./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9"
+
+can_render = importlib.util.find_spec("pygraphviz") is not None or (
+    importlib.util.find_spec("pydot") is not None and shutil.which("neato") is not None)
+
+
+@pytest.mark.skipif(not can_render, reason="needs pygraphviz, or pydot and the neato executable")
+def test_plot_simulated_states(tmp_path, monkeypatch):
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    config["DEFAULT"]["plotWorkers"] = "2"
+    obs = DCObservationLoader(PARAM_FOLDER).get_observation()
+
+    monkeypatch.chdir(tmp_path)
+    sim = DCSimulation(obs, param_options=config["DEFAULT"], ltc=[9], plot=True, plot_folder=str(tmp_path))
+    expert_operator(sim, plot=True)
+
+    # one pdf per simulated topology, and the base graphs
+    assert len(list((tmp_path / "Result graph").glob("*.pdf"))) == len(sim.save_bag) > 0
+    assert len(list((tmp_path / "Base graph").glob("*.pdf"))) == 3
+
+
+def test_graph_layout():
+    g = nx.MultiDiGraph([(0, 1), (1, 2), (6660, 2), (6660, 1)])
+    # positions after the substations ones are the twin nodes ones
+    layout = GraphLayout.from_custom_layout([(0, 0), (100, 0), (200, 0), (90, 10)], n_sub=3)
+    assert layout.get_positions(g) == {0: (0, 0), 1: (100, 0), 2: (200, 0), 6660: (90, 10)}
+    # else twin nodes are next to their substation
+    assert GraphLayout([(0, 0), (100, 0), (200, 0)]).get_position(6661) == (120, -20)
+    assert GraphLayout([(0, 0)]).get_position("node") is None
+
+
+def test_computed_layout_is_cached(tmp_path, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(printer, "render_graph", lambda g, dot, pdf, positions: rendered.append(positions))
+    computed = []
+    compute = GraphLayout.compute
+    monkeypatch.setattr(GraphLayout, "compute", classmethod(lambda cls, g: computed.append(g) or compute(g)))
+    layout_file = str(tmp_path / "layouts" / "grid.json")
+    graphs = [("g_pow", nx.MultiDiGraph([(0, 1), (1, 2), (2, 0)])),
+              ("2_01", nx.MultiDiGraph([(0, 1), (1, 2), (0, 6662)]))]
+
+    Printer(str(tmp_path), workers=1, layout_file=layout_file).display_geo_all(graphs)
+    assert len(computed) == 1
+    assert set(rendered[1]) == {0, 1, 2, 6662}
+    assert rendered[1][0] == rendered[0][0]
+
+    # another run on the same grid reads the layout back
+    Printer(str(tmp_path), workers=1, layout_file=layout_file).display_geo_all(graphs)
+    assert len(computed) == 1
+    assert rendered[2] == rendered[0]
+
+
+def test_map_on_workers(tmp_path):
+    assert Printer(str(tmp_path), workers=1).map_on_workers(pow, [2, 3], [3, 2]) == [8, 9]
+    # calls are made on worker processes, results in order
+    assert Printer(str(tmp_path), workers=2).map_on_workers(pow, [2, 3, 4], [3, 2, 1]) == [8, 9, 4]
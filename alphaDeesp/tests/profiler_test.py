@@ -0,0 +1,86 @@
+import configparser
+import json
+
+from alphaDeesp.core.dc.DCObservationLoader import DCObservationLoader
+from alphaDeesp.core.dc.DCSimulation import DCSimulation
+from alphaDeesp.core.profiler import Profiler, report_to_prometheus, profile_call
+from alphaDeesp.expert_operator import expert_operator
+
+
+def test_profiler_stages():
+    profiler = Profiler(trace_memory=True)
+
+    @profiler.profile()
+    def allocate(size):
+        return bytearray(size)
+
+    with profiler.stage("outer"):
+        for i in range(2):
+            allocate(10 ** 6)
+        with profiler.stage("inner"):
+            data = bytearray(3 * 10 ** 6)
+    profiler.count("items", 2)
+    profiler.count("items")
+    profiler.stop()
+
+    report = profiler.report()
+    assert report["counters"] == {"items": 3}
+    assert report["stages"]["allocate"]["calls"] == 2 and report["stages"]["outer"]["calls"] == 1
+    assert 10 ** 6 <= report["stages"]["allocate"]["peak_memory"] < 2 * 10 ** 6
+    # the peak of a stage includes the ones of its inner stages
+    assert report["stages"]["outer"]["peak_memory"] >= report["stages"]["inner"]["peak_memory"] >= 3 * 10 ** 6
+    assert report["stages"]["outer"]["wall_time"] >= report["stages"]["inner"]["wall_time"]
+    # data allocated in a stage and still held when it ends, e.g. returned, is retained
+    assert report["stages"]["inner"]["retained_memory"] >= 3 * 10 ** 6
+    assert report["stages"]["allocate"]["retained_memory"] >= 2 * 10 ** 6
+    assert json.loads(profiler.to_json()) == report
+
+    text = report_to_prometheus(report, labels={"contingency": 9})
+    assert 'alphadeesp_stage_calls{contingency="9",stage="allocate"} 2' in text
+    assert 'alphadeesp_items_total{contingency="9"} 3' in text
+
+
+def test_disabled_profiler():
+    profiler = Profiler(enabled=False)
+    with profiler.stage("stage"):
+        profiler.count("items")
+    assert profiler.report() == {"stages": {}, "counters": {}}
+
+
+def test_expert_operator_report(tmp_path, monkeypatch):
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    obs = DCObservationLoader("./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9").get_observation()
+    monkeypatch.chdir(tmp_path)
+    sim = DCSimulation(obs, param_options=config["DEFAULT"], ltc=[9])
+    # the line cut powerflow is run when the simulation is built
+    assert sim.line_cut_powerflows == 1
+
+    ranked_combinations, expert_system_results, actions, report = expert_operator(sim, profiler=Profiler())
+    for stage in ["expert operator", "alphadeesp", "alphadeesp hubs", "simulation", "result scoring"]:
+        assert report["stages"][stage]["wall_time"] > 0
+    counters = report["counters"]
+    assert counters["combinations enumerated"] >= counters["combinations scored"] >= counters["candidates selected"]
+    assert counters["candidates simulated"] == len(expert_system_results)
+    assert counters["powerflows"] == 1 + counters["candidates simulated"]
+    # the simulation is not profiled anymore afterwards
+    assert not sim.profiler.enabled and len(expert_operator(sim)) == 3
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+def test_profile_call(tmp_path):
+    for method in ["sampling", "cprofile"]:
+        result, paths = profile_call(busy, 10 ** 6, output_folder=str(tmp_path / method), method=method,
+                                     interval=0.001, name="busy")
+        assert result == busy(10 ** 6)
+        collapsed = [path for path in paths if path.endswith("busy.collapsed")][0]
+        with open(collapsed) as f:
+            lines = f.read().splitlines()
+        assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+        assert any("busy (profiler_test.py" in line for line in lines)
+        with open(str(tmp_path / method / "busy_hotspots.txt")) as f:
+            assert "busy" in f.read()
+    assert (tmp_path / "cprofile" / "busy.prof").exists()
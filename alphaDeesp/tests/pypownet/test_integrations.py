@@ -131,7 +131,7 @@ def test_integration_dataframe_results_with_line_9_cut():
 
     ranked_combinations = alphadeesp.get_ranked_combinations()
 
-    expert_system_results = sim.compute_new_network_changes(ranked_combinations)
+    expert_system_results, actions = sim.compute_new_network_changes(ranked_combinations)
     # This removes the first XXX line (used to construct initial dataframe structure)
     expert_system_results = expert_system_results.drop(0, axis=0)
 
@@ -197,7 +197,7 @@ def test_integration_dataframe_results_with_line_8_cut():
 
     ranked_combinations = alphadeesp.get_ranked_combinations()
 
-    expert_system_results = sim.compute_new_network_changes(ranked_combinations)
+    expert_system_results, actions = sim.compute_new_network_changes(ranked_combinations)
     # This removes the first XXX line (used to construct initial dataframe structure)
     expert_system_results = expert_system_results.drop(0, axis=0)
 
@@ -0,0 +1,100 @@
+import gc
+import weakref
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from alphaDeesp.core.records import RetentionBag, SimulationRecord, create_simulation_batch, get_batch_record
+
+
+def test_simulation_record_from_observation():
+    obs = SimpleNamespace(rho=np.array([0.5, 1.2], dtype=np.float32), p_or=np.array([10., -20.], dtype=np.float32),
+                          p_ex=np.array([-9.9, 20.1]), prod_p=np.array([30.], dtype=np.float32),
+                          load_p=np.array([29.8], dtype=np.float32), line_status=np.array([True, True]),
+                          time_before_cooldown_line=np.array([0, 3]), topo_vect=np.ones(6, dtype=int))
+    record = SimulationRecord.from_observation(obs)
+
+    # float32 arrays of the observation are not copied
+    assert np.shares_memory(record.rho, obs.rho)
+    assert np.shares_memory(record.p_or, obs.p_or)
+    assert record.p_ex.dtype == np.float32
+    assert np.allclose(record.p_ex, obs.p_ex)
+    assert list(record.time_before_cooldown_line) == [0, 3]
+    assert not hasattr(record, "topo_vect")
+    assert record.nbytes == 2 * 4 * 3 + 4 * 2 + 2 + 2 * 4
+
+    copied = SimulationRecord.from_observation(obs, copy=True)
+    assert not np.shares_memory(copied.rho, obs.rho) and np.allclose(copied.rho, obs.rho)
+    assert copied.rho.dtype == np.float32
+
+
+def test_create_simulation_batch():
+    record = SimulationRecord([0.5, 1.2], [10., -20.], [-9.9, 20.1], [30.], [29.8], [True, True], [0, 3])
+    results = create_simulation_batch([(record, 1.5, False, {"disc_lines": np.array([-1, -1]), "iterations": 3}),
+                                       (None, None, True, {})],
+                                      observations=["full observation", None])
+
+    assert results.shape == (2,)
+    assert list(results["done"]) == [False, True]
+    assert results["reward"][0] == 1.5 and np.isnan(results["reward"][1])
+    assert results["rho"].shape == (2, 2)
+    assert np.allclose(results["p_or"][0], [10., -20.])
+    assert not results["p_or"][1].any()
+    assert list(results["disc_lines"][0]) == [-1, -1]
+    assert list(results["iterations"]) == [3, -1]
+    assert results["observation"][0] == "full observation"
+
+    batch_record = get_batch_record(results[0])
+    assert np.shares_memory(batch_record.rho, results["rho"])
+    assert list(batch_record.time_before_cooldown_line) == [0, 3]
+
+
+def test_create_empty_simulation_batch():
+    assert create_simulation_batch([]).shape == (0,)
+
+
+def test_retention_bag():
+    scores = [(4, 1.), (2, 5.), (4, 1.), (0, -np.inf), (4, 3.)]
+    everything = RetentionBag("all")
+    nothing = RetentionBag("none")
+    best = RetentionBag("2")
+    for i, score in enumerate(scores):
+        for bag in (everything, nothing, best):
+            bag.add("state_{}".format(i), i, score)
+
+    assert [item for name, item in everything] == [0, 1, 2, 3, 4]
+    assert len(nothing) == 0 and nothing.n_added == 5
+    # best first, ties going to the first added item
+    assert list(best) == [["state_4", 4], ["state_0", 0]]
+    assert best.get("state_0") == 0 and best.get("state_2") is None
+
+    # items without score rank below the scored ones
+    best.add("unscored", 5)
+    assert [name for name, item in best] == ["state_4", "state_0"]
+    best.clear()
+    best.add("unscored", 5)
+    assert len(best) == 1
+
+    with pytest.raises(ValueError):
+        RetentionBag("best")
+
+
+def test_bounded_retention_frees_simulation_batches():
+    best = RetentionBag("2")
+    batch_refs = []
+    for i in range(3):
+        record = SimulationRecord([0.5 + i, 1.2], [10., -20.], [-9.9, 20.1], [30.], [29.8], [True, True], [0, 3])
+        batch = create_simulation_batch([(record, 1.5, False, {})] * 4, observations=["observation"] * 4)
+        batch_refs.append(weakref.ref(batch))
+        for j, result in enumerate(batch):
+            # as saved by the simulations once scored
+            best.add("state_{}_{}".format(i, j), SimulationRecord.from_observation(get_batch_record(result), copy=True),
+                     (i, j))
+        del batch, result
+    gc.collect()
+
+    assert [name for name, record in best] == ["state_2_3", "state_2_2"]
+    assert all(record.rho.base is None for name, record in best)
+    # only the bounded records remain, not the batches they come from
+    assert all(batch_ref() is None for batch_ref in batch_refs)
@@ -0,0 +1,112 @@
+import configparser
+import importlib.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from alphaDeesp.core.dc.DCObservationLoader import DCObservationLoader
+from alphaDeesp.core.dc.DCSimulation import DCSimulation
+from alphaDeesp.core.results import ResultsWriter, open_results_sink, read_results, write_results
+from alphaDeesp.expert_operator import expert_operator
+
+PARAM_FOLDER = os.path.abspath("./alphaDeesp/tests/resources_for_tests_grid2op/l2rpn_2019_ltc_9")
+CONFIG_FILE = os.path.abspath("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+
+
+def run_analysis(tmp_path, monkeypatch, **parameters):
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    for key, value in parameters.items():
+        config["DEFAULT"][key] = value
+    obs = DCObservationLoader(PARAM_FOLDER).get_observation()
+    monkeypatch.chdir(tmp_path)
+    sim = DCSimulation(obs, param_options=config["DEFAULT"], ltc=[9])
+    sim.run_metadata["timestep"] = 0
+    return expert_operator(sim)[1]
+
+
+def test_npz_results(tmp_path, monkeypatch):
+    results = run_analysis(tmp_path, monkeypatch, resultsFile="results.npz")
+    read = read_results("results.npz")
+
+    assert list(read.columns) == list(results.columns)
+    assert read["Topology applied"].tolist() == [list(topology) for topology in results["Topology applied"]]
+    assert read["Worsened line"].tolist() == [[int(line) for line in lines] for lines in results["Worsened line"]]
+    assert np.allclose(read["Efficacity"], results["Efficacity"].astype(float))
+    assert read["Substation ID"].dtype == np.int8
+    metadata = read.attrs["metadata"]
+    assert (metadata["simulator"], metadata["ltc"], metadata["timestep"]) == ("DCSimulation", [9], 0)
+
+    pruned = read_results("results.npz", columns=["Substation ID", "Efficacity"])
+    assert list(pruned.columns) == ["Substation ID", "Efficacity"]
+
+
+def test_append_results(tmp_path, monkeypatch):
+    results = run_analysis(tmp_path, monkeypatch, resultsFile="sweep", appendResults="1")
+    run_analysis(tmp_path, monkeypatch, resultsFile="sweep", appendResults="1")
+
+    read = read_results("sweep", columns=["Efficacity"])
+    assert len([name for name in os.listdir("sweep") if name.startswith("part-")]) == 2
+    assert len(read) == 2 * len(results) and read["run"].tolist() == [0] * len(results) + [1] * len(results)
+    assert read["analysis"].tolist() == read["run"].tolist()
+    assert [(analysis["analysis"], analysis["ltc"]) for analysis in read.attrs["analyses"]] == [(0, [9]), (1, [9])]
+
+
+def test_nested_values_are_kept(tmp_path):
+    # combined actions have one topology per substation
+    results = pd.DataFrame({"Substation ID": [4, (4, 5)], "Internal Topology applied ": [[0, 1], [[0, 1], [1, 0]]]})
+    for extension in ["npz"] + (["parquet"] if importlib.util.find_spec("pyarrow") else []):
+        path = str(tmp_path / ("results." + extension))
+        write_results(results, path)
+        read = read_results(path)
+        assert read["Substation ID"].tolist() == [[4], [4, 5]]
+        assert read["Internal Topology applied "].tolist() == [[0, 1], [[0, 1], [1, 0]]]
+
+
+def add_results(sink, timesteps):
+    for timestep in timesteps:
+        sink.add(pd.DataFrame({"Substation ID": [timestep, timestep], "Topology applied": [[0, 1], [1, 0]]}),
+                 {"timestep": timestep})
+
+
+def send_results(sink, timesteps):
+    with sink:
+        add_results(sink, timesteps)
+
+
+def test_results_sinks(tmp_path):
+    for name in ["results.csv", "results.sqlite", "results"]:
+        path = str(tmp_path / name)
+        with open_results_sink(path, batch_size=4, file_format="npz" if name == "results" else None) as sink:
+            add_results(sink, [0, 1, 2])
+            # rows are only written by batches of 4
+            assert sink.n_writes == 1 and len(sink.buffer) == 1
+        with open_results_sink(path) as sink:
+            add_results(sink, [3])
+        assert sink.n_writes == 1
+
+        read = read_results(path)
+        assert read["analysis"].tolist() == [0, 0, 1, 1, 2, 2, 3, 3]
+        assert [analysis["timestep"] for analysis in read.attrs["analyses"]] == [0, 1, 2, 3]
+        if name != "results.csv":
+            assert read["Topology applied"].tolist() == [[0, 1], [1, 0]] * 4
+
+        with open_results_sink(path, append=False) as sink:
+            add_results(sink, [4])
+        assert read_results(path).attrs["analyses"][0]["analysis"] == 0
+
+
+def test_results_writer(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    with ResultsWriter(path, batch_size=10) as writer:
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(send_results, writer.get_sink(batch_size=1), range(start, 20, 2)) for start in (0, 1)]
+            for future in futures:
+                future.result()
+
+    read = read_results(path)
+    timesteps = [analysis["timestep"] for analysis in read.attrs["analyses"]]
+    assert sorted(timesteps) == list(range(20)) and len(read) == 40
+    assert read.groupby("analysis")["Substation ID"].first().tolist() == timesteps
@@ -0,0 +1,21 @@
+import numpy as np
+
+from alphaDeesp.core.scoring import score_changes, get_worsened_lines
+
+
+def test_vectorized_scores():
+    old_rho = np.array([1.2, 0.5, 0.9])
+    new_rho = np.array([[0.8, 0.6, 0.9],   # overload solved
+                        [0.8, 0.6, 1.1],   # overload solved, another one created
+                        [1.1, 0.6, 0.9],   # 50% of the overload relieved
+                        [1.2, 0.5, 0.9]])  # nothing changed
+    no_reco = np.zeros(3)
+    loads = np.array([10., 20.])
+    scores = score_changes([0], old_rho, new_rho, no_reco, np.zeros((4, 3)), loads, np.tile(loads, (4, 1)))
+    assert list(scores) == [4, 1, 2, 0]
+    # load shedding
+    assert score_changes([0], old_rho, new_rho[0], no_reco, no_reco, loads, loads * 0.5) == 0
+    assert np.isnan(score_changes([0], new_rho[0], new_rho[0], no_reco, no_reco, loads, loads))
+    worsened = get_worsened_lines(old_rho, new_rho, no_reco, np.zeros((4, 3)))
+    assert list(np.flatnonzero(worsened[1])) == [2]
+    assert not worsened[[0, 2, 3]].any()
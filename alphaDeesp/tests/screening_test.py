@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from alphaDeesp.core.grid2op.Grid2opContingencyScreening import apply_contingency, rank_contingencies
+
+
+def test_rank_contingencies():
+    rho_after = np.array([[2.0, 1.2, 0.5],   # outage of line 0: only line 1 counts
+                          [1.1, 0.3, 1.5],
+                          [0.2, 0.9, np.nan]])  # no overload
+    contingencies = rank_contingencies([0, 1, 2], rho_after)
+    assert list(contingencies["Contingency"]) == [1, 0]
+    assert contingencies["Overloaded lines"][0] == [2, 0]
+    assert np.isclose(contingencies["Severity"][0], 0.6)
+    assert np.isclose(contingencies["Max rho"][1], 1.2)
+
+
+class FakeEnvironment:
+    def __init__(self):
+        self._no_overflow_disconnection = False
+        self.timestep = None
+        self.steps = []
+
+    def step(self, action):
+        self.steps.append((self.timestep, action, self._no_overflow_disconnection))
+        self.timestep += 1
+        return "observation at {}".format(self.timestep), 0., False, {}
+
+
+class FakeLoader:
+    def __init__(self):
+        self.env = FakeEnvironment()
+
+    def get_observation(self, chronic_scenario=None, timestep=0):
+        self.env.timestep = timestep
+        return self.env, "observation at {}".format(timestep), lambda action_dict: action_dict
+
+
+def test_apply_contingency():
+    loader = FakeLoader()
+    env, obs, action_space = apply_contingency(loader, 4, chronic_scenario=0, timestep=3)
+
+    # the outage is applied from the previous timestep, without overflow disconnections
+    assert obs == "observation at 3"
+    assert env.steps == [(2, {"set_line_status": [(4, -1)]}, True)]
+    assert not env._no_overflow_disconnection
+    with pytest.raises(ValueError):
+        apply_contingency(loader, 4, timestep=0)
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+from alphaDeesp import service
+
+CONFIG_FILE = "./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini"
+
+
+class FakeWriter:
+    """Stream writer of a client, disconnecting once it received disconnect_after messages if given"""
+
+    def __init__(self, disconnect_after=None):
+        self.disconnect_after = disconnect_after
+        self.messages = []
+
+    def write(self, data):
+        self.messages.append(json.loads(data))
+
+    async def drain(self):
+        pass
+
+    def is_closing(self):
+        return self.disconnect_after is not None and len(self.messages) >= self.disconnect_after
+
+
+def warm_worker(config_file):
+    pass
+
+
+def failing_worker(config_file):
+    raise ValueError("No grid at gridPath")
+
+
+def stub_run_analysis(request, config_file, results_queue, results_sink=None, stop_event=None):
+    try:
+        for rank in range(request.get("n_results", 1000)):
+            if stop_event.is_set():
+                break
+            results_queue.put({"result": {"rank": rank}, "action": {}})
+    finally:
+        results_queue.put(None)
+
+
+def run_requests(monkeypatch, init_worker, requests, writer):
+    monkeypatch.setattr(service, "init_worker", init_worker)
+    monkeypatch.setattr(service, "run_analysis", stub_run_analysis)
+    expert_system = service.ExpertSystemService(CONFIG_FILE, n_workers=1)
+    try:
+        for request in requests:
+            asyncio.run(asyncio.wait_for(expert_system.handle_request(request, writer), timeout=60))
+    finally:
+        expert_system.close()
+    return writer.messages
+
+
+def test_results_are_streamed(monkeypatch):
+    messages = run_requests(monkeypatch, warm_worker, [{"id": "1", "ltc": [9], "n_results": 3}], FakeWriter())
+    assert [message["type"] for message in messages] == ["action"] * 3 + ["done"]
+    assert [message["rank"] for message in messages[:3]] == [0, 1, 2]
+
+
+def test_disconnected_client_stops_analysis(monkeypatch):
+    # the stub analysis only ends early if the stop event reaches the worker
+    messages = run_requests(monkeypatch, warm_worker, [{"id": "1", "ltc": [9], "n_results": 10 ** 7}],
+                            FakeWriter(disconnect_after=2))
+    assert [message["type"] for message in messages] == ["action"] * 2
+
+
+def test_failing_worker_is_reported(monkeypatch):
+    requests = [{"id": "1", "ltc": [9]}, {"id": "2", "ltc": [9]}]
+    messages = run_requests(monkeypatch, failing_worker, requests, FakeWriter())
+    assert [(message["id"], message["type"]) for message in messages] == [("1", "error"), ("2", "error")]
+    assert "BrokenProcessPool" in messages[0]["message"]
+
+
+def test_observation_vectors_are_rejected(monkeypatch):
+    messages = run_requests(monkeypatch, warm_worker, [{"id": "1", "ltc": [9], "observation": [0.5] * 10}],
+                            FakeWriter())
+    assert [(message["type"], message["message"].split(",")[0]) for message in messages] == [
+        ("error", "observation vectors are not supported")]
+
+
+def test_profiled_request(monkeypatch, tmp_path):
+    monkeypatch.setattr(service, "init_worker", warm_worker)
+    monkeypatch.setattr(service, "run_analysis", stub_run_analysis)
+    writer = FakeWriter()
+    expert_system = service.ExpertSystemService(CONFIG_FILE, n_workers=1, output_folder=str(tmp_path))
+    try:
+        request = {"id": "1", "ltc": [9], "chronic_scenario": 0, "timestep": 2, "n_results": 3, "profile": True}
+        asyncio.run(asyncio.wait_for(expert_system.handle_request(request, writer), timeout=60))
+        asyncio.run(expert_system.handle_request(dict(request, id="2", profile="perf"), writer))
+    finally:
+        expert_system.close()
+
+    assert [message["type"] for message in writer.messages] == ["action"] * 3 + ["done", "error"]
+    profile_folder = tmp_path / "l2rpn_2019" / "linetocut_9" / "Scenario_0" / "Timestep_2"
+    assert sorted(writer.messages[3]["profile"]) == sorted(
+        str(profile_folder / name) for name in ["expert_operator.collapsed", "expert_operator_hotspots.txt"])
+    assert (profile_folder / "expert_operator_hotspots.txt").exists()
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from alphaDeesp.core.grid2op.Grid2opSimulationSession import (Grid2opSimulationSession, get_iterations, get_voltages,
+                                                               set_voltages)
+
+SOLUTION = np.array([1.0 + 0.0j, 0.98 - 0.05j, 0.97 - 0.08j])
+
+
+class FakeBackendAction:
+    def __init__(self):
+        self.actions = []
+
+    def __iadd__(self, action):
+        self.actions.append(action)
+        return self
+
+
+class FakeLightSimBackend:
+    """Backend with complex bus voltages V, SOLUTION being the one of the base case. Powerflows take 2 Newton-Raphson
+    iterations when started from it, else 5"""
+
+    def __init__(self):
+        self.V = None
+        self.starts = []
+        self.candidate = None
+        self.n_iter = None
+        self._grid = SimpleNamespace(get_solver=lambda: SimpleNamespace(get_nb_iter=lambda: self.n_iter))
+
+    def copy(self):
+        return FakeLightSimBackend()
+
+    def apply_action(self, backend_action):
+        # the base state is always applied, followed by the candidate action if any
+        self.candidate = backend_action.actions[1] if len(backend_action.actions) > 1 else None
+
+    def runpf(self, is_dc=False):
+        if self.candidate == "diverge":
+            return False
+        self.starts.append(None if self.V is None else self.V.copy())
+        self.n_iter = 2 if self.V is not None and np.allclose(self.V, SOLUTION) else 5
+        self.V = SOLUTION if self.candidate is None else SOLUTION * (1 + 0.01 * len(self.starts))
+        return True
+
+    def lines_or_info(self):
+        return [np.array([10.])] * 4
+
+    def lines_ex_info(self):
+        return [np.array([-10.])] * 4
+
+    def generators_info(self):
+        return [np.array([10.])] * 3
+
+    def loads_info(self):
+        return [np.array([10.])] * 3
+
+    def get_relative_flow(self):
+        return np.array([0.5])
+
+    def get_line_status(self):
+        return np.array([True])
+
+    def close(self):
+        pass
+
+
+def get_fake_observation():
+    backend = FakeLightSimBackend()
+    backend.V = SOLUTION.copy()  # solved state of the environment
+    obs_env = SimpleNamespace(backend=backend, _backend_action_class=FakeBackendAction,
+                              _helper_action_env=lambda action_dict: action_dict)
+    return SimpleNamespace(_obs_env=obs_env, prod_p=[10.], prod_v=[1.], load_p=[10.], load_q=[1.], topo_vect=[1, 1],
+                           n_line=1, n_gen=1, n_load=1, time_before_cooldown_line=np.zeros(1, dtype=int))
+
+
+def test_voltages_and_iterations():
+    light_sim = FakeLightSimBackend()
+    assert get_voltages(light_sim) is None and get_iterations(light_sim) is None
+    light_sim.runpf()
+    voltages = get_voltages(light_sim)
+    assert get_iterations(light_sim) == 5
+    light_sim.V = np.zeros(3, dtype=complex)
+    set_voltages(light_sim, voltages)
+    assert np.allclose(light_sim.V, voltages)
+
+    res_bus = pd.DataFrame({"vm_pu": [1.0, 0.98], "va_degree": [0.0, -2.5], "p_mw": [0.0, 10.0]})
+    pandapower = SimpleNamespace(_grid=SimpleNamespace(res_bus=res_bus, _ppc={"iterations": 4}))
+    voltages = get_voltages(pandapower)
+    assert list(voltages.columns) == ["vm_pu", "va_degree"] and get_iterations(pandapower) == 4
+    res_bus.loc[:, ["vm_pu", "va_degree"]] = [[1.0, 0.0], [1.0, 0.0]]
+    set_voltages(pandapower, voltages)
+    assert res_bus["va_degree"].tolist() == [0.0, -2.5] and pandapower._pf_init == "results"
+
+
+def test_warm_start():
+    for warm_start, iterations in [(True, 2), (False, 5)]:
+        session = Grid2opSimulationSession(get_fake_observation(), warm_start=warm_start)
+        results = [session.simulate("action {}".format(i)) for i in range(3)]
+        # each candidate powerflow starts from the base case solution with warm start
+        assert [info["iterations"] for record, reward, done, info in results] == [iterations] * 3
+        assert session.get_convergence_report()["warm start"] == warm_start
+
+
+def test_concurrent_simulations():
+    # backend copies without voltages, not to be warm started
+    session = Grid2opSimulationSession(get_fake_observation(), n_backends=4, warm_start=False)
+    actions = ["diverge" if i % 5 == 0 else "action {}".format(i) for i in range(400)]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(session.simulate, actions))
+
+    assert sum(done for record, reward, done, info in results) == 80
+    report = session.get_convergence_report()
+    assert report["simulations"] == 400 and report["diverged"] == 80
+    assert report["mean iterations"] == report["max iterations"] == 5
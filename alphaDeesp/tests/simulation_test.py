@@ -0,0 +1,229 @@
+"""Tests of the simulator independent parts of the Simulation interface"""
+
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+
+from alphaDeesp import expert_operator
+
+from alphaDeesp.core.records import SimulationRecord
+from alphaDeesp.core.simulation import Simulation
+
+
+def make_score_row(node, flow_before, delta_flow, simulated_score=2, efficacity=1.):
+    return pd.Series({"Flows before": flow_before, "Delta flows": delta_flow, "Substation ID": node,
+                      "Topology simulated score": simulated_score, "Efficacity": efficacity})
+
+
+def make_sim(n_pairs, n_candidates_per_node=2):
+    params = {"totalnumberofsimulatedpairs": n_pairs, "numberofcandidatespernodeforpairs": n_candidates_per_node}
+    return SimpleNamespace(param_options=params, get_estimated_relief=Simulation.get_estimated_relief)
+
+
+def test_get_estimated_relief():
+    assert Simulation.get_estimated_relief(100., 30.) == 30.
+    # flows reversing through 0
+    assert Simulation.get_estimated_relief(-100., -150.) == 50.
+    # several overloaded lines
+    assert Simulation.get_estimated_relief([100., -80.], [10., -20.]) == 30.
+
+
+def test_get_pairs_to_simulate():
+    single_results = [(make_score_row(4, 100., 30.), "a"),
+                      (make_score_row(4, 100., 20.), "b"),
+                      (make_score_row(5, 100., 25.), "c"),
+                      (make_score_row(6, 100., -10.), "d"),  # worsens the overload
+                      (make_score_row(7, 100., 40., efficacity=float("nan")), "e")]  # game over
+    sim = make_sim(n_pairs=10)
+
+    pairs = Simulation.get_pairs_to_simulate(sim, single_results)
+    # pairs are made of distinct substations only, best estimated relief first
+    assert [(relief, first[1], second[1]) for relief, first, second in pairs] == [(55., "a", "c"), (45., "b", "c")]
+
+    assert len(Simulation.get_pairs_to_simulate(make_sim(n_pairs=1), single_results)) == 1
+    assert Simulation.get_pairs_to_simulate(make_sim(n_pairs=0), single_results) == []
+
+
+def test_get_pairs_to_simulate_not_needed():
+    single_results = [(make_score_row(4, 100., 30., simulated_score=4), "a"),
+                      (make_score_row(5, 100., 25.), "c")]
+    assert Simulation.get_pairs_to_simulate(make_sim(n_pairs=10), single_results) == []
+
+
+def test_prescreen_candidates():
+    estimations = {1: (10., 0), 2: (30., 0), 3: (50., 2), 4: (-5., 0), 5: None}
+    candidates = [(i, node, [0, 1]) for i, node in enumerate([1, 2, 3, 4, 5])]
+
+    def make_prescreening_sim(mode):
+        return SimpleNamespace(param_options={"dcprescreening": mode},
+                               estimate_candidate_relief=lambda node, topology: estimations[node])
+
+    assert Simulation.prescreen_candidates(make_prescreening_sim(0), candidates) == candidates
+    # best relief first, new overloads last, not estimated ones kept at the end
+    reordered = Simulation.prescreen_candidates(make_prescreening_sim(1), candidates)
+    assert [node for i, node, topology in reordered] == [2, 1, 4, 3, 5]
+    screened = Simulation.prescreen_candidates(make_prescreening_sim(2), candidates)
+    assert [node for i, node, topology in screened] == [2, 1, 3, 5]
+
+
+class StubSimulation(Simulation):
+    """Simulation without grid, whose grid data and graph methods are not used by the network changes"""
+
+    def cut_lines_and_recomputes_flows(self, ids: list):
+        raise NotImplementedError
+
+    def isAntenna(self):
+        raise NotImplementedError
+
+    def isDoubleLine(self):
+        raise NotImplementedError
+
+    def getLinesAtSubAndBusbar(self):
+        raise NotImplementedError
+
+    def get_layout(self):
+        raise NotImplementedError
+
+    def get_substation_in_cooldown(self):
+        raise NotImplementedError
+
+    def get_substation_elements(self):
+        raise NotImplementedError
+
+    def get_substation_to_node_mapping(self):
+        raise NotImplementedError
+
+    def get_internal_to_external_mapping(self):
+        raise NotImplementedError
+
+    def get_dataframe(self):
+        raise NotImplementedError
+
+    def build_graph_from_data_frame(self, lines_to_cut: list):
+        raise NotImplementedError
+
+    def build_powerflow_graph_beforecut(self):
+        raise NotImplementedError
+
+    def get_reference_topovec_sub(self):
+        raise NotImplementedError
+
+    def get_overload_disconnection_topovec_subor(self):
+        raise NotImplementedError
+
+    def build_powerflow_graph_aftercut(self):
+        raise NotImplementedError
+
+
+class FakeSimulation(StubSimulation):
+    """Simulation where the action on node n relieves the overloaded line by n MW"""
+    def __init__(self):
+        super().__init__()
+        self.param_options = {"totalnumberofsimulatedpairs": 0}
+        self.args_number_of_simulated_topos = 10
+        self.args_inner_number_of_simulated_topos_per_node = 10
+        self.simulated_batches = []
+
+    def get_candidate_action(self, node, topology):
+        return node, list(topology)
+
+    def get_do_nothing_action(self):
+        return 0
+
+    def simulate(self, action):
+        obs = SimulationRecord([0.9], [100. - action], [action - 100.], [100.], [100.], [True], [0])
+        return obs, None, False, {}
+
+    def simulate_batch(self, actions):
+        self.simulated_batches.append(list(actions))
+        return super().simulate_batch(actions)
+
+    def score_simulations(self, results, changes):
+        return [[0, 100., result["p_or"][0], 100. - result["p_or"][0], [], 0., 0., topology, applied_topology, node,
+                 1, score_topo, 2, 1.] for result, (node, topology, applied_topology, score_topo) in zip(results, changes)]
+
+
+def test_compute_new_network_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # end result dataframe is saved in the working directory
+    ranked_combinations = [pd.DataFrame({"node": [3, 5], "topology": [[0, 1], [1, 1]]})]
+    sim = FakeSimulation()
+    end_result_dataframe, actions = sim.compute_new_network_changes(ranked_combinations)
+    # all candidates are simulated in a single batch
+    assert sim.simulated_batches == [[3, 5]]
+    assert actions == [3, 5]
+    assert list(end_result_dataframe["Delta flows"]) == [3., 5.]
+
+    streamed = list(FakeSimulation().iter_new_network_changes(ranked_combinations))
+    assert [action for score_row, action in streamed] == [3, 5]
+
+    assert FakeSimulation().compute_new_network_changes([])[1] == [0]
+
+
+RANKED_COMBINATIONS = [pd.DataFrame({"node": [3, 5, 7, 9], "topology": [[0, 1], [1, 1], [0, 1], [1, 0]]})]
+
+
+def test_stop_event_stops_simulations():
+    sim = FakeSimulation()
+    stop_event = threading.Event()
+    for score_row, action in sim.iter_new_network_changes(RANKED_COMBINATIONS, stop_event=stop_event):
+        stop_event.set()
+    assert sim.simulated_batches == [[3]]
+
+
+def test_closed_generator_stops_simulations():
+    sim = FakeSimulation()
+    generator = sim.iter_new_network_changes(RANKED_COMBINATIONS, batch_size=2)
+    assert next(generator)[1] == 3
+    generator.close()
+    assert sim.simulated_batches == [[3, 5]]
+
+
+def test_leaving_async_iteration_stops_simulations():
+    async def first_action(sim):
+        async for score_row, action in sim.aiter_new_network_changes(RANKED_COMBINATIONS):
+            return action
+
+    sim = FakeSimulation()
+    assert asyncio.run(first_action(sim)) == 3
+    assert sim.simulated_batches == [[3]]
+
+
+def test_expert_operator_stream(monkeypatch):
+    monkeypatch.setattr(expert_operator, "compute_ranked_combinations",
+                        lambda sim, debug=False: RANKED_COMBINATIONS)
+    sim = FakeSimulation()
+    stream = expert_operator.expert_operator_stream(sim, batch_size=3)
+    assert [action for score_row, action in stream] == [3, 5, 7, 9]
+    assert sim.simulated_batches == [[3, 5, 7], [9]]
+
+    sim = FakeSimulation()
+    stop_event = threading.Event()
+    for score_row, action in expert_operator.expert_operator_stream(sim, stop_event=stop_event, batch_size=2):
+        stop_event.set()
+    assert sim.simulated_batches == [[3, 5]]
+
+    sim = FakeSimulation()
+    stream = expert_operator.expert_operator_stream(sim)
+    next(stream)
+    stream.close()
+    assert sim.simulated_batches == [[3]]
+
+
+def test_dc_prescreening_pool(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ranked_combinations = [pd.DataFrame({"node": [node], "topology": [[0, 1]]}) for node in [1, 2, 3, 4]]
+    sims = []
+    for mode in [0, 1]:
+        sim = FakeSimulation()
+        sim.param_options["dcprescreening"] = mode
+        sim.args_number_of_simulated_topos = 2
+        # the relief of the action on node n is estimated to n MW
+        sim.estimate_candidate_relief = lambda node, topology: (float(node), 0)
+        sim.compute_new_network_changes(ranked_combinations)
+        sims.append(sim)
+
+    assert sims[0].simulated_batches == [[1, 2]]
+    # candidates ranked below the budget are prescreened too
+    assert sims[1].simulated_batches == [[4, 3]]
@@ -0,0 +1,45 @@
+import configparser
+
+import networkx as nx
+import numpy as np
+
+from alphaDeesp.core.alphadeesp import AlphaDeesp
+from alphaDeesp.core.dc.DCSimulation import DCSimulation
+from alphaDeesp.core.dc.SyntheticGrid import generate_synthetic_grid, generate_synthetic_observation, \
+    build_alphadeesp_inputs
+
+
+def test_generate_synthetic_grid():
+    grid = generate_synthetic_grid(200, lines_per_sub=1.4, loads_per_sub=0.5, gens_per_sub=0.2, seed=1)
+    assert (grid.n_sub, grid.n_line, grid.n_load, grid.n_gen) == (200, 280, 100, 40)
+    graph = nx.MultiGraph()
+    graph.add_nodes_from(range(grid.n_sub))
+    graph.add_edges_from(zip(grid.line_or_to_subid, grid.line_ex_to_subid))
+    assert nx.is_connected(graph)
+    assert np.isclose(np.sum(grid.base_prod_p), np.sum(grid.base_load_p))
+    assert len(grid.grid_layout) == 200
+
+    same_grid = generate_synthetic_grid(200, lines_per_sub=1.4, loads_per_sub=0.5, gens_per_sub=0.2, seed=1)
+    assert np.array_equal(same_grid.line_or_to_subid, grid.line_or_to_subid)
+    assert np.array_equal(same_grid.susceptances, grid.susceptances)
+
+
+def test_generate_synthetic_observation():
+    obs, ltc = generate_synthetic_observation(100, n_overloads=2, seed=0)
+    assert not obs.done and len(ltc) == 2
+    assert np.all(obs.rho[ltc] > 1.) and np.all(obs.rho[ltc] < 1.31)
+    assert np.sum(obs.rho > 1.) == 2
+    assert np.all(obs.rho[obs.rho <= 1.] <= 0.9 + 1e-9)
+    # overloaded lines are not antennas
+    assert not any(obs.simulate([("set_line_status", l, -1)])[2] for l in ltc)
+
+
+def test_synthetic_grid_feeds_alphadeesp():
+    config = configparser.ConfigParser()
+    config.read("./alphaDeesp/tests/resources_for_tests_grid2op/config_for_tests.ini")
+    obs, ltc = generate_synthetic_observation(100, seed=0)
+    sim = DCSimulation(obs, param_options=config["DEFAULT"], ltc=ltc)
+
+    alphadeesp = AlphaDeesp(**build_alphadeesp_inputs(sim))
+    ranked_combinations = alphadeesp.get_ranked_combinations()
+    assert len(ranked_combinations) > 0
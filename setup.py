@@ -71,6 +71,9 @@ pkgs = {
         "optional": [
             "pypower>=5.1.4"
             "pypownet>=2.2.0"
+        ],
+        "plot": [
+            "pygraphviz>=1.5"
         ]
     }
 }